@@ -0,0 +1,83 @@
+"""Aho-Corasick multi-pattern matcher.
+
+All patterns are compiled into one automaton so that every occurrence of
+every pattern is found in a single pass over the input. Patterns and
+input may be strings or any sequences of hashable symbols.
+"""
+from collections import deque
+
+
+class AhoCorasick:
+    """Automaton over a fixed list of patterns, reusable across inputs"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.lengths = [len(pattern) for pattern in self.patterns]
+
+        # Trie: goto[state] maps a symbol to the next state; state 0 is the root
+        self.goto = [{}]
+        self.output = [()]
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue  # Empty patterns would match everywhere
+            state = 0
+            for symbol in pattern:
+                next_state = self.goto[state].get(symbol)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][symbol] = next_state
+                    self.goto.append({})
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (index,)
+
+        # Failure links in breadth-first order; dict_link points at the
+        # nearest proper suffix state that emits output
+        self.fail = [0] * len(self.goto)
+        self.dict_link = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for symbol, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and symbol not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(symbol, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.dict_link[next_state] = target if self.output[target] else self.dict_link[target]
+                queue.append(next_state)
+
+    def iter_matches(self, sequence):
+        """Yield (start, pattern_index) for every occurrence, in order of end position"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        dict_link = self.dict_link
+        lengths = self.lengths
+
+        state = 0
+        for position, symbol in enumerate(sequence):
+            while state and symbol not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(symbol, 0)
+
+            emit = state
+            while emit:
+                end = position + 1
+                for index in output[emit]:
+                    yield end - lengths[index], index
+                emit = dict_link[emit]
+
+    def find_all(self, sequence):
+        """Map pattern index to the start of each non-overlapping occurrence.
+
+        Occurrences of the same pattern are taken greedily from the left,
+        the same result repeated str.find calls would give.
+        """
+        found = {}
+        next_free = {}
+        for start, index in self.iter_matches(sequence):
+            if start >= next_free.get(index, 0):
+                found.setdefault(index, []).append(start)
+                next_free[index] = start + self.lengths[index]
+        return found
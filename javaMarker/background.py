@@ -0,0 +1,152 @@
+"""Run long GUI operations off the Tk main loop.
+
+A task's work function runs in a worker thread and must not touch any
+widget. It reports progress through task.report(), which is also where
+a cancelled task stops. The runner polls the worker with root.after and,
+once the work is done, hands the result to on_done on the Tk thread, so
+the GUI only ever sees a finished result, published in one step.
+
+A task that reads GUI state passes a prepare callback. It runs on the Tk
+thread when the task actually starts, not when it is queued, and its
+return value becomes task.state for the work function. A task queued
+behind a load therefore sees the loaded files, not the ones on screen
+when it was clicked.
+"""
+import threading
+
+# How often the Tk thread checks on the running task
+POLL_MS = 50
+
+
+class TaskCancelled(Exception):
+    """Raised by Task.report once the task has been cancelled"""
+
+
+class Task:
+    """One unit of background work and its progress"""
+
+    def __init__(self, name, work, on_done=None, on_error=None, label=None, prepare=None):
+        self.name = name
+        self.label = label or name
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.prepare = prepare
+        self.state = None  # What prepare() returned
+        self.progress = None  # Latest (done, total, message) from the worker
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def report(self, done, total=None, message=None):
+        """Record progress from the worker; raises TaskCancelled once cancelled"""
+        if self._cancelled.is_set():
+            raise TaskCancelled()
+        self.progress = (done, total, message)
+
+    def fail(self, error):
+        """Finish the task with an error without running its work"""
+        self.error = error
+        self._finished.set()
+
+    def run(self):
+        try:
+            self.result = self.work(self)
+        except TaskCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+
+
+class TaskRunner:
+    """Runs one Task at a time for a Tk application.
+
+    Starting a task while another runs queues it; a running or queued task
+    of the same name is superseded, so at most one of each name waits.
+    on_progress(task) is called on the Tk thread while a task runs, and
+    with None once the runner is idle.
+    """
+
+    def __init__(self, root, on_progress=None):
+        self.root = root
+        self.on_progress = on_progress
+        self.current = None
+        self.pending = {}  # name -> Task, in the order they were queued
+
+    @property
+    def busy(self):
+        return self.current is not None
+
+    def start(self, name, work, on_done=None, on_error=None, label=None, prepare=None):
+        """Run work(task) in the background and return the Task"""
+        task = Task(name, work, on_done, on_error, label, prepare)
+        if self.current is None:
+            self._launch(task)
+            return task
+        if self.current.name == name:
+            self.current.cancel()
+        self.pending.pop(name, None)
+        self.pending[name] = task
+        return task
+
+    @property
+    def queued(self):
+        """Tasks waiting behind the running one, in launch order"""
+        return list(self.pending.values())
+
+    def cancel(self):
+        """Cancel the running task and drop the queued ones"""
+        self.pending.clear()
+        if self.current is not None:
+            self.current.cancel()
+
+    def _launch(self, task):
+        self.current = task
+        if task.prepare is not None:
+            try:
+                task.state = task.prepare()
+            except Exception as e:
+                task.fail(e)
+        if not task.finished:
+            threading.Thread(target=task.run, name=f"javaMarker-{task.name}", daemon=True).start()
+        if self.on_progress is not None:
+            self.on_progress(task)  # At once, so the GUI shows it is busy before the first poll
+        self.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        task = self.current
+        if not task.finished:
+            if self.on_progress is not None:
+                self.on_progress(task)
+            self.root.after(POLL_MS, self._poll)
+            return
+
+        self.current = None
+        try:
+            # Cancelled tasks are discarded even if their work completed
+            if task.cancelled:
+                pass
+            elif task.error is not None:
+                if task.on_error is not None:
+                    task.on_error(task.error)
+            elif task.on_done is not None:
+                task.on_done(task.result)
+        finally:
+            if self.pending:
+                self._launch(self.pending.pop(next(iter(self.pending))))
+            elif self.on_progress is not None:
+                self.on_progress(None)
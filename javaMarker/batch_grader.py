@@ -0,0 +1,340 @@
+"""Command-line batch grading of a whole cohort against one marking scheme.
+
+Usage:
+    python javaMarker.py SCHEME SUBMISSIONS_DIR [-o results.csv] [-j WORKERS]
+                         [--db results.sqlite3] [--similarity pairs.csv]
+                         [--timings timings.json]
+
+The scheme is a Java file with mark comments or a structured JSON/YAML
+scheme (see structured_scheme.py). A submission is a Java file, a .zip
+archive or a project directory (see submission_reader.py). Every
+submission is graded independently, so the work is spread over a process
+pool and the results are written to a single combined file: CSV, JSON
+when the output name ends in .json, or an Excel cohort workbook (summary
+sheet plus one sheet with every student's rows) when it ends in .xlsx.
+With --similarity the cohort is also checked for suspiciously similar
+pairs (see similarity.py).
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from grading_engine import DEFAULT_FUZZY_THRESHOLD, FUZZY_THRESHOLD, NormalizedSubmission
+from instrumentation import READ_FILE, Timings, stage
+from result_export import write_cohort_workbook
+from result_cache import grade_rows_cached
+from results_store import BATCH_SIZE, ResultsStore
+from scheme_cache import load_compiled_scheme
+from similarity import DEFAULT_THRESHOLD, find_similar_pairs, fingerprint, write_similarity_report
+from submission_reader import is_submission, read_submission, submission_name, submission_names
+
+CSV_COLUMNS = ['Student', 'File', 'Criteria', 'Allocated Marks', 'Awarded Marks', 'Comments', 'Status']
+
+# Compiled scheme and options handed to each worker process by _init_worker
+_worker_scheme = None
+_worker_fuzzy_threshold = None
+_worker_timings = False
+_worker_fingerprints = False
+
+
+def _init_worker(compiled_scheme, fuzzy_threshold, collect_timings=False, collect_fingerprints=False):
+    """Keep the compiled marking scheme for every file this worker grades"""
+    global _worker_scheme, _worker_fuzzy_threshold, _worker_timings, _worker_fingerprints
+    _worker_scheme = compiled_scheme
+    _worker_fuzzy_threshold = fuzzy_threshold
+    _worker_timings = collect_timings
+    _worker_fingerprints = collect_fingerprints
+
+
+def grade_file(path, compiled_scheme=None, fuzzy_threshold=None, collect_timings=False,
+               collect_fingerprints=False, student=None):
+    """Grade one submission file and return a plain, picklable summary.
+
+    `student` defaults to the name derived from the path. With
+    collect_timings the summary's 'timings' holds the per-stage report for
+    this file, and with collect_fingerprints its 'fingerprints' are the
+    similarity fingerprints of the submission.
+    """
+    if compiled_scheme is None:
+        compiled_scheme = _worker_scheme
+        fuzzy_threshold = _worker_fuzzy_threshold
+        collect_timings = _worker_timings
+        collect_fingerprints = _worker_fingerprints
+    student = student or submission_name(path)
+    summary = {'student': student, 'file': path, 'error': None}
+    timings = Timings(student) if collect_timings else None
+    with timings.active() if timings is not None else nullcontext():
+        try:
+            with stage(READ_FILE):
+                student_text = read_submission(path)
+            submission = NormalizedSubmission(student_text)
+            # Duplicates and resubmissions reuse the earlier result
+            result = grade_rows_cached(compiled_scheme.new_rows(), submission, matcher=compiled_scheme.matcher,
+                                       fuzzy_threshold=fuzzy_threshold)
+            if collect_fingerprints:
+                # Taken here, where the submission is already tokenized
+                summary['fingerprints'] = fingerprint(submission)
+        except Exception as e:
+            summary.update(total_marks=0.0, achieved_marks=0.0, rows=[], error=str(e))
+            result = None
+    if timings is not None:
+        summary['timings'] = timings.finish().report()
+    if result is None:
+        return summary
+
+    summary.update(
+        total_marks=result.total_marks,
+        achieved_marks=result.achieved_marks,
+        rows=[{
+            'criteria': row.criteria,
+            'allocated': row.allocated,
+            'awarded': row.awarded,
+            'comments': row.comments,
+            'status': row.status,
+            'score': row.score,
+            'spans': row.spans,
+            'files': row.files
+        } for row in result.rows]
+    )
+    return summary
+
+
+def _grade_named(path, student):
+    # Pool entry point: the scheme and options come from _init_worker
+    return grade_file(path, student=student)
+
+
+def find_submissions(directory, pattern="*"):
+    """Return the sorted submissions in a directory: Java files, zip archives and project directories"""
+    return sorted(
+        path for path in glob.glob(os.path.join(directory, pattern))
+        if is_submission(path)
+    )
+
+
+def iter_cohort(scheme_text, paths, workers=None, chunksize=None,
+                fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD, collect_timings=False, collect_fingerprints=False):
+    """Yield a summary for every path, in input order, as soon as it is graded.
+
+    Students are named after their submissions, made unique when two would
+    share a name.
+    """
+    compiled_scheme = load_compiled_scheme(scheme_text)
+    students = submission_names(paths)
+    if workers == 1 or len(paths) <= 1:
+        for path, student in zip(paths, students):
+            yield grade_file(path, compiled_scheme, fuzzy_threshold, collect_timings, collect_fingerprints,
+                             student)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # A few chunks per worker keeps the pool busy without per-file IPC overhead
+        chunksize = max(1, len(paths) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(compiled_scheme, fuzzy_threshold, collect_timings,
+                                       collect_fingerprints)) as executor:
+        yield from executor.map(_grade_named, paths, students, chunksize=chunksize)
+
+
+def grade_cohort(scheme_text, paths, workers=None, chunksize=None,
+                 fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD, collect_timings=False, collect_fingerprints=False):
+    """Grade every path against the scheme, in input order"""
+    return list(iter_cohort(scheme_text, paths, workers, chunksize, fuzzy_threshold, collect_timings,
+                            collect_fingerprints))
+
+
+def write_results(output_path, summaries, criteria=None, detail_sheets=True):
+    """Write all graded students to one combined CSV, JSON or Excel file.
+
+    Summaries may be any iterable; CSV and Excel output is written as they
+    arrive. `criteria` (the scheme's Criterion list) is needed for Excel.
+    """
+    if output_path.lower().endswith('.json'):
+        with open(output_path, 'w') as f:
+            json.dump(list(summaries), f, indent=2)
+        return
+    if output_path.lower().endswith('.xlsx'):
+        write_cohort_workbook(output_path, criteria, summaries, detail_sheets)
+        return
+
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for summary in summaries:
+            if summary['error']:
+                writer.writerow([summary['student'], summary['file'], 'ERROR', '', '', summary['error'], 'error'])
+                continue
+            for row in summary['rows']:
+                writer.writerow([summary['student'], summary['file'], row['criteria'], row['allocated'],
+                                 row['awarded'], row['comments'], row['status']])
+            writer.writerow([summary['student'], summary['file'], 'TOTAL',
+                             summary['total_marks'], summary['achieved_marks'], '', ''])
+
+
+def check_writable(path):
+    """Raise OSError if a file can't be written at path, leaving any existing file as it is"""
+    existed = os.path.exists(path)
+    with open(path, 'a'):
+        pass
+    if not existed:
+        os.remove(path)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="javaMarker",
+        description="Grade a directory of Java submissions against a marking scheme."
+    )
+    parser.add_argument("scheme", help="marking scheme: Java file, or structured .json/.yaml scheme")
+    parser.add_argument("submissions", help="directory containing student submissions")
+    parser.add_argument("-o", "--output", default="cohort_grading_results.csv",
+                        help="combined result file (.csv, .json or .xlsx)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("--pattern", default="*",
+                        help="glob for submissions; Java files, .zip archives and directories "
+                             "are graded (default: *)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="submissions handed to a worker at a time")
+    parser.add_argument("--fuzzy-threshold", type=float, default=DEFAULT_FUZZY_THRESHOLD,
+                        help="give near-misses scoring at least this similarity partial credit "
+                             "(default: off, only exact matches earn marks)")
+    parser.add_argument("--partial-credit", dest="fuzzy_threshold", action="store_const",
+                        const=FUZZY_THRESHOLD,
+                        help=f"give near-misses partial credit, same as --fuzzy-threshold {FUZZY_THRESHOLD}")
+    parser.add_argument("--no-detail-sheets", dest="detail_sheets", action="store_false",
+                        help="with .xlsx output, write only the cohort summary sheet, not the students' rows")
+    parser.add_argument("--db", metavar="PATH",
+                        help="also save every student's results to this SQLite results database")
+    parser.add_argument("--similarity", metavar="PATH",
+                        help="write ranked pairs of similar submissions to this CSV or JSON file")
+    parser.add_argument("--similarity-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"minimum fingerprint overlap reported (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--timings", metavar="PATH",
+                        help="write per-stage timings for the run and every file to this JSON file")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if not os.path.isdir(args.submissions):
+        print(f"Error: {args.submissions} is not a directory", file=sys.stderr)
+        return 2
+    if args.workers is not None and args.workers < 1:
+        print("Error: --workers must be at least 1", file=sys.stderr)
+        return 2
+    if args.fuzzy_threshold is not None and not 0.0 <= args.fuzzy_threshold <= 1.0:
+        print("Error: --fuzzy-threshold must be between 0 and 1", file=sys.stderr)
+        return 2
+    if not 0.0 < args.similarity_threshold <= 1.0:
+        print("Error: --similarity-threshold must be above 0 and at most 1", file=sys.stderr)
+        return 2
+
+    try:
+        with open(args.scheme, 'r') as f:
+            scheme_text = f.read()
+    except OSError as e:
+        print(f"Error: failed to read marking scheme: {e}", file=sys.stderr)
+        return 2
+    try:
+        compiled_scheme = load_compiled_scheme(scheme_text)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    paths = find_submissions(args.submissions, args.pattern)
+    if not paths:
+        print(f"Error: no submissions matching {args.pattern} in {args.submissions}", file=sys.stderr)
+        return 1
+
+    # A missing directory or a file locked by Excel is reported before the cohort is graded
+    for path in (args.output, args.similarity):
+        if path:
+            try:
+                check_writable(path)
+            except OSError as e:
+                print(f"Error: cannot write {path}: {e}", file=sys.stderr)
+                return 2
+
+    store = None
+    if args.db:
+        try:
+            store = ResultsStore(args.db)
+            scheme_id = store.scheme_id(scheme_text, os.path.basename(args.scheme))
+        except sqlite3.Error as e:
+            print(f"Error: failed to open results database: {e}", file=sys.stderr)
+            return 2
+
+    # Only the failures are kept; graded students go straight to the output
+    failures = []
+    total_timings = Timings("batch")
+    file_timings = []
+    unsaved = []  # Students waiting for the next database transaction
+    fingerprints = {}
+
+    def track(summaries):
+        for summary in summaries:
+            if summary['error']:
+                failures.append((summary['student'], summary['error']))
+            report = summary.pop('timings', None)
+            if report is not None:
+                total_timings.merge(report)
+                file_timings.append(report)
+            student_fingerprints = summary.pop('fingerprints', None)
+            if student_fingerprints is not None:
+                fingerprints[summary['student']] = student_fingerprints
+            if store is not None:
+                unsaved.append(summary)
+                if len(unsaved) >= BATCH_SIZE:
+                    store.save(scheme_id, unsaved)
+                    unsaved.clear()
+            yield summary
+
+    summaries = iter_cohort(scheme_text, paths, args.workers, args.chunksize, args.fuzzy_threshold,
+                            collect_timings=bool(args.timings), collect_fingerprints=bool(args.similarity))
+    try:
+        write_results(args.output, track(summaries), compiled_scheme.criteria, args.detail_sheets)
+    except OSError as e:
+        print(f"Error: failed to write results: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if store is not None:
+            store.save(scheme_id, unsaved)
+            store.close()
+
+    if args.similarity:
+        # Code copied from the scheme is shared by everyone and proves nothing
+        base = fingerprint(NormalizedSubmission(scheme_text)) if compiled_scheme.format == 'java' else ()
+        pairs = find_similar_pairs(fingerprints, args.similarity_threshold, base)
+        try:
+            write_similarity_report(args.similarity, pairs)
+        except OSError as e:
+            print(f"Error: failed to write similarity report: {e}", file=sys.stderr)
+            return 2
+
+    if args.timings:
+        try:
+            with open(args.timings, 'w') as f:
+                json.dump({'total': total_timings.finish().report(), 'files': file_timings}, f, indent=2)
+        except OSError as e:
+            print(f"Error: failed to write timings: {e}", file=sys.stderr)
+
+    print(f"Graded {len(paths) - len(failures)} of {len(paths)} submissions -> {args.output}")
+    if args.similarity:
+        print(f"{len(pairs)} similar pairs -> {args.similarity}")
+    for student, error in failures:
+        print(f"  {student}: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
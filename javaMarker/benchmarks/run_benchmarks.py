@@ -0,0 +1,195 @@
+"""Headless benchmark suite for the grading pipeline.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 100,300,1000] [-o results.json]
+                                        [--compare baseline.json]
+
+For each size in the sweep a synthetic scheme with that many criteria and
+a submission of --lines-per-criterion lines per criterion are generated
+(see synthetic.py), and every pipeline stage is timed on its own. Results
+are written as JSON so runs from different versions can be compared with
+--compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from grading_engine import FUZZY_THRESHOLD, CompiledScheme, NormalizedSubmission, grade_rows  # noqa: E402
+from highlighter import group_by_tag, span_indices  # noqa: E402
+from incremental import IncrementalGrader  # noqa: E402
+from results_model import ResultsModel  # noqa: E402
+from synthetic import make_case  # noqa: E402
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def time_stage(run, setup=None, repeat=3):
+    """Time run(state) `repeat` times, calling the untimed setup() before each"""
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def edit_middle_line(text):
+    """Return the text with one statement in the middle changed"""
+    lines = text.split('\n')
+    middle = len(lines) // 2
+    lines[middle] = lines[middle].replace(';', ' + 1;', 1) if ';' in lines[middle] else lines[middle] + " x = 1;"
+    return '\n'.join(lines)
+
+
+def benchmark_size(criteria_count, line_count, match_rate, near_miss_rate, seed, repeat):
+    """Return {stage: [seconds, ...]} for one generated scheme/submission pair"""
+    scheme_text, submission_text = make_case(criteria_count, line_count, match_rate, near_miss_rate, seed)
+    compiled = CompiledScheme(scheme_text)
+    stages = {}
+
+    stages['compile_scheme'] = time_stage(lambda _: CompiledScheme(scheme_text), repeat=repeat)
+    stages['tokenize_submission'] = time_stage(lambda _: NormalizedSubmission(submission_text), repeat=repeat)
+
+    def fresh():
+        return compiled.new_rows(), NormalizedSubmission(submission_text)
+
+    stages['match_exact'] = time_stage(
+        lambda state: grade_rows(state[0], state[1], matcher=compiled.matcher),
+        fresh, repeat)
+    stages['match_fuzzy'] = time_stage(
+        lambda state: grade_rows(state[0], state[1], matcher=compiled.matcher,
+                                 fuzzy_threshold=FUZZY_THRESHOLD),
+        fresh, repeat)
+
+    # One full grading run is shared by the stages below; regrades work on forks of it
+    model = ResultsModel(compiled.new_rows())
+    grader = IncrementalGrader(FUZZY_THRESHOLD)
+    grader.regrade(model.snapshot(), NormalizedSubmission(submission_text), scheme_text, compiled.matcher)
+    edited = NormalizedSubmission(edit_middle_line(submission_text))
+
+    stages['regrade_after_edit'] = time_stage(
+        lambda fork: fork.regrade(model.snapshot(), edited, scheme_text, compiled.matcher),
+        grader.fork, repeat)
+
+    def highlight(_):
+        grouped = group_by_tag((status, span) for status, span in grader.highlights())
+        for spans in grouped.values():
+            span_indices(spans)
+
+    stages['highlight_spans'] = time_stage(highlight, repeat=repeat)
+
+    def results_rows():
+        return [row.copy() for row, _ in grader.entries.values()]
+
+    try:
+        from result_export import write_results_excel
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        print("  xlsxwriter not installed; skipping excel_export", file=sys.stderr)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.xlsx")
+            stages['excel_export'] = time_stage(lambda rows: write_results_excel(path, rows), results_rows, repeat)
+
+    return stages
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PACKAGE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print each stage's median time against the baseline's"""
+    previous = {(entry['criteria'], entry['stage']): entry['median_s'] for entry in baseline['results']}
+    print(f"{'criteria':>9}  {'stage':<20} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for entry in results['results']:
+        before = previous.get((entry['criteria'], entry['stage']))
+        if before is None:
+            continue
+        ratio = entry['median_s'] / before if before else float('inf')
+        print(f"{entry['criteria']:>9}  {entry['stage']:<20} {before * 1000:>8.1f}ms "
+              f"{entry['median_s'] * 1000:>8.1f}ms {ratio:>6.2f}x")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Time each grading stage over a sweep of synthetic inputs.")
+    parser.add_argument("--sizes", default="100,300,1000",
+                        help="comma-separated criteria counts (default: 100,300,1000)")
+    parser.add_argument("--lines-per-criterion", type=float, default=4.0,
+                        help="submission lines per criterion (default: 4)")
+    parser.add_argument("--match-rate", type=float, default=0.7,
+                        help="fraction of criteria present verbatim (default: 0.7)")
+    parser.add_argument("--near-miss-rate", type=float, default=0.1,
+                        help="fraction of criteria present with a small mistake (default: 0.1)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="generator seed (default: 0)")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'sizes': sizes,
+            'lines_per_criterion': args.lines_per_criterion,
+            'match_rate': args.match_rate,
+            'near_miss_rate': args.near_miss_rate,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': [],
+    }
+
+    for criteria_count in sizes:
+        line_count = int(criteria_count * args.lines_per_criterion)
+        print(f"{criteria_count} criteria, {line_count} lines", file=sys.stderr)
+        stages = benchmark_size(criteria_count, line_count, args.match_rate, args.near_miss_rate,
+                                args.seed, args.repeat)
+        for stage, timings in stages.items():
+            results['results'].append({
+                'criteria': criteria_count,
+                'lines': line_count,
+                'stage': stage,
+                'best_s': min(timings),
+                'median_s': statistics.median(timings),
+                'runs_s': timings,
+            })
+            print(f"  {stage:<20} {statistics.median(timings) * 1000:10.2f} ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
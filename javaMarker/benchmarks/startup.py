@@ -0,0 +1,93 @@
+"""Startup-time benchmark for the grader GUI module.
+
+Usage:
+    python benchmarks/startup.py [-n RUNS] [--max-ms MS]
+
+Imports javaMarker in fresh interpreters and reports how long that takes,
+which is what a marker waits for before the window can appear. It fails
+(exit code 1) if any heavy dependency is imported at startup, or if the
+median import time is over --max-ms, so new top-level imports of export
+libraries are caught before they reach the bundled executable.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once an export is requested
+HEAVY_MODULES = ('pandas', 'numpy', 'xlsxwriter', 'openpyxl')
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import javaMarker
+elapsed = time.perf_counter() - start
+heavy = [name for name in %r if name in sys.modules]
+print(elapsed, ','.join(heavy))
+""" % (HEAVY_MODULES,)
+
+
+def time_import():
+    """Import javaMarker in a fresh interpreter; return (seconds, heavy modules loaded)"""
+    output = subprocess.run(
+        [sys.executable, '-c', _PROBE], cwd=PACKAGE_DIR,
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), output[1].split(',') if len(output) > 1 else []
+
+
+def slowest_imports(limit=10):
+    """Return the modules with the largest cumulative import time, in microseconds"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import javaMarker'], cwd=PACKAGE_DIR,
+        capture_output=True, text=True, check=True
+    ).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:limit]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Measure how long the grader takes to import.")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="fresh interpreters to time (default: 10)")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail if the median import time exceeds this many milliseconds")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    times = []
+    heavy = set()
+    for _ in range(args.runs):
+        elapsed, loaded = time_import()
+        times.append(elapsed * 1000)
+        heavy.update(loaded)
+
+    median = statistics.median(times)
+    print(f"import javaMarker: median {median:.1f} ms, min {min(times):.1f} ms, max {max(times):.1f} ms "
+          f"over {args.runs} runs")
+    print("Slowest imports (cumulative):")
+    for cumulative, name in slowest_imports():
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(sorted(heavy))}", file=sys.stderr)
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"FAIL: median {median:.1f} ms is over the {args.max_ms:.1f} ms budget", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Synthetic marking schemes and submissions for benchmarks.
+
+Everything is driven by a seeded random.Random, so the same parameters
+always produce the same texts and results stay comparable between runs
+and versions.
+"""
+import random
+
+MARKS = ('0.5', '1', '1.5', '2')
+
+_TEMPLATES = (
+    "int value{i} = {a} + {b};",
+    "total{i} += items[{a}] * {b};",
+    "if (count{i} > {a}) {{ count{i}--; }}",
+    "System.out.println(\"step {i}: \" + value{a});",
+    "result{i} = compute{a}(x{i}, y{b});",
+    "for (int k{i} = 0; k{i} < {a}; k{i}++) {{ sum{i} += k{i}; }}",
+    "String name{i} = names.get({a}).trim();",
+    "double ratio{i} = (double) hits{a} / tries{b};",
+)
+
+
+def make_statement(rng, index, prefix=""):
+    """Return one unique Java statement for the index"""
+    template = rng.choice(_TEMPLATES)
+    return template.format(i=f"{prefix}{index}", a=rng.randint(0, 99), b=rng.randint(1, 99))
+
+
+def near_miss(rng, statement):
+    """Return the statement with one identifier renamed, as a slightly wrong answer"""
+    words = [word for word in statement.replace('(', ' ').replace(')', ' ').split() if word.isidentifier()]
+    if not words:
+        return statement + " "
+    word = rng.choice(words)
+    return statement.replace(word, word + "Alt", 1)
+
+
+def make_scheme(criteria_count, seed=0):
+    """Return (scheme_text, statements) with one marked criterion per line"""
+    rng = random.Random(seed)
+    statements = [make_statement(rng, index) for index in range(criteria_count)]
+    lines = ["public class Reference {", "    public static void main(String[] args) {"]
+    for statement in statements:
+        lines.append(f"        {statement} // {rng.choice(MARKS)}")
+    lines += ["    }", "}"]
+    return "\n".join(lines) + "\n", statements
+
+
+def make_submission(statements, line_count, match_rate=0.7, near_miss_rate=0.1, seed=0):
+    """Return a submission of about line_count lines answering the scheme statements.
+
+    match_rate of the criteria appear verbatim, near_miss_rate appear with a
+    small mistake, and the rest are missing. Unrelated filler code and the
+    odd comment make up the remaining lines.
+    """
+    rng = random.Random(seed + 1)
+    answers = []
+    for statement in statements:
+        roll = rng.random()
+        if roll < match_rate:
+            answers.append(statement)
+        elif roll < match_rate + near_miss_rate:
+            answers.append(near_miss(rng, statement))
+
+    body = list(answers)
+    for index in range(max(0, line_count - len(answers) - 4)):
+        if rng.random() < 0.1:
+            body.append(f"// note {index}: checked against the spec")
+        else:
+            body.append(make_statement(rng, index, prefix="filler"))
+
+    # Keep the answers in order, with filler spread between them
+    rng.shuffle(body)
+    answer_set = set(answers)
+    positions = [index for index, line in enumerate(body) if line in answer_set]
+    for position, answer in zip(positions, answers):
+        body[position] = answer
+
+    lines = ["public class Submission {", "    public static void main(String[] args) {"]
+    lines += [f"        {line}" for line in body]
+    lines += ["    }", "}"]
+    return "\n".join(lines) + "\n"
+
+
+def make_case(criteria_count, line_count=None, match_rate=0.7, near_miss_rate=0.1, seed=0):
+    """Return (scheme_text, submission_text); line_count defaults to four lines per criterion"""
+    if line_count is None:
+        line_count = criteria_count * 4
+    scheme_text, statements = make_scheme(criteria_count, seed)
+    return scheme_text, make_submission(statements, line_count, match_rate, near_miss_rate, seed)
@@ -0,0 +1,379 @@
+"""Line and token diffs for the code comparison dialog.
+
+Lines are diffed with patience diff: lines that occur exactly once on
+each side, in the same order, anchor the alignment, and the gaps between
+anchors are diffed with Myers' O(ND) algorithm in its linear-space
+(middle snake) form. Every block of replaced lines is then diffed again
+token by token, so the dialog can mark exactly what changed inside a line.
+Whitespace never counts as a difference.
+
+Both levels are bounded. Selections over MAX_DIFF_LINES lines, or diffs
+whose Myers search would take more than MAX_DIFF_WORK steps, fall back to
+trimming the lines both sides share at the start and end and reporting
+everything between as changed; token diffs stop at MAX_TOKEN_WORK steps
+in total. Results are cached by a hash of both selections.
+"""
+import hashlib
+from bisect import bisect_left, bisect_right
+
+from grading_engine import LineIndex
+from instrumentation import count
+from java_lexer import tokenize
+from storage import LRUCache
+
+MAX_DIFF_LINES = 20000
+
+# Diagonal and snake steps a single Myers search may take
+MAX_DIFF_WORK = 1000000
+MAX_TOKEN_WORK = 1000000
+
+DIFF_CACHE_SIZE = 32
+
+_cache = LRUCache(DIFF_CACHE_SIZE)
+
+
+class DiffTooLarge(Exception):
+    """A diff ran past its work limit"""
+
+
+class _Budget:
+    """Work left for one diff"""
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    def spend(self, steps):
+        self.steps -= steps
+        if self.steps < 0:
+            raise DiffTooLarge()
+
+
+def _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi, budget):
+    """Return the (x, y) where an optimal edit path crosses the middle, or None.
+
+    Runs the forward and reverse Myers searches towards each other until
+    they overlap. None means the ranges share no element at all.
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    forward = [-1] * size
+    reverse = [-1] * size
+    forward[offset + 1] = 0
+    reverse[offset + 1] = 0
+    delta = n - m
+    odd = delta % 2 != 0
+    # Diagonals that ran off the edit graph are skipped from then on
+    f_start = f_end = r_start = r_end = 0
+
+    for d in range(max_d):
+        budget.spend(d + 1)
+        for k in range(-d + f_start, d + 1 - f_end, 2):
+            index = offset + k
+            if k == -d or (k != d and forward[index - 1] < forward[index + 1]):
+                x = forward[index + 1]
+            else:
+                x = forward[index - 1] + 1
+            y = x - k
+            run = x
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            budget.spend(x - run)
+            forward[index] = x
+            if x > n:
+                f_end += 2
+            elif y > m:
+                f_start += 2
+            elif odd:
+                other = offset + delta - k
+                if 0 <= other < size and reverse[other] != -1 and x >= n - reverse[other]:
+                    return a_lo + x, b_lo + y
+
+        for k in range(-d + r_start, d + 1 - r_end, 2):
+            index = offset + k
+            if k == -d or (k != d and reverse[index - 1] < reverse[index + 1]):
+                x = reverse[index + 1]
+            else:
+                x = reverse[index - 1] + 1
+            y = x - k
+            run = x
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            budget.spend(x - run)
+            reverse[index] = x
+            if x > n:
+                r_end += 2
+            elif y > m:
+                r_start += 2
+            elif not odd:
+                other = offset + delta - k
+                if 0 <= other < size and forward[other] != -1:
+                    forward_x = forward[other]
+                    if forward_x >= n - x:
+                        return a_lo + forward_x, b_lo + forward_x - (other - offset)
+    return None
+
+
+def _trim(a, a_lo, a_hi, b, b_lo, b_hi, blocks):
+    """Record the common start and end of two ranges and return what is left"""
+    start = 0
+    while a_lo + start < a_hi and b_lo + start < b_hi and a[a_lo + start] == b[b_lo + start]:
+        start += 1
+    if start:
+        blocks.append((a_lo, b_lo, start))
+        a_lo += start
+        b_lo += start
+    end = 0
+    while a_hi - end > a_lo and b_hi - end > b_lo and a[a_hi - 1 - end] == b[b_hi - 1 - end]:
+        end += 1
+    if end:
+        blocks.append((a_hi - end, b_hi - end, end))
+    return a_lo, a_hi - end, b_lo, b_hi - end
+
+
+def _unique_anchors(a, a_lo, a_hi, b, b_lo, b_hi):
+    """Longest in-order run of elements occurring once in each range, as (i, j) pairs"""
+    # Position of each element, or -1 once it is seen twice
+    in_a = {}
+    for i in range(a_lo, a_hi):
+        in_a[a[i]] = -1 if a[i] in in_a else i
+    in_b = {}
+    for j in range(b_lo, b_hi):
+        in_b[b[j]] = -1 if b[j] in in_b else j
+    pairs = sorted((i, in_b[key]) for key, i in in_a.items() if i >= 0 and in_b.get(key, -1) >= 0)
+    if not pairs:
+        return []
+
+    # Patience sorting: the longest increasing run of j over pairs ordered by i
+    tails = []  # j ending the best run of each length
+    tail_pairs = []
+    previous = {}
+    for pair in pairs:
+        length = bisect_left(tails, pair[1])
+        if length == len(tails):
+            tails.append(pair[1])
+            tail_pairs.append(pair)
+        else:
+            tails[length] = pair[1]
+            tail_pairs[length] = pair
+        previous[pair] = tail_pairs[length - 1] if length else None
+    anchors = []
+    pair = tail_pairs[-1]
+    while pair is not None:
+        anchors.append(pair)
+        pair = previous[pair]
+    anchors.reverse()
+    return anchors
+
+
+def matching_blocks(a, b, budget, patience=True):
+    """Return sorted (i, j, size) runs of equal elements of two sequences.
+
+    Raises DiffTooLarge once the budget is spent.
+    """
+    blocks = []
+    stack = [(0, len(a), 0, len(b), patience)]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi, use_anchors = stack.pop()
+        a_lo, a_hi, b_lo, b_hi = _trim(a, a_lo, a_hi, b, b_lo, b_hi, blocks)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = _unique_anchors(a, a_lo, a_hi, b, b_lo, b_hi) if use_anchors else []
+        if anchors:
+            budget.spend(a_hi - a_lo + b_hi - b_lo)
+            for i, j in anchors:
+                blocks.append((i, j, 1))
+                stack.append((a_lo, i, b_lo, j, True))
+                a_lo, b_lo = i + 1, j + 1
+            stack.append((a_lo, a_hi, b_lo, b_hi, True))
+            continue
+        split = _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi, budget)
+        if split is not None:
+            x, y = split
+            stack.append((a_lo, x, b_lo, y, False))
+            stack.append((x, a_hi, y, b_hi, False))
+
+    blocks.sort()
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def opcodes(blocks, a_length, b_length):
+    """Turn matching blocks into difflib-style (tag, i1, i2, j1, j2) opcodes"""
+    codes = []
+    i = j = 0
+    for block_i, block_j, size in blocks + [(a_length, b_length, 0)]:
+        if i < block_i and j < block_j:
+            codes.append(('replace', i, block_i, j, block_j))
+        elif i < block_i:
+            codes.append(('delete', i, block_i, j, j))
+        elif j < block_j:
+            codes.append(('insert', i, i, j, block_j))
+        if size:
+            codes.append(('equal', block_i, block_i + size, block_j, block_j + size))
+        i, j = block_i + size, block_j + size
+    return codes
+
+
+def diff_sequences(a, b, max_work=MAX_DIFF_WORK, patience=True):
+    """Opcodes turning sequence a into b; raises DiffTooLarge past max_work"""
+    return opcodes(matching_blocks(a, b, _Budget(max_work), patience), len(a), len(b))
+
+
+def _coarse_opcodes(a, b):
+    """Opcodes from the common start and end alone, in linear time"""
+    blocks = []
+    a_lo, a_hi, b_lo, b_hi = _trim(a, 0, len(a), b, 0, len(b), blocks)
+    blocks.sort()
+    return opcodes(blocks, len(a), len(b))
+
+
+class TextDiff:
+    """Differences between two texts, for highlighting.
+
+    `opcodes` are over lines. `removed_lines` and `added_lines` are the
+    1-based numbers of lines only in the first or second text, and
+    `removed_spans` and `added_spans` the (line, col, line, col) spans of
+    changed tokens inside replaced lines. `exact` is False when the diff
+    fell back to the common start and end.
+    """
+
+    def __init__(self, opcodes, exact):
+        self.opcodes = opcodes
+        self.exact = exact
+        self.removed_lines = []
+        self.added_lines = []
+        self.removed_spans = []
+        self.added_spans = []
+
+    @property
+    def unchanged(self):
+        return not self.removed_lines and not self.added_lines
+
+    def summary(self):
+        """One line describing the diff"""
+        if self.unchanged:
+            return "No differences (ignoring whitespace)"
+        text = f"{len(self.removed_lines)} line(s) only in the scheme, {len(self.added_lines)} only in the submission"
+        if not self.exact:
+            text += "; too large for a detailed diff, showing the differing region"
+        return text
+
+
+def _line_keys(ids, text):
+    """Whitespace-insensitive line keys, as small ints for fast comparison"""
+    return [ids.setdefault(' '.join(line.split()), len(ids)) for line in text.split('\n')]
+
+
+class _Tokens:
+    """A text's tokens, searchable by character offset"""
+
+    def __init__(self, text):
+        self.tokens = list(tokenize(text))
+        self.starts = [token.start for token in self.tokens]
+        self.ends = [token.end for token in self.tokens]
+        self.index = LineIndex(text)
+
+    def between(self, start, end):
+        """Index range of the tokens overlapping [start, end), e.g. a comment begun above"""
+        return bisect_right(self.ends, start), bisect_left(self.starts, end)
+
+    def spans(self, lo, hi):
+        return [self.index.span(token.start, token.end) for token in self.tokens[lo:hi]]
+
+
+def _line_offsets(text):
+    """Start offset of every line plus the text's length"""
+    return LineIndex(text).line_starts + [len(text)]
+
+
+def _diff_tokens(result, a_text, b_text, replaced, removed, added):
+    """Mark the changed tokens of replaced line blocks and the lines holding them.
+
+    Returns how many blocks were diffed before the token budget ran out.
+    """
+    a_tokens, b_tokens = _Tokens(a_text), _Tokens(b_text)
+    a_offsets, b_offsets = _line_offsets(a_text), _line_offsets(b_text)
+    budget = _Budget(MAX_TOKEN_WORK)
+    for done, (i1, i2, j1, j2) in enumerate(replaced):
+        a_lo, a_hi = a_tokens.between(a_offsets[i1], a_offsets[i2])
+        b_lo, b_hi = b_tokens.between(b_offsets[j1], b_offsets[j2])
+        a_texts = [token.text for token in a_tokens.tokens[a_lo:a_hi]]
+        b_texts = [token.text for token in b_tokens.tokens[b_lo:b_hi]]
+        try:
+            blocks = matching_blocks(a_texts, b_texts, budget, patience=False)
+        except DiffTooLarge:
+            count("diff_token_limit")
+            return done
+        for tag, t1, t2, u1, u2 in opcodes(blocks, len(a_texts), len(b_texts)):
+            if tag == 'equal':
+                continue
+            for spans, lines, tokens, lo, hi in ((result.removed_spans, removed, a_tokens, a_lo + t1, a_lo + t2),
+                                                 (result.added_spans, added, b_tokens, b_lo + u1, b_lo + u2)):
+                token_spans = tokens.spans(lo, hi)
+                spans.extend(token_spans)
+                for start_line, _, end_line, _ in token_spans:
+                    lines.update(range(start_line, end_line + 1))
+    return len(replaced)
+
+
+def _diff(a_text, b_text):
+    ids = {}  # Shared, so equal lines get the same key on both sides
+    a_keys = _line_keys(ids, a_text)
+    b_keys = _line_keys(ids, b_text)
+    exact = max(len(a_keys), len(b_keys)) <= MAX_DIFF_LINES
+    if exact:
+        try:
+            codes = diff_sequences(a_keys, b_keys)
+        except DiffTooLarge:
+            exact = False
+    if not exact:
+        count("diff_fallback")
+        codes = _coarse_opcodes(a_keys, b_keys)
+
+    result = TextDiff(codes, exact)
+    removed = set()
+    added = set()
+    replaced = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'replace' and exact:
+            replaced.append((i1, i2, j1, j2))
+        elif tag != 'equal':
+            removed.update(range(i1 + 1, i2 + 1))
+            added.update(range(j1 + 1, j2 + 1))
+    # Replaced lines that differ only in spacing have no changed token and
+    # stay unmarked; blocks past the token budget are marked whole
+    diffed = _diff_tokens(result, a_text, b_text, replaced, removed, added) if replaced else 0
+    for i1, i2, j1, j2 in replaced[diffed:]:
+        removed.update(range(i1 + 1, i2 + 1))
+        added.update(range(j1 + 1, j2 + 1))
+    result.removed_lines = sorted(removed)
+    result.added_lines = sorted(added)
+    return result
+
+
+def diff_texts(a_text, b_text):
+    """Return the TextDiff of two texts, from cache when they were diffed before"""
+    digest = hashlib.sha256()
+    for text in (a_text, b_text):
+        data = text.encode('utf-8', 'surrogatepass')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    key = digest.digest()
+
+    result = _cache.get(key)
+    if result is not None:
+        count("diff_cache_hit")
+        return result
+    result = _diff(a_text, b_text)
+    _cache.put(key, result)
+    return result
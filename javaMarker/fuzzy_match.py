@@ -0,0 +1,179 @@
+"""Approximate matching of criteria against a submission's token stream.
+
+A FuzzyIndex holds a q-gram (token shingle) index of one submission. For a
+criterion with m tokens and at most k allowed edits, two filters pick the
+places worth verifying:
+
+- Pigeonhole: split into k+1 pieces, at least one piece of the criterion
+  survives k edits unchanged, so only diagonals where some piece occurs
+  exactly are candidates.
+- Count: a region within k edits shares at least m - q + 1 - k*q q-grams
+  with the criterion (the q-gram lemma), so a candidate whose band of
+  diagonals collects fewer hits is dropped.
+
+Verification is Sellers' edit distance with Ukkonen's cut-off: rows whose
+cost already exceeds k are never computed. Together they keep the search
+far below trying every window of the submission.
+"""
+from bisect import bisect_left, bisect_right
+
+
+class FuzzyMatch:
+    """Closest region of the submission for one criterion"""
+
+    def __init__(self, distance, start, end, length):
+        self.distance = distance
+        self.start = start  # Token index range [start, end) in the submission
+        self.end = end
+        self.score = 1.0 - distance / length if length else 0.0
+
+    def __repr__(self):
+        return f"FuzzyMatch(distance={self.distance}, tokens={self.start}:{self.end}, score={self.score:.2f})"
+
+
+def max_edits(length, threshold):
+    """Largest edit distance that still scores at least the threshold"""
+    return int(length * (1.0 - threshold) + 1e-9)
+
+
+def bounded_edit_search(pattern, text, lo, hi, k):
+    """Best approximate occurrence of pattern in text[lo:hi] with at most k edits.
+
+    Returns (distance, start, end) or None. Only the cells of each column
+    that can still be within k are computed.
+    """
+    m = len(pattern)
+    # Column before text[lo]: matching a pattern prefix of length i costs i
+    prev_cost = list(range(min(k, m) + 1))
+    prev_start = [lo] * len(prev_cost)
+    best = None
+
+    for j in range(lo, hi):
+        symbol = text[j]
+        cost = [0]  # The match may start anywhere, so the empty prefix is free
+        start = [j + 1]
+        prev_len = len(prev_cost)
+        for i in range(1, min(prev_len, m) + 1):
+            value = prev_cost[i - 1] + (pattern[i - 1] != symbol)
+            origin = prev_start[i - 1]
+            if i < prev_len and prev_cost[i] + 1 < value:
+                value = prev_cost[i] + 1
+                origin = prev_start[i]
+            if cost[i - 1] + 1 < value:
+                value = cost[i - 1] + 1
+                origin = start[i - 1]
+            cost.append(value)
+            start.append(origin)
+
+        # Ukkonen's cut-off: drop trailing rows that already exceed k
+        while len(cost) > 1 and cost[-1] > k:
+            cost.pop()
+            start.pop()
+
+        if len(cost) == m + 1 and (best is None or cost[m] < best[0]):
+            best = (cost[m], start[m], j + 1)
+            if best[0] == 0:
+                break
+        prev_cost = cost
+        prev_start = start
+
+    return best
+
+
+class FuzzyIndex:
+    """Token q-gram index over one submission, built lazily per q"""
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self._grams = {}
+
+    def _positions(self, q):
+        index = self._grams.get(q)
+        if index is None:
+            index = {}
+            symbols = self.symbols
+            for position in range(len(symbols) - q + 1):
+                index.setdefault(tuple(symbols[position:position + q]), []).append(position)
+            self._grams[q] = index
+        return index
+
+    def _piece_diagonals(self, pattern, k):
+        """Sorted diagonals (text start - pattern start) where one of k+1 pieces occurs exactly"""
+        m = len(pattern)
+        symbols = self.symbols
+        bounds = [m * piece // (k + 1) for piece in range(k + 2)]
+        q = min(3, min(bounds[piece + 1] - bounds[piece] for piece in range(k + 1)))
+        index = self._positions(q)
+        diagonals = set()
+        for piece in range(k + 1):
+            start, end = bounds[piece], bounds[piece + 1]
+            piece_symbols = list(pattern[start:end])
+            for j in index.get(tuple(pattern[start:start + q]), ()):
+                if symbols[j:j + end - start] == piece_symbols:
+                    diagonals.add(j - start)
+        return sorted(diagonals)
+
+    def _gram_diagonals(self, pattern, q):
+        """Sorted diagonals of every q-gram the pattern shares with the submission"""
+        index = self._positions(q)
+        diagonals = []
+        for i in range(len(pattern) - q + 1):
+            diagonals.extend(j - i for j in index.get(tuple(pattern[i:i + q]), ()))
+        diagonals.sort()
+        return diagonals
+
+    def candidate_regions(self, pattern, k, q=None):
+        """Return merged (hits, lo, hi) token ranges that may hold a match within k edits.
+
+        `hits` bounds from above the q-grams any match in the range shares
+        with the pattern; with no q every range has 0 hits.
+        """
+        m = len(pattern)
+        n = len(self.symbols)
+        grams = self._gram_diagonals(pattern, q) if q else None
+        needed = m - q + 1 - k * q if q else 0
+
+        regions = []
+        for diagonal in self._piece_diagonals(pattern, k):
+            # The match starts within k of the piece's diagonal and its
+            # shared q-grams lie within k of the start
+            hits = bisect_right(grams, diagonal + 2 * k) - bisect_left(grams, diagonal - 2 * k) if q else 0
+            if hits < needed:
+                continue
+            lo = max(0, diagonal - k)
+            hi = min(n, diagonal + m + 2 * k)
+            if regions and lo <= regions[-1][2]:
+                regions[-1] = (max(regions[-1][0], hits), regions[-1][1], max(regions[-1][2], hi))
+            else:
+                regions.append((hits, lo, hi))
+        return regions
+
+    def search(self, pattern, threshold):
+        """Return the best FuzzyMatch scoring at least threshold, or None"""
+        m = len(pattern)
+        if not m:
+            return None
+        k = max_edits(m, threshold)
+        if k >= m:
+            return None
+
+        # Largest q whose q-gram lemma still demands at least one shared gram
+        q = next((q for q in (3, 2, 1) if q <= m and m - q + 1 - k * q >= 1), None)
+        regions = self.candidate_regions(pattern, k, q)
+        # The most promising regions go first, so a close match found early
+        # lets the count filter discard most of the rest
+        regions.sort(key=lambda region: (-region[0], region[1]))
+
+        best = None
+        for hits, lo, hi in regions:
+            if q and hits < m - q + 1 - k * q:
+                continue
+            found = bounded_edit_search(pattern, self.symbols, lo, hi, k)
+            if found:
+                best = found
+                k = found[0] - 1  # Later regions only matter if they do better
+                if k < 0:
+                    break
+        if best is None or best[2] <= best[1]:
+            return None
+        return FuzzyMatch(best[0], best[1], best[2], m)
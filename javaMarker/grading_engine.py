@@ -0,0 +1,538 @@
+"""Headless grading core for the Java Practical Assessment Grader.
+
+Everything in this module works on plain strings, so it can be used
+without creating a Tk root. The GUI in javaMarker.py is a view over the
+rows produced here.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+from aho_corasick import AhoCorasick
+from fuzzy_match import FuzzyIndex
+from instrumentation import MATCH_ALL, MATCH_CRITERION, NORMALIZE, count, stage
+from java_lexer import COMMENT, code_symbols, tokenize
+from java_syntax import parse_submission
+from structured_scheme import (MatcherTimeout, detect_scheme_format, find_structured_mark_spans,
+                               parse_structured_scheme)
+from submission_reader import FILE_MARKER_PATTERN
+
+# Mark allocations in comments (format: // 1.0 or /* 1.0 */)
+MARK_PATTERN = re.compile(r'(//|/\*)\s*(\d+\.?\d*)\s*(?:\*/)?')
+# A mark allocation together with the code preceding it on the same line
+CRITERIA_PATTERN = re.compile(r'(.*?)(//|/\*)\s*(\d+\.?\d*)\s*(?:\*/)?')
+
+MANUAL_PREFIX = "Manual:"
+
+STATUS_FOUND = "found"
+STATUS_NOT_FOUND = "not_found"
+STATUS_PARTIAL = "partial"
+
+# Comment of a row whose matcher ran out of time; such grades are never cached
+TIMED_OUT_COMMENT = "Matcher timed out; check by hand"
+
+# Mark totals are rounded to this many digits so summed floats don't show drift (4.449999999999999)
+TOTAL_DIGITS = 9
+
+# Partial credit for near-misses is opt-in: off unless a threshold is given
+DEFAULT_FUZZY_THRESHOLD = None
+
+# Minimum similarity for a near-miss to earn partial credit once it is switched on
+FUZZY_THRESHOLD = 0.8
+
+
+class Criterion:
+    """A single entry parsed from the marking scheme"""
+
+    def __init__(self, text, allocated, line):
+        self.text = text
+        self.allocated = allocated
+        self.line = line  # 1-based line in the marking scheme
+        self.symbols = code_symbols(text)  # Code tokens used for matching
+
+    def __repr__(self):
+        return f"Criterion({self.text!r}, {self.allocated}, line={self.line})"
+
+
+class ResultRow:
+    """One row of the grading table.
+
+    `spans` holds (start_line, start_col, end_line, end_col) tuples in the
+    submission for matched criteria; `scheme_line` is the marking scheme
+    line the criterion came from, if known. `token_ranges` are the same
+    matches as [start, end) token indexes into the graded submission, and
+    `score` is the similarity of the closest region for partially matched
+    criteria. For multi-file submissions `files` names the source file of
+    each span; it is empty for single files.
+    """
+
+    # Large cohorts and tables hold many rows; no per-row __dict__
+    __slots__ = ('criteria', 'allocated', 'awarded', 'comments', 'reference', 'status',
+                 'spans', 'scheme_line', 'token_ranges', 'score', 'files')
+
+    def __init__(self, criteria, allocated, awarded=0.0, comments="",
+                 reference="", status="", spans=None, scheme_line=None):
+        self.criteria = criteria
+        self.allocated = allocated
+        self.awarded = awarded
+        self.comments = comments
+        self.reference = reference
+        self.status = status
+        self.spans = spans if spans is not None else []
+        self.scheme_line = scheme_line
+        self.token_ranges = []
+        self.score = None
+        self.files = []
+
+    @classmethod
+    def from_criterion(cls, criterion):
+        return cls(criterion.text, criterion.allocated, scheme_line=criterion.line)
+
+    @classmethod
+    def from_values(cls, values, scheme_line=None):
+        """Build a row from a (possibly short) table values tuple"""
+        values = list(values) + [""] * (6 - len(values))
+        return cls(
+            str(values[0]),
+            _to_float(values[1]),
+            _to_float(values[2]),
+            str(values[3]),
+            str(values[4]),
+            str(values[5]),
+            scheme_line=scheme_line
+        )
+
+    @property
+    def is_manual(self):
+        return self.criteria.startswith(MANUAL_PREFIX)
+
+    def copy(self):
+        """Return an independent copy of the row"""
+        row = ResultRow(self.criteria, self.allocated, self.awarded, self.comments,
+                        self.reference, self.status, list(self.spans), self.scheme_line)
+        row.token_ranges = list(self.token_ranges)
+        row.score = self.score
+        row.files = list(self.files)
+        return row
+
+    def to_dict(self):
+        """Return every field as plain, JSON-serializable values"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, record):
+        """Rebuild a row from to_dict() output, e.g. after a JSON round trip"""
+        row = cls(record['criteria'], record['allocated'])
+        for name, value in row_fields(record).items():
+            if name in cls.__slots__:
+                setattr(row, name, value)
+        return row
+
+    def values(self):
+        """Return the row in the column order used by the results table"""
+        return (self.criteria, self.allocated, self.awarded,
+                self.comments, self.reference, self.status)
+
+    def __repr__(self):
+        return f"ResultRow{self.values()!r}"
+
+
+def row_fields(fields):
+    """Restore the tuple fields of a row dict that JSON turned into lists"""
+    fields = dict(fields)
+    for name in ('spans', 'token_ranges'):
+        if name in fields:
+            fields[name] = [tuple(item) for item in fields[name]]
+    return fields
+
+
+class GradingResult:
+    """Outcome of grading one submission against a marking scheme"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @property
+    def total_marks(self):
+        return round(sum(row.allocated for row in self.rows if not row.is_manual), TOTAL_DIGITS)
+
+    @property
+    def achieved_marks(self):
+        return round(sum(row.awarded for row in self.rows), TOTAL_DIGITS)
+
+
+def _to_float(value):
+    try:
+        return float(value) if value != "" else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def find_mark_spans(scheme_text):
+    """Return (start, end) character offsets of mark comments in the scheme"""
+    return [match.span() for match in MARK_PATTERN.finditer(scheme_text)]
+
+
+class LineIndex:
+    """Line-start offset table for one document.
+
+    Built once per document so any character offset converts to a Tk-style
+    1-based line and 0-based column with a binary search.
+    """
+
+    def __init__(self, text):
+        self.line_starts = [0]
+        newline = text.find('\n')
+        while newline != -1:
+            self.line_starts.append(newline + 1)
+            newline = text.find('\n', newline + 1)
+
+    def line_col(self, offset):
+        """Convert an offset to a 1-based line and 0-based column"""
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1]
+
+    def span(self, start, end):
+        """Convert a [start, end) offset range to a (line, col, line, col) span"""
+        return self.line_col(start) + self.line_col(end)
+
+
+def parse_marking_scheme(scheme_text):
+    """Parse the marking scheme to extract criteria and allocated marks"""
+    criteria = []
+    for match in CRITERIA_PATTERN.finditer(scheme_text):
+        line = scheme_text.count('\n', 0, match.start(1)) + 1
+        criteria.append(Criterion(match.group(1).strip(), float(match.group(3)), line))
+    return criteria
+
+
+class NormalizedSubmission:
+    """A submission tokenized once per grading run.
+
+    `symbols` are the texts of the code tokens (comments are kept apart in
+    `comments`) and are what criteria are matched against. Each token
+    keeps its offsets into the original text, and `line_index` maps those
+    offsets back to line/column highlight spans.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self._lower_symbols = None
+        self._fuzzy_index = None
+        self._file_starts = None
+        self._code_text = None
+        self._token_offsets = None
+        self._syntax_tree = None
+
+        self.tokens = []
+        self.comments = []
+        with stage(NORMALIZE):
+            for token in tokenize(original):
+                if token.kind == COMMENT:
+                    self.comments.append(token)
+                else:
+                    self.tokens.append(token)
+            self.symbols = [token.text for token in self.tokens]
+
+            self.line_index = LineIndex(original)
+
+    @property
+    def lower_symbols(self):
+        """Lower-cased token texts, built on first use"""
+        if self._lower_symbols is None:
+            self._lower_symbols = [symbol.lower() for symbol in self.symbols]
+        return self._lower_symbols
+
+    @property
+    def fuzzy_index(self):
+        """Token q-gram index for near-miss searches, built on first use"""
+        if self._fuzzy_index is None:
+            self._fuzzy_index = FuzzyIndex(self.symbols)
+        return self._fuzzy_index
+
+    def span(self, start, end):
+        """Map a token [start, end) range to an original (line, col, line, col) span"""
+        return self.line_index.span(self.tokens[start].start, self.tokens[end - 1].end)
+
+    @property
+    def code_text(self):
+        """The original text with comments blanked out, offsets unchanged; built on first use"""
+        if self._code_text is None:
+            pieces = []
+            position = 0
+            for comment in self.comments:
+                pieces.append(self.original[position:comment.start])
+                # Newlines stay so that line anchors still work
+                pieces.append(re.sub(r'[^\n]', ' ', comment.text))
+                position = comment.end
+            pieces.append(self.original[position:])
+            self._code_text = "".join(pieces)
+        return self._code_text
+
+    def _offsets(self):
+        """(start offsets, end offsets) of the code tokens, built on first use"""
+        if self._token_offsets is None:
+            self._token_offsets = ([token.start for token in self.tokens], [token.end for token in self.tokens])
+        return self._token_offsets
+
+    def token_range(self, start, end):
+        """Return the [start, end) range of the code tokens overlapping a character range"""
+        starts, ends = self._offsets()
+        return bisect_right(ends, start), bisect_left(starts, end)
+
+    @property
+    def syntax_tree(self):
+        """Syntax tree of the code, parsed per file on first use (see java_syntax.py)"""
+        if self._syntax_tree is None:
+            starts = self._offsets()[0]
+            file_tokens = [bisect_left(starts, offset) for offset, _ in self.file_starts]
+            self._syntax_tree = parse_submission(self.symbols, file_tokens)
+        return self._syntax_tree
+
+    @property
+    def file_starts(self):
+        """(offset, name) of every file marker of a multi-file submission, built on first use"""
+        if self._file_starts is None:
+            self._file_starts = []
+            for comment in self.comments:
+                match = FILE_MARKER_PATTERN.match(comment.text)
+                if match:
+                    self._file_starts.append((comment.start, match.group(1)))
+        return self._file_starts
+
+    def files_for(self, token_ranges):
+        """Return the source file of each token range; empty for single-file submissions"""
+        file_starts = self.file_starts
+        if not file_starts:
+            return []
+        offsets = [offset for offset, _ in file_starts]
+        files = []
+        for start, _ in token_ranges:
+            index = bisect_right(offsets, self.tokens[start].start) - 1
+            files.append(file_starts[index][1] if index >= 0 else None)
+        return files
+
+    def find_all(self, symbols, nocase=False):
+        """Return the token index of every non-overlapping occurrence"""
+        if not symbols:
+            return []
+        if nocase:
+            symbols = [symbol.lower() for symbol in symbols]
+        haystack = self.lower_symbols if nocase else self.symbols
+        return AhoCorasick([symbols]).find_all(haystack).get(0, [])
+
+    def find_spans(self, criteria, nocase=False):
+        """Return original-text spans of every occurrence of the criteria code"""
+        symbols = code_symbols(criteria)
+        return [self.span(index, index + len(symbols))
+                for index in self.find_all(symbols, nocase)]
+
+    def closest_match(self, criteria, threshold):
+        """Return the FuzzyMatch of the most similar region, or None"""
+        return self.fuzzy_index.search(code_symbols(criteria), threshold)
+
+
+class CriteriaMatcher:
+    """All criteria of a scheme compiled into one token-level automaton.
+
+    Build it once per scheme and reuse it for every submission; matching
+    is then a single pass over the submission's tokens no matter how many
+    criteria the rubric has. `rules` maps the criteria of a structured
+    scheme to their compiled matchers (see structured_scheme.py), whose
+    token sequences join the same pass.
+    """
+
+    def __init__(self, criteria_texts, rules=None):
+        self.rules = dict(rules or {})
+        symbols = [code_symbols(text) for text in criteria_texts]
+        symbols.extend(pattern for rule in self.rules.values() for pattern in rule.patterns)
+        self.patterns = sorted(set(s for s in symbols if s))
+        self._index = {pattern: index for index, pattern in enumerate(self.patterns)}
+        self.automaton = AhoCorasick(self.patterns)
+
+    def covers(self, symbols):
+        """True if the criteria tokens are one of the compiled patterns"""
+        return not symbols or symbols in self._index
+
+    def find_all(self, submission_symbols):
+        """Map each criteria token tuple to its non-overlapping start indexes"""
+        return {
+            self.patterns[index]: starts
+            for index, starts in self.automaton.find_all(submission_symbols).items()
+        }
+
+
+def matcher_for_rows(rows, matcher=None):
+    """Return a matcher covering the automatic rows, compiling one if needed.
+
+    The compiled rules of `matcher` are kept for rows that still have them.
+    """
+    rules = matcher.rules if matcher is not None else {}
+    criteria = [row.criteria for row in rows if not row.is_manual and row.criteria not in rules]
+    if matcher is None or not all(matcher.covers(code_symbols(c)) for c in criteria):
+        matcher = CriteriaMatcher(criteria, rules)
+    return matcher
+
+
+class CompiledScheme:
+    """A marking scheme parsed and compiled once for reuse across submissions.
+
+    Holds the parsed criteria (with their code tokens and scheme lines),
+    the (line, col, line, col) spans of the marks for highlighting and the
+    prebuilt criteria matcher. `format` is 'java' for a Java scheme with
+    mark comments, or 'json'/'yaml' for a structured scheme, whose
+    criteria's compiled matchers are the matcher's rules. See scheme_cache
+    for the cached loader.
+    """
+
+    def __init__(self, scheme_text, digest=None):
+        self.digest = digest
+        self.format = detect_scheme_format(scheme_text)
+        line_index = LineIndex(scheme_text)
+        if self.format == 'java':
+            self.criteria = parse_marking_scheme(scheme_text)
+            mark_offsets = find_mark_spans(scheme_text)
+            rules = {}
+        else:
+            entries = parse_structured_scheme(scheme_text, self.format)
+            self.criteria = [Criterion(name, marks, find_scheme_line(scheme_text, name))
+                             for name, marks, _ in entries]
+            mark_offsets = find_structured_mark_spans(scheme_text)
+            rules = {name: rule for name, _, rule in entries}
+        if not self.criteria:
+            # Everyone would silently score 0 out of 0
+            raise ValueError("The marking scheme has no criteria: a Java scheme needs mark comments "
+                             "such as // 2, a JSON or YAML scheme a non-empty 'criteria' list")
+        self.mark_spans = [line_index.span(start, end) for start, end in mark_offsets]
+        self.matcher = CriteriaMatcher((c.text for c in self.criteria if c.text not in rules), rules)
+
+    @property
+    def total_marks(self):
+        return round(sum(c.allocated for c in self.criteria), TOTAL_DIGITS)
+
+    def new_rows(self):
+        """Return fresh, ungraded result rows for every criterion"""
+        return [ResultRow.from_criterion(c) for c in self.criteria]
+
+
+def find_scheme_line(scheme_text, criteria):
+    """Return the first scheme line containing the criteria, or None"""
+    for line_num, line in enumerate(scheme_text.splitlines(), 1):
+        if criteria.strip() in line:
+            return line_num
+    return None
+
+
+def unique_files(files):
+    """File names in first-seen order, without repeats or unknowns"""
+    return [name for name in dict.fromkeys(files) if name is not None]
+
+
+def grade_row(row, symbols, starts, submission, scheme_text=None, fuzzy_threshold=None):
+    """Grade one automatic row given the token indexes where its criteria occurs"""
+    token_ranges = [(start, start + len(symbols)) for start in starts]
+
+    near_miss = None
+    if not token_ranges and fuzzy_threshold:
+        near_miss = submission.fuzzy_index.search(symbols, fuzzy_threshold)
+        if near_miss is not None:
+            token_ranges = [(near_miss.start, near_miss.end)]
+
+    # Multi-file submissions name the files the criteria was found in
+    files = submission.files_for(token_ranges)
+    where = ", ".join(unique_files(files))
+
+    row.score = None
+    if near_miss is not None:
+        row.awarded = round(row.allocated * near_miss.score, 2)
+        row.comments = f"Partial match ({near_miss.score:.0%} similar)" + (f" in {where}" if where else "")
+        row.status = STATUS_PARTIAL
+        row.score = near_miss.score
+    elif token_ranges:
+        row.awarded = row.allocated
+        row.comments = f"Found in {where or 'submission'}"
+        row.status = STATUS_FOUND
+    else:
+        row.awarded = 0.0
+        row.comments = "Not found in submission"
+        row.status = STATUS_NOT_FOUND
+        if row.scheme_line is None and scheme_text is not None:
+            row.scheme_line = find_scheme_line(scheme_text, row.criteria)
+    row.token_ranges = token_ranges
+    row.spans = [submission.span(start, end) for start, end in token_ranges]
+    row.files = files
+    row.reference = ""
+
+
+def grade_rule_row(row, rule, occurrences, submission, scheme_text=None):
+    """Grade one automatic row of a structured scheme with its compiled matcher.
+
+    `occurrences` maps token sequences to their start indexes, as found by
+    a CriteriaMatcher holding the rule. Rules earn full marks or none.
+    """
+    timed_out = False
+    try:
+        token_ranges = rule.find(submission, occurrences)
+    except MatcherTimeout:
+        count("matcher_timeout")
+        token_ranges = []
+        timed_out = True
+
+    files = submission.files_for(token_ranges)
+    where = ", ".join(unique_files(files))
+
+    row.score = None
+    if token_ranges:
+        row.awarded = row.allocated
+        row.comments = f"Found in {where or 'submission'}"
+        row.status = STATUS_FOUND
+    else:
+        row.awarded = 0.0
+        row.comments = TIMED_OUT_COMMENT if timed_out else "Not found in submission"
+        row.status = STATUS_NOT_FOUND
+        if row.scheme_line is None and scheme_text is not None:
+            row.scheme_line = find_scheme_line(scheme_text, row.criteria)
+    row.token_ranges = token_ranges
+    row.spans = [submission.span(start, end) for start, end in token_ranges]
+    row.files = files
+    row.reference = ""
+
+
+def grade_rows(rows, submission, scheme_text=None, matcher=None, fuzzy_threshold=None):
+    """Grade the automatic rows in place against the student submission.
+
+    `submission` is either the raw text or a NormalizedSubmission that can
+    be reused between runs, and `matcher` a CriteriaMatcher built for the
+    scheme; one is compiled from the rows if it is missing or does not
+    cover every criteria. Rows with a rule in the matcher (structured
+    schemes) are graded by that rule. With a `fuzzy_threshold`, other
+    criteria without an exact match earn partial credit in proportion to
+    the similarity of the closest region, if it reaches the threshold.
+    Manually graded rows are left untouched but still count towards the
+    achieved marks of the returned result.
+    """
+    if not isinstance(submission, NormalizedSubmission):
+        submission = NormalizedSubmission(submission)
+
+    auto_rows = [row for row in rows if not row.is_manual]
+    with stage(MATCH_ALL):
+        matcher = matcher_for_rows(auto_rows, matcher)
+        occurrences = matcher.find_all(submission.symbols)
+
+    for row in auto_rows:
+        with stage(MATCH_CRITERION):
+            rule = matcher.rules.get(row.criteria)
+            if rule is not None:
+                grade_rule_row(row, rule, occurrences, submission, scheme_text)
+                continue
+            symbols = code_symbols(row.criteria)
+            grade_row(row, symbols, occurrences.get(symbols, ()), submission,
+                      scheme_text, fuzzy_threshold)
+
+    return GradingResult(rows)
+
+
+def grade_submission(scheme_text, student_text, matcher=None, fuzzy_threshold=None):
+    """Parse the scheme and grade a submission in one call"""
+    compiled = CompiledScheme(scheme_text)
+    return grade_rows(compiled.new_rows(), student_text, scheme_text, matcher or compiled.matcher,
+                      fuzzy_threshold)
@@ -0,0 +1,50 @@
+"""Bulk highlighting of Tk text widgets.
+
+Spans are (start_line, start_col, end_line, end_col) tuples, as produced
+by grading_engine.LineIndex, so no Tk index expression has to be resolved
+relative to "1.0". Tk's tag add/remove accept many ranges per call, so
+spans are applied in batches instead of one widget call per span.
+"""
+
+# Ranges per tag_add/tag_remove call; keeps each Tcl command a sane size
+BATCH_SIZE = 500
+
+
+def span_indices(spans):
+    """Flatten spans into Tk "line.col" index strings"""
+    indices = []
+    for start_line, start_col, end_line, end_col in spans:
+        indices.append(f"{start_line}.{start_col}")
+        indices.append(f"{end_line}.{end_col}")
+    return indices
+
+
+def line_spans(lines):
+    """Whole-line spans for the given 1-based line numbers"""
+    return [(line, 0, line, 'end') for line in lines if line is not None]
+
+
+def _batched(widget, command, tag, spans, batch_size):
+    indices = span_indices(spans)
+    step = batch_size * 2
+    for position in range(0, len(indices), step):
+        # Text.tag_remove only forwards one range, so call Tk directly
+        widget.tk.call(widget._w, 'tag', command, tag, *indices[position:position + step])
+
+
+def add_spans(widget, tag, spans, batch_size=BATCH_SIZE):
+    """Tag every span with one tag add call per batch"""
+    _batched(widget, 'add', tag, spans, batch_size)
+
+
+def remove_spans(widget, tag, spans, batch_size=BATCH_SIZE):
+    """Untag every span with one tag remove call per batch"""
+    _batched(widget, 'remove', tag, spans, batch_size)
+
+
+def group_by_tag(tagged_spans):
+    """Turn (tag, span) pairs into {tag: [span, ...]} for bulk application"""
+    grouped = {}
+    for tag, span in tagged_spans:
+        grouped.setdefault(tag, []).append(span)
+    return grouped
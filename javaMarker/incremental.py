@@ -0,0 +1,341 @@
+"""Incremental re-grading after small edits.
+
+IncrementalGrader remembers the last graded submission and, for every
+row, its criteria tokens and matched token ranges. When the submission
+is edited it finds the window of tokens that actually changed and
+re-evaluates only:
+
+- rows whose criteria text or allocated marks changed (or that are new),
+- rows whose matched or near-miss region overlaps the edited window,
+- unmatched rows whose criteria now occurs in, or is closer to, the window,
+- rows graded by a structured scheme's rule, which may match anywhere,
+- rows without an exact match after the near-miss threshold changed.
+
+Every other row keeps its result; its token ranges are shifted past the
+edit so highlight spans stay correct without being recomputed.
+"""
+from aho_corasick import AhoCorasick
+from fuzzy_match import bounded_edit_search, max_edits
+from grading_engine import (
+    NormalizedSubmission, STATUS_FOUND, STATUS_NOT_FOUND, STATUS_PARTIAL, grade_row, grade_rule_row
+)
+from instrumentation import MATCH_ALL, MATCH_CRITERION, count, stage
+from java_lexer import code_symbols
+from result_cache import apply_grades, load_grades, result_key, store_grades
+
+# Above this many changed tokens a full regrade is cheaper than the checks
+FULL_REGRADE_TOKENS = 5000
+
+
+def token_edit_window(old, new):
+    """Return (start, old_end, new_end) bounding the tokens that differ.
+
+    Tokens before `start` are identical in both submissions and tokens
+    from `old_end` in the old one reappear, shifted, from `new_end` in the
+    new one.
+    """
+    old_tokens = old.tokens
+    new_tokens = new.tokens
+    limit = min(len(old_tokens), len(new_tokens))
+
+    start = 0
+    while start < limit and old_tokens[start] == new_tokens[start]:
+        start += 1
+
+    delta = len(new.original) - len(old.original)
+    old_end = len(old_tokens)
+    new_end = len(new_tokens)
+    while old_end > start and new_end > start:
+        old_token = old_tokens[old_end - 1]
+        new_token = new_tokens[new_end - 1]
+        if (old_token.kind != new_token.kind or old_token.text != new_token.text
+                or old_token.start + delta != new_token.start):
+            break
+        old_end -= 1
+        new_end -= 1
+    return start, old_end, new_end
+
+
+def _ranges_touch(start, end, window_start, window_end):
+    """True if [start, end) overlaps or borders [window_start, window_end)"""
+    return start <= window_end and end >= window_start
+
+
+class RegradeDelta:
+    """What a regrade changed.
+
+    `changed` lists the keys of re-evaluated rows. `dirty_ranges` are token
+    ranges of the new submission whose highlights must be refreshed, and
+    `full` is set when everything was regraded.
+    """
+
+    def __init__(self, changed, dirty_ranges, full):
+        self.changed = changed
+        self.dirty_ranges = dirty_ranges
+        self.full = full
+
+
+class IncrementalGrader:
+    """Re-grade only the rows an edit can affect"""
+
+    def __init__(self, fuzzy_threshold=None):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.reset()
+
+    def reset(self):
+        """Forget the previous run; the next regrade evaluates every row"""
+        self.submission = None
+        self.entries = {}  # key -> (graded ResultRow, criteria tokens)
+        self.stale = set()  # Keys the next regrade re-evaluates regardless of edits
+
+    def seed(self, keyed_rows, submission, rules=()):
+        """Start from (key, ResultRow) pairs graded earlier, e.g. a restored session.
+
+        Rows never graded, and rows whose matches no longer line up with
+        the submission's tokens, are left for the next regrade. Returns the
+        number of rows taken over; with none the grader stays empty.
+        """
+        if not isinstance(submission, NormalizedSubmission):
+            submission = NormalizedSubmission(submission)
+        self.reset()
+        token_count = len(submission.tokens)
+        for key, row in keyed_rows:
+            if row.is_manual or row.status not in (STATUS_FOUND, STATUS_NOT_FOUND, STATUS_PARTIAL):
+                continue
+            if not all(0 <= s < e <= token_count for s, e in row.token_ranges):
+                continue
+            if [submission.span(s, e) for s, e in row.token_ranges] != row.spans:
+                continue
+            symbols = () if row.criteria in rules else code_symbols(row.criteria)
+            self.entries[key] = (row.copy(), symbols)
+        if self.entries:
+            self.submission = submission
+        return len(self.entries)
+
+    def set_fuzzy_threshold(self, fuzzy_threshold):
+        """Change the near-miss threshold; the next regrade re-evaluates rows without an exact match"""
+        self.fuzzy_threshold = fuzzy_threshold
+        self.stale.update(key for key, (row, _) in self.entries.items() if row.status != STATUS_FOUND)
+
+    def fork(self):
+        """Return a grader starting from this one's state.
+
+        A regrade on the fork never changes this grader, so it can run in
+        the background and simply be dropped if it is cancelled.
+        """
+        grader = IncrementalGrader(self.fuzzy_threshold)
+        grader.submission = self.submission
+        grader.entries = dict(self.entries)
+        grader.stale = set(self.stale)
+        return grader
+
+    def regrade(self, keyed_rows, submission, scheme_text=None, matcher=None, progress=None):
+        """Grade (key, ResultRow) pairs, reusing results the edit cannot affect.
+
+        `matcher` is the scheme's prebuilt CriteriaMatcher, used when every
+        row has to be evaluated; rows with one of its rules are graded by
+        that rule. `progress(done, total)` is called as rows are graded; an
+        exception it raises aborts the regrade and leaves the previous
+        state untouched.
+        """
+        if not isinstance(submission, NormalizedSubmission):
+            submission = NormalizedSubmission(submission)
+        rules = matcher.rules if matcher is not None else {}
+
+        full = self.submission is None
+        window = None
+        if not full and submission is not self.submission and submission.original != self.submission.original:
+            window = token_edit_window(self.submission, submission)
+            if max(window[1], window[2]) - window[0] > FULL_REGRADE_TOKENS:
+                full = True
+
+        if window is not None and not full:
+            start, old_end, new_end = window
+            shift = new_end - old_end
+            dirty = [(start, new_end)] if new_end > start else []
+        else:
+            start = old_end = new_end = shift = 0
+            dirty = []
+
+        def map_range(range_start, range_end):
+            """Map an old token range onto the new submission"""
+            if window is None:
+                return range_start, range_end
+            if range_end <= start:
+                return range_start, range_end
+            if range_start >= old_end:
+                return range_start + shift, range_end + shift
+            # Overlaps the edit: stretch over the whole replacement
+            mapped_start = min(range_start, start)
+            mapped_end = range_end + shift if range_end > old_end else new_end
+            return mapped_start, mapped_end
+
+        to_grade = []
+        kept = []
+        current = {}
+        for key, row in keyed_rows:
+            if row.is_manual:
+                continue
+            entry = self.entries.get(key)
+            # Marks the marker changed by hand are not overridden by a threshold change
+            stale = key in self.stale and entry is not None and entry[0].awarded == row.awarded
+            if (full or entry is None or stale or entry[0].criteria != row.criteria
+                    or entry[0].allocated != row.allocated):
+                if entry and entry[0].criteria == row.criteria:
+                    symbols = entry[1]
+                else:
+                    symbols = () if row.criteria in rules else code_symbols(row.criteria)
+                if entry and not full:
+                    dirty.extend(map_range(s, e) for s, e in entry[0].token_ranges)
+                to_grade.append((key, row, symbols))
+            else:
+                kept.append((key, entry[0], entry[1], row))
+
+        # Rows that were deleted from the table lose their highlights
+        seen = {key for key, _ in keyed_rows}
+        for key, (old_row, _) in self.entries.items():
+            if key not in seen and not full:
+                dirty.extend(map_range(s, e) for s, e in old_row.token_ranges)
+
+        if window is not None and not full:
+            affected = self._affected_by_window(kept, submission, start, old_end, new_end)
+            affected.update(key for key, old_row, _, _ in kept if old_row.criteria in rules)
+        else:
+            affected = set()
+
+        for key, old_row, symbols, row in kept:
+            if key in affected:
+                dirty.extend(map_range(s, e) for s, e in old_row.token_ranges)
+                to_grade.append((key, row, symbols))
+                continue
+            if shift or window is not None:
+                # Shift a copy; the previous run's rows are never modified
+                old_row = old_row.copy()
+                old_row.token_ranges = [map_range(s, e) for s, e in old_row.token_ranges]
+                old_row.spans = [submission.span(s, e) for s, e in old_row.token_ranges]
+                old_row.files = submission.files_for(old_row.token_ranges)
+            current[key] = (old_row, symbols)
+
+        # A full grade of a submission graded before (e.g. a resubmission) is replayed
+        graded_rows = [row for _, row, _ in to_grade]
+        cache_key = grades = None
+        if full and graded_rows:
+            cache_key = result_key(graded_rows, submission, self.fuzzy_threshold, rules)
+            grades = load_grades(cache_key)
+
+        count("rows_regraded", len(to_grade))
+        count("rows_kept", len(current))
+        if grades is not None:
+            count("result_cache_hit")
+            apply_grades(graded_rows, grades, submission, scheme_text)
+        else:
+            self._grade(to_grade, submission, scheme_text, matcher if full else None, rules, progress)
+            if cache_key is not None:
+                store_grades(cache_key, graded_rows)
+        for key, row, symbols in to_grade:
+            dirty.extend(row.token_ranges)
+            current[key] = (row, symbols)
+
+        self.submission = submission
+        self.entries = current
+        self.stale = set()
+        return RegradeDelta([key for key, _, _ in to_grade], self._merge(dirty), full)
+
+    def _grade(self, to_grade, submission, scheme_text, matcher, rules, progress):
+        """Grade (key, row, criteria tokens) triples in place"""
+        # One automaton pass over the criteria being re-evaluated
+        with stage(MATCH_ALL):
+            patterns = {symbols for _, _, symbols in to_grade if symbols}
+            for _, row, _ in to_grade:
+                if row.criteria in rules:
+                    patterns.update(rules[row.criteria].patterns)
+            patterns = sorted(patterns)
+            if matcher is not None and all(matcher.covers(pattern) for pattern in patterns):
+                found = matcher.find_all(submission.symbols)
+            elif patterns:
+                found = {
+                    patterns[index]: starts
+                    for index, starts in AhoCorasick(patterns).find_all(submission.symbols).items()
+                }
+            else:
+                found = {}
+        for done, (_, row, symbols) in enumerate(to_grade):
+            if progress is not None:
+                progress(done, len(to_grade))
+            with stage(MATCH_CRITERION):
+                if row.criteria in rules:
+                    grade_rule_row(row, rules[row.criteria], found, submission, scheme_text)
+                else:
+                    grade_row(row, symbols, found.get(symbols, ()), submission, scheme_text,
+                              self.fuzzy_threshold)
+
+    def _affected_by_window(self, kept, submission, start, old_end, new_end):
+        """Keys of unchanged rows whose result the edited window can change"""
+        affected = set()
+        unmatched = []
+        for key, old_row, symbols, _ in kept:
+            if any(_ranges_touch(s, e, start, old_end) for s, e in old_row.token_ranges):
+                affected.add(key)
+            elif symbols:
+                unmatched.append((key, old_row, symbols))
+
+        if not unmatched:
+            return affected
+
+        # New exact occurrences must overlap the window, so only the window
+        # plus one pattern length either side is scanned
+        symbols_list = submission.symbols
+        longest = max(len(symbols) for _, _, symbols in unmatched)
+        lo = max(0, start - longest)
+        hi = min(len(symbols_list), new_end + longest)
+        patterns = sorted({symbols for _, _, symbols in unmatched})
+        automaton = AhoCorasick(patterns)
+        occurring = set()
+        for match_start, index in automaton.iter_matches(symbols_list[lo:hi]):
+            match_start += lo
+            if _ranges_touch(match_start, match_start + len(patterns[index]), start, new_end):
+                occurring.add(patterns[index])
+
+        for key, old_row, symbols in unmatched:
+            if symbols in occurring:
+                affected.add(key)
+            elif self.fuzzy_threshold and old_row.status != STATUS_FOUND:
+                # A closer near-miss can only appear around the window
+                m = len(symbols)
+                k = max_edits(m, self.fuzzy_threshold)
+                if old_row.score is not None:
+                    k = min(k, max_edits(m, old_row.score) - 1)
+                if k < 0 or k >= m:
+                    continue
+                region_lo = max(0, start - m - k)
+                region_hi = min(len(symbols_list), new_end + m + k)
+                if bounded_edit_search(symbols, symbols_list, region_lo, region_hi, k):
+                    affected.add(key)
+        return affected
+
+    def _merge(self, ranges):
+        """Sort and merge token ranges, dropping empty ones"""
+        merged = []
+        for range_start, range_end in sorted(r for r in ranges if r[1] > r[0]):
+            if merged and range_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+            else:
+                merged.append((range_start, range_end))
+        return merged
+
+    def highlights(self, dirty_ranges=None):
+        """Return (status, span) for every tracked match touching the dirty ranges.
+
+        With no ranges, every tracked match is returned.
+        """
+        highlights = []
+        for row, _ in self.entries.values():
+            for range_start, range_end in row.token_ranges:
+                if dirty_ranges is None or any(range_start < dirty_end and range_end > dirty_start
+                                               for dirty_start, dirty_end in dirty_ranges):
+                    highlights.append((row.status, self.submission.span(range_start, range_end)))
+        return highlights
+
+    def dirty_spans(self, dirty_ranges):
+        """Convert dirty token ranges to (line, col, line, col) spans"""
+        return [self.submission.span(s, e) for s, e in dirty_ranges]
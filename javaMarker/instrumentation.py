@@ -0,0 +1,130 @@
+"""Optional per-stage timing of grading runs.
+
+Code on the grading path wraps its stages in `with stage("name"):` and
+bumps counters with count(). Both do nothing unless a Timings collector
+is active in the current thread, so they can stay in hot paths. A run
+(one Calculate, one batch file, ...) creates a Timings, activates it in
+whichever threads do its work, and then reports it as JSON or as a one
+line summary.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage names used across the grader
+READ_FILE = "read_file"
+PARSE_SCHEME = "parse_scheme"
+NORMALIZE = "normalize"
+PARSE_SYNTAX = "parse_syntax"
+MATCH_ALL = "match_all"
+MATCH_CRITERION = "match_criterion"
+HIGHLIGHT = "highlight"
+SHOW_TEXT = "show_text"
+TABLE_UPDATE = "table_update"
+EXPORT = "export"
+
+# When set, the GUI appends every run's report to this JSON-lines file
+REPORT_ENV = "JAVAMARKER_TIMINGS"
+
+_local = threading.local()
+
+
+class Timings:
+    """Wall time and call count per stage, plus free-form counters, for one run"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.elapsed = None
+        self.stages = {}  # stage -> [seconds, calls]
+        self.counters = {}
+
+    def add(self, name, seconds, calls=1):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, report):
+        """Add the stages and counters of another run's report()"""
+        for name, entry in report['stages'].items():
+            self.add(name, entry['seconds'], entry['calls'])
+        for name, amount in report['counters'].items():
+            self.count(name, amount)
+
+    def finish(self):
+        """Stop the run's wall clock"""
+        self.elapsed = time.perf_counter() - self._start
+        return self
+
+    @contextmanager
+    def active(self):
+        """Collect stages from this thread into this run"""
+        previous = getattr(_local, 'timings', None)
+        _local.timings = self
+        try:
+            yield self
+        finally:
+            _local.timings = previous
+
+    def report(self):
+        """Return the run as a JSON-serializable dict"""
+        return {
+            'run': self.name,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'elapsed_s': self.elapsed,
+            'stages': {
+                name: {'seconds': seconds, 'calls': calls}
+                for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])
+            },
+            'counters': dict(self.counters),
+        }
+
+    def summary(self, limit=4):
+        """One line naming the slowest stages, for a status bar"""
+        parts = []
+        for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])[:limit]:
+            part = f"{name} {seconds * 1000:.0f} ms"
+            if calls > 1:
+                part += f" ({calls}x)"
+            parts.append(part)
+        total = f"{self.elapsed:.2f} s" if self.elapsed is not None else "running"
+        return f"{self.name} {total}: " + ", ".join(parts)
+
+    def append_to(self, path):
+        """Append the report as one JSON line"""
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.report()) + "\n")
+
+
+def current():
+    """Return the Timings active in this thread, or None"""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as one call of a stage of the active run"""
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def count(name, amount=1):
+    """Bump a counter of the active run"""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.count(name, amount)
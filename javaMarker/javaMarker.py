@@ -1,11 +1,38 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, simpledialog
-import re
 import os
-from difflib import Differ
-import pandas as pd
+import sys
+import multiprocessing
 from tkinter.scrolledtext import ScrolledText
-import xlsxwriter
+
+from grading_engine import (
+    NormalizedSubmission, ResultRow, DEFAULT_FUZZY_THRESHOLD, FUZZY_THRESHOLD, MANUAL_PREFIX,
+    STATUS_FOUND, STATUS_NOT_FOUND, STATUS_PARTIAL, matcher_for_rows
+)
+from background import TaskRunner
+from code_diff import diff_texts
+from highlighter import add_spans, group_by_tag, line_spans, remove_spans
+from incremental import IncrementalGrader, RegradeDelta
+from instrumentation import HIGHLIGHT, READ_FILE, REPORT_ENV, SHOW_TEXT, TABLE_UPDATE, Timings, stage
+from scheme_cache import load_scheme_file
+from session_journal import SessionJournal, session_key
+from submission_reader import read_submission, submission_name
+from result_export import write_results_excel, write_results_txt
+from results_store import ResultsStore
+from results_model import ResultsModel
+from virtual_table import VirtualTable
+
+# Lowest similarity still worth pointing out when a criterion is selected
+SEARCH_SIMILARITY = 0.5
+
+# Results table filters: label -> statuses shown (None shows every row)
+RESULT_FILTERS = {
+    "All": None,
+    "Needs review": (STATUS_NOT_FOUND, STATUS_PARTIAL),
+    "Not found": (STATUS_NOT_FOUND,),
+    "Partial": (STATUS_PARTIAL,),
+    "Found": (STATUS_FOUND,),
+}
 
 class JavaAssessmentGrader:
     def __init__(self, root):
@@ -22,11 +49,40 @@ class JavaAssessmentGrader:
         self.current_selection = {"scheme": "", "submission": ""}
         self.current_selection_pos = {"scheme": {"start": "", "end": ""}, "submission": {"start": "", "end": ""}}
         
+        # Grading state; the results table only renders it, keyed by the same ids
+        self.results = ResultsModel()
+        
+        # Submission normalized once and reused until its text changes
+        self.normalized_submission = None
+        
+        # Compiled form of the loaded marking scheme
+        self.compiled_scheme = None
+        
+        # Automaton over the current criteria, rebuilt only when they change
+        self.criteria_matcher = None
+        
+        # Previous grading run, so edits only re-evaluate the rows they affect
+        self.incremental_grader = IncrementalGrader(DEFAULT_FUZZY_THRESHOLD)
+        
+        # Partial credit for near-misses is off until the marker asks for it
+        self.partial_credit = tk.BooleanVar(value=DEFAULT_FUZZY_THRESHOLD is not None)
+        
         # Clipboard storage
         self.clipboard_content = ""
+        
+        # Loading, grading and exporting run in the background
+        self.tasks = TaskRunner(self.root, self.show_task_progress)
+        self.task_status = tk.StringVar(value="Ready")
+        self.idle_status = "Ready"
+        
+        # Journal of the current student's table, restored when they are reopened
+        self.session = None
+        self.loaded_scheme_text = None  # Scheme file contents, identifying the scheme in the results database
+        self.timing_status = tk.StringVar(value="")
 
         # Create UI with adjusted proportions
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def copy_selection(self):
         """Copy selected student code."""
@@ -46,10 +102,10 @@ class JavaAssessmentGrader:
             return
 
         item = selected[0]
-        values = self.results_tree.item(item, 'values')
+        row = self.results.get(item)
 
-        if values[5] == "not_found":  # Ensure we're pasting into a "Not Found" entry
-            allocated_marks = float(values[1])  # Convert allocated marks to float
+        if row.status in (STATUS_NOT_FOUND, STATUS_PARTIAL):  # Ensure we're pasting into a "Not Found" or near-miss entry
+            allocated_marks = row.allocated
 
             # Ask user for awarded marks
             awarded_marks = simpledialog.askfloat(
@@ -63,17 +119,17 @@ class JavaAssessmentGrader:
                 return
 
             # Update the grading table entry
-            self.results_tree.item(item, values=(
-                values[0],  # Assessment Criteria
-                allocated_marks,  # Allocated Marks
-                awarded_marks,  # User-entered Awarded Marks
-                "Reference code manually added",
-                self.clipboard_content,  # The pasted reference code
-                "found"  # Update status
-            ))
+            self.results.update(
+                item,
+                awarded=awarded_marks,  # User-entered Awarded Marks
+                comments="Reference code manually added",
+                reference=self.clipboard_content,  # The pasted reference code
+                status=STATUS_FOUND  # Update status
+            )
 
             # Remove "Not Found" highlighting
-            self.results_tree.item(item, tags=())  # Clear row highlight
+            self.results_table.rows_changed()
+            self.update_achieved_marks()
             self.marking_scheme_text.tag_remove('not_found', '1.0', tk.END)
 
             # Clear clipboard after pasting
@@ -104,11 +160,13 @@ class JavaAssessmentGrader:
         ttk.Label(file_frame, text="Student Submission:").grid(row=1, column=0, sticky="w", padx=5)
         ttk.Entry(file_frame, textvariable=self.student_submission_path, width=60).grid(row=1, column=1, padx=5)
         ttk.Button(file_frame, text="Browse", command=self.browse_student_submission, width=10).grid(row=1, column=2, padx=5)
+        ttk.Button(file_frame, text="Folder", command=self.browse_student_folder, width=10).grid(row=1, column=3, padx=5)
         
         # Student name and load button
         ttk.Label(file_frame, text="Student Name:").grid(row=2, column=0, sticky="w", padx=5)
         ttk.Entry(file_frame, textvariable=self.student_name, width=20).grid(row=2, column=1, sticky="w", padx=5)
-        ttk.Button(file_frame, text="Load Files", command=self.load_files, width=15).grid(row=2, column=2, padx=5)
+        self.load_btn = ttk.Button(file_frame, text="Load Files", command=self.load_files, width=15)
+        self.load_btn.grid(row=2, column=2, padx=5)
         
         # ========== Code Comparison Section ==========
         code_frame = ttk.Frame(main_container)
@@ -190,9 +248,15 @@ class JavaAssessmentGrader:
         right_btn_frame = ttk.Frame(action_frame)
         right_btn_frame.pack(side=tk.RIGHT, fill=tk.X, expand=True)
         
-        ttk.Button(right_btn_frame, text="Calculate", command=self.calculate_marks, width=12).pack(side=tk.LEFT, padx=2)
-        ttk.Button(right_btn_frame, text="Save TXT", command=self.save_results_txt, width=12).pack(side=tk.LEFT, padx=2)
-        ttk.Button(right_btn_frame, text="Save Excel", command=self.save_results_excel, width=12).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(right_btn_frame, text="Partial credit", variable=self.partial_credit,
+                        command=self.toggle_partial_credit).pack(side=tk.LEFT, padx=2)
+        # Disabled while a background task runs (see show_task_progress)
+        self.task_buttons = [self.load_btn]
+        for text, command in (("Calculate", self.calculate_marks), ("Save TXT", self.save_results_txt),
+                              ("Save Excel", self.save_results_excel), ("Save to DB", self.save_results_db)):
+            button = ttk.Button(right_btn_frame, text=text, command=command, width=12)
+            button.pack(side=tk.LEFT, padx=2)
+            self.task_buttons.append(button)
         
         # Marks display
         marks_frame = ttk.Frame(main_container)
@@ -207,25 +271,35 @@ class JavaAssessmentGrader:
         results_frame = ttk.LabelFrame(main_container, text="Grading Results", padding="5")
         results_frame.grid(row=4, column=0, sticky="nsew", pady=5)
         
-        # Treeview with scrollbars
+        # Status filter
+        filter_frame = ttk.Frame(results_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Show:").pack(side=tk.LEFT, padx=5)
+        self.results_filter = tk.StringVar(value="All")
+        filter_box = ttk.Combobox(filter_frame, textvariable=self.results_filter, values=list(RESULT_FILTERS),
+                                  state="readonly", width=15)
+        filter_box.pack(side=tk.LEFT)
+        filter_box.bind("<<ComboboxSelected>>",
+                        lambda event: self.results_table.set_filter(RESULT_FILTERS[self.results_filter.get()]))
+        
+        # Treeview with scrollbars; only the visible rows are materialized
         tree_container = ttk.Frame(results_frame)
         tree_container.pack(fill=tk.BOTH, expand=True)
         
-        tree_vscroll = ttk.Scrollbar(tree_container)
-        tree_vscroll.pack(side=tk.RIGHT, fill=tk.Y)
-        
         tree_hscroll = ttk.Scrollbar(tree_container, orient=tk.HORIZONTAL)
-        tree_hscroll.pack(side=tk.BOTTOM, fill=tk.X)
         
         # Configure results tree
-        self.results_tree = ttk.Treeview(
-            tree_container, 
+        self.results_table = VirtualTable(
+            tree_container,
+            self.results,
+            self.row_display,
             columns=('criteria', 'allocated', 'awarded', 'comments', 'reference', 'status'), 
             show='headings', 
             height=12,
-            yscrollcommand=tree_vscroll.set,
             xscrollcommand=tree_hscroll.set
         )
+        self.results_tree = self.results_table.tree
+        tree_hscroll.pack(side=tk.BOTTOM, fill=tk.X)
         
         # Configure columns
         self.results_tree.heading('criteria', text='Assessment Criteria')
@@ -247,8 +321,11 @@ class JavaAssessmentGrader:
         self.results_tree.heading('status', text='Status')
         self.results_tree.column('status', width=0, stretch=tk.NO)
         
+        # Heading clicks sort the rows
+        for column in ('criteria', 'allocated', 'awarded', 'comments'):
+            self.results_table.sortable(column, column)
+        
         self.results_tree.pack(fill=tk.BOTH, expand=True)
-        tree_vscroll.config(command=self.results_tree.yview)
         tree_hscroll.config(command=self.results_tree.xview)
         
         # Assign marks button
@@ -258,6 +335,18 @@ class JavaAssessmentGrader:
                                 command=self.assign_marks_to_selected, state=tk.DISABLED)
         self.assign_btn.pack(side=tk.LEFT, padx=5)
         
+        # ========== Status Bar ==========
+        status_frame = ttk.Frame(main_container)
+        status_frame.grid(row=5, column=0, sticky="ew")
+        
+        ttk.Label(status_frame, textvariable=self.task_status, font=('Arial', 9)).pack(side=tk.LEFT, padx=5)
+        ttk.Label(status_frame, textvariable=self.timing_status, font=('Arial', 8),
+                  foreground='gray40').pack(side=tk.LEFT, padx=10)
+        self.cancel_btn = ttk.Button(status_frame, text="Cancel", command=self.tasks.cancel, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT, padx=5)
+        self.task_progress = ttk.Progressbar(status_frame, length=200, mode='determinate')
+        self.task_progress.pack(side=tk.RIGHT, padx=5)
+        
         # Configure tags and bindings
         self.configure_tags_and_bindings()
 
@@ -283,12 +372,14 @@ class JavaAssessmentGrader:
         
         self.student_submission_text.tag_configure('selected', background='lightblue')
         self.student_submission_text.tag_configure('match', background='lightgreen')
+        self.student_submission_text.tag_configure('partial', background='khaki')
         self.student_submission_text.tag_configure('mismatch', background='pink')
         self.student_submission_text.tag_configure('missing', background='orange')
         self.student_submission_text.tag_configure('graded', background='#a0e0a0')
         self.student_submission_text.tag_configure('search', background='yellow')
         
         self.results_tree.tag_configure('not_found', background='#ffdddd')  # Light red
+        self.results_tree.tag_configure('partial', background='#fff2cc')  # Light yellow
             
     def on_text_select(self, event, source):
         """Handle text selection in either marking scheme or student submission"""
@@ -352,6 +443,32 @@ class JavaAssessmentGrader:
         submission_text.insert(tk.END, submission_sel)
         submission_text.config(state=tk.DISABLED)
         
+        # Lines only on one side, with the changed tokens in a stronger shade
+        scheme_text.tag_configure('diff_line', background='#ffe4e4')
+        scheme_text.tag_configure('diff_token', background='#ffaaaa')
+        submission_text.tag_configure('diff_line', background='#e4ffe4')
+        submission_text.tag_configure('diff_token', background='#99e699')
+        diff_status = tk.StringVar(value="Comparing...")
+        ttk.Label(compare_frame, textvariable=diff_status).pack(anchor=tk.W)
+        
+        def publish(diff):
+            if not compare_dialog.winfo_exists():
+                return
+            with stage(HIGHLIGHT):
+                add_spans(scheme_text, 'diff_line', line_spans(diff.removed_lines))
+                add_spans(scheme_text, 'diff_token', diff.removed_spans)
+                add_spans(submission_text, 'diff_line', line_spans(diff.added_lines))
+                add_spans(submission_text, 'diff_token', diff.added_spans)
+            diff_status.set(diff.summary())
+        
+        def failed(e):
+            if compare_dialog.winfo_exists():
+                diff_status.set(f"Comparison failed: {e}")
+        
+        # Large selections are diffed off the Tk thread
+        self.tasks.start("compare", lambda task: diff_texts(scheme_sel, submission_sel), publish, failed,
+                         label="Comparing selections")
+        
         # Comparison notes
         ttk.Label(compare_frame, text="Comparison Notes:", font=('Arial', 10, 'bold')).pack(anchor=tk.W)
         notes_entry = tk.Text(compare_frame, wrap=tk.WORD, height=5, font=('Arial', 10))
@@ -434,14 +551,16 @@ class JavaAssessmentGrader:
                     messagebox.showerror("Invalid Marks", "Awarded marks cannot exceed allocated marks")
                     return
                 
-                # Add to results tree
-                self.results_tree.insert('', tk.END, values=(
-                    f"Manual: {submission_sel[:50]}..." if len(submission_sel) > 50 else f"Manual: {submission_sel}",
+                # Add to results
+                item = self.results.append(ResultRow(
+                    f"{MANUAL_PREFIX} {submission_sel[:50]}..." if len(submission_sel) > 50 else f"{MANUAL_PREFIX} {submission_sel}",
                     allocated,
                     awarded,
                     comments,
                     scheme_sel[:50] + "..." if scheme_sel and len(scheme_sel) > 50 else scheme_sel
                 ))
+                self.results_table.refresh()
+                self.results_table.see(item)
 
                 ## Remove the `not_found` highlight in the marking scheme when grading occurs
                 sel_start = self.current_selection_pos["scheme"]["start"]
@@ -454,9 +573,8 @@ class JavaAssessmentGrader:
                 self.student_submission_text.tag_add('graded', sel_start, sel_end)
                 self.student_submission_text.tag_remove('not_found', sel_start, sel_end)
                 
-                # Update only achieved marks (not total marks)
-                current_achieved = self.achieved_marks.get()
-                self.achieved_marks.set(current_achieved + awarded)
+                # Update only achieved marks (manual rows don't count towards the total)
+                self.update_achieved_marks()
                 
                 # Clear selections
                 self.clear_selections()
@@ -484,9 +602,7 @@ class JavaAssessmentGrader:
         if not selected:
             return
         
-        item = selected[0]
-        values = self.results_tree.item(item, 'values')
-        reference = values[4] if len(values) > 4 else ""
+        reference = self.results.get(selected[0]).reference
         
         if not reference:
             messagebox.showinfo("No Reference", "No reference code available for this item")
@@ -528,8 +644,8 @@ class JavaAssessmentGrader:
             return
 
         item = selected[0]
-        current_values = self.results_tree.item(item, 'values')
-        allocated = float(current_values[1])
+        row = self.results.get(item)
+        allocated = row.allocated
 
         awarded = simpledialog.askfloat(
             "Edit Awarded Marks",
@@ -537,19 +653,12 @@ class JavaAssessmentGrader:
             parent=self.root,
             minvalue=0.0,
             maxvalue=allocated,
-            initialvalue=float(current_values[2])
+            initialvalue=row.awarded
         )
 
         if awarded is not None:
-            # Update the treeview with all 6 values
-            self.results_tree.item(item, values=(
-                current_values[0],
-                current_values[1],
-                awarded,
-                current_values[3],
-                current_values[4] if len(current_values) > 4 else "",
-                current_values[5] if len(current_values) > 5 else "found"
-            ))
+            self.results.update(item, awarded=awarded, status=row.status or STATUS_FOUND)
+            self.results_table.rows_changed()
 
         # Ensure achieved marks are recalculated
         self.update_achieved_marks()
@@ -561,33 +670,23 @@ class JavaAssessmentGrader:
             return
         
         item = selected[0]
-        current_values = self.results_tree.item(item, 'values')
+        row = self.results.get(item)
         
         comment = simpledialog.askstring(
             "Edit Comments",
             "Enter new comments:",
             parent=self.root,
-            initialvalue=current_values[3]
+            initialvalue=row.comments
         )
         
         if comment is not None:
-            # Update the treeview with all 6 values
-            self.results_tree.item(item, values=(
-                current_values[0],
-                current_values[1],
-                current_values[2],
-                comment,
-                current_values[4] if len(current_values) > 4 else "",
-                current_values[5] if len(current_values) > 5 else "found"
-            ))
+            self.results.update(item, comments=comment, status=row.status or STATUS_FOUND)
+            self.results_table.rows_changed()
     
     def update_achieved_marks(self):
-        """Recalculate achieved marks from treeview"""
-        total = 0.0
-        for item in self.results_tree.get_children():
-            awarded = float(self.results_tree.item(item, 'values')[2])
-            total += awarded
-        self.achieved_marks.set(total)
+        """Show the running totals of the results model"""
+        self.total_marks.set(self.results.total_marks)
+        self.achieved_marks.set(self.results.achieved_marks)
 
     def delete_selected_row(self):
         """Delete the selected row from the treeview"""
@@ -596,18 +695,22 @@ class JavaAssessmentGrader:
             return
         
         item = selected[0]
-        values = self.results_tree.item(item, 'values')
+        row = self.results.get(item)
         
         # Ask for confirmation
         if messagebox.askyesno("Confirm Delete", "Delete this grading entry?"):
             # If this was a manually graded item, we might need to remove highlighting
-            if values[0].startswith("Manual:"):
+            if row.is_manual:
                 # Find the reference in the student submission and remove 'graded' tag
-                student_code = values[0][7:].strip()  # Remove "Manual: " prefix
+                student_code = row.criteria[len(MANUAL_PREFIX):].strip()
                 self.remove_graded_highlight(student_code)
             
-            self.results_tree.delete(item)
+            self.results.remove(item)
+            self.results_table.refresh()
             self.update_achieved_marks()
+            
+            # Drop the deleted criteria's highlights
+            self.regrade_if_calculated()
     
     def remove_graded_highlight(self, code_snippet):
         """Remove graded highlighting from student submission text"""
@@ -650,9 +753,9 @@ class JavaAssessmentGrader:
     def edit_tree_cell(self, item, column):
         """Edit a specific cell in the treeview"""
         # Get current values
-        values = list(self.results_tree.item(item, 'values'))
-        col_index = int(column[1:]) - 1  # Convert #2 to 1, etc.
-        current_value = values[col_index]
+        row = self.results.get(item)
+        field = {"#2": 'allocated', "#3": 'awarded', "#4": 'comments'}[column]
+        current_value = getattr(row, field)
         
         # Get column bounding box
         x, y, width, height = self.results_tree.bbox(item, column)
@@ -673,8 +776,7 @@ class JavaAssessmentGrader:
                 try:
                     new_value = float(new_value)
                     if column == "#3":  # Awarded marks
-                        allocated = float(values[1])  # Get allocated marks from the row
-                        if new_value > allocated:
+                        if new_value > row.allocated:
                             messagebox.showerror("Error", "Awarded marks cannot exceed allocated marks")
                             entry.destroy()
                             return
@@ -683,14 +785,18 @@ class JavaAssessmentGrader:
                     entry.destroy()
                     return
             
-            # Update the treeview
-            values[col_index] = new_value
-            self.results_tree.item(item, values=values)
+            # Update the model and its row in the table
+            self.results.update(item, **{field: new_value})
+            self.results_table.rows_changed()
             
-            # Update achieved marks if awarded marks were changed
-            if column == "#3":
+            # Update totals if marks were changed
+            if column in ("#2", "#3"):
                 self.update_achieved_marks()
             
+            # Re-evaluate the row if its allocated marks changed
+            if column == "#2":
+                self.regrade_if_calculated()
+            
             entry.destroy()
         
         def cancel_edit(event=None):
@@ -703,88 +809,158 @@ class JavaAssessmentGrader:
     
     def browse_marking_scheme(self):
         filepath = filedialog.askopenfilename(
-            title="Select Marking Scheme Java File",
-            filetypes=(("Java files", "*.java"), ("All files", "*.*"))
+            title="Select Marking Scheme (Java, JSON or YAML File)",
+            filetypes=(("Marking schemes", "*.java *.json *.yaml *.yml"), ("Java files", "*.java"),
+                       ("Structured schemes", "*.json *.yaml *.yml"), ("All files", "*.*"))
         )
         if filepath:
             self.marking_scheme_path.set(filepath)
     
     def browse_student_submission(self):
         filepath = filedialog.askopenfilename(
-            title="Select Student Submission Java File",
-            filetypes=(("Java files", "*.java"), ("All files", "*.*"))
+            title="Select Student Submission (Java File or Zip Archive)",
+            filetypes=(("Java files and zip archives", "*.java *.zip"), ("Java files", "*.java"),
+                       ("Zip archives", "*.zip"), ("All files", "*.*"))
         )
         if filepath:
-            self.student_submission_path.set(filepath)
-            # Extract student name from filename as a default
-            filename = os.path.basename(filepath)
-            self.student_name.set(os.path.splitext(filename)[0])
+            self.set_student_submission(filepath)
+    
+    def browse_student_folder(self):
+        directory = filedialog.askdirectory(title="Select Student Project Folder")
+        if directory:
+            self.set_student_submission(directory)
+    
+    def set_student_submission(self, path):
+        self.student_submission_path.set(path)
+        # Extract student name from the file or folder name as a default
+        self.student_name.set(submission_name(path))
     
     def load_files(self):
         if not self.marking_scheme_path.get() or not self.student_submission_path.get():
             messagebox.showerror("Error", "Please select both marking scheme and student submission files")
             return
         
-        try:
-            # Load marking scheme
-            with open(self.marking_scheme_path.get(), 'r') as f:
-                marking_scheme_content = f.read()
-                self.marking_scheme_text.delete(1.0, tk.END)
-                self.marking_scheme_text.insert(tk.END, marking_scheme_content)
+        scheme_path = self.marking_scheme_path.get()
+        submission_path = self.student_submission_path.get()
+        timings = Timings("load")
+        
+        def work(task):
+            with timings.active():
+                # Load marking scheme (compiled form comes from the scheme cache)
+                task.report(0, 3, "Loading marking scheme")
+                marking_scheme_content, compiled_scheme = load_scheme_file(scheme_path)
+                
+                # Load student submission; a folder or zip archive is joined into one text
+                task.report(1, 3, "Loading student submission")
+                with stage(READ_FILE):
+                    student_content = read_submission(submission_path)
+                
+                # Tokenize it as the text widget will return it, with Tk's trailing newline
+                task.report(2, 3, "Tokenizing student submission")
+                submission = NormalizedSubmission(student_content + "\n")
+            return marking_scheme_content, compiled_scheme, student_content, submission
+        
+        def publish(result):
+            marking_scheme_content, self.compiled_scheme, student_content, self.normalized_submission = result
+            self.loaded_scheme_text = marking_scheme_content
+            with timings.active():
+                with stage(SHOW_TEXT):
+                    self.marking_scheme_text.delete(1.0, tk.END)
+                    self.marking_scheme_text.insert(tk.END, marking_scheme_content)
                 self.highlight_marks_in_scheme()
-            
-            # Load student submission
-            with open(self.student_submission_path.get(), 'r') as f:
-                student_content = f.read()
-                self.student_submission_text.delete(1.0, tk.END)
-                self.student_submission_text.insert(tk.END, student_content)
-            
-            # Parse marking scheme to get total marks
-            self.parse_marking_scheme()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load files: {str(e)}")
+                
+                with stage(SHOW_TEXT):
+                    self.student_submission_text.delete(1.0, tk.END)
+                    self.student_submission_text.insert(tk.END, student_content)
+                
+                # Parse marking scheme to get total marks
+                self.parse_marking_scheme()
+                self.open_session(marking_scheme_content, student_content)
+            self.finish_timings(timings)
+        
+        self.tasks.start("load", work, publish,
+                         lambda e: messagebox.showerror("Error", f"Failed to load files: {str(e)}"),
+                         label="Loading files")
     
     def highlight_marks_in_scheme(self):
         """Highlight mark allocations in the marking scheme"""
-        text = self.marking_scheme_text.get(1.0, tk.END)
-        self.marking_scheme_text.tag_remove('mark', 1.0, tk.END)
-        
-        # Find all marks in comments (format: // 1.0 or /* 1.0 */)
-        pattern = r'(//|/\*)\s*(\d+\.?\d*)\s*(?:\*/)?'
-        for match in re.finditer(pattern, text):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.marking_scheme_text.tag_add('mark', start, end)
+        with stage(HIGHLIGHT):
+            self.marking_scheme_text.tag_remove('mark', 1.0, tk.END)
+            add_spans(self.marking_scheme_text, 'mark', self.compiled_scheme.mark_spans)
     
     def parse_marking_scheme(self):
         """Parse the marking scheme to extract criteria and allocated marks"""
-        text = self.marking_scheme_text.get(1.0, tk.END)
-        
         # Clear previous results
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
-        
-        # Find all marks in comments and their context
-        pattern = r'(.*?)(//|/\*)\s*(\d+\.?\d*)\s*(?:\*/)?'
-        total = 0.0
-        for match in re.finditer(pattern, text):
-            criteria = match.group(1).strip()
-            mark = float(match.group(3))
-            total += mark
-            
-            # Add to treeview
-            self.results_tree.insert('', tk.END, values=(criteria, mark, 0.0, ""))
+        self.results = ResultsModel(self.compiled_scheme.new_rows())
+        with stage(TABLE_UPDATE):
+            self.results_table.set_model(self.results)
+            self.results_table.redraw()
+        self.incremental_grader.reset()
+        
+        self.criteria_matcher = self.compiled_scheme.matcher
         
-        self.total_marks.set(total)
+        self.update_achieved_marks()
     
-    def normalize_whitespace(self, code):
-        """Normalize whitespace in code for comparison"""
-        # Remove extra spaces, keep single spaces
-        code = re.sub(r'\s+', ' ', code)
-        # Remove spaces around special characters
-        code = re.sub(r'\s*([{}();,=+\-*/])\s*', r'\1', code)
-        return code.strip()
+    def open_session(self, scheme_text, student_text):
+        """Restore the saved table for this scheme and submission, and journal it from now on"""
+        self.close_session()
+        session = SessionJournal(session_key(scheme_text, student_text), info={
+            'scheme': self.marking_scheme_path.get(),
+            'submission': self.student_submission_path.get(),
+            'student': self.student_name.get(),
+        })
+        restored = session.restore()
+        if restored is not None:
+            self.results = restored
+            self.results_table.set_model(restored)
+            self.update_achieved_marks()
+            # The restored rows were graded against this submission, so the next
+            # Calculate only re-evaluates what changes and keeps the marker's awards
+            rules = self.criteria_matcher.rules if self.criteria_matcher is not None else {}
+            if self.incremental_grader.seed(restored.snapshot(), self.normalized_submission, rules):
+                self.show_restored_highlights()
+        try:
+            session.attach(self.results)
+        except OSError as e:
+            self.idle_status = f"Session not saved: {e}"
+            return
+        self.session = session
+        self.idle_status = "Restored previous session" if restored is not None else "Ready"
+    
+    def show_restored_highlights(self):
+        """Highlight a restored table as if its marks had just been calculated"""
+        with stage(HIGHLIGHT):
+            not_found_lines = [row.scheme_line for row in self.results.rows() if row.status == STATUS_NOT_FOUND]
+            add_spans(self.marking_scheme_text, 'not_found', line_spans(not_found_lines))
+            self.refresh_match_highlights(RegradeDelta([], [], True))
+    
+    def close_session(self):
+        """Stop journaling the current table, leaving a compact snapshot"""
+        if self.session is not None:
+            self.session.detach()
+            self.session = None
+    
+    def on_close(self):
+        self.tasks.cancel()
+        self.close_session()
+        self.root.destroy()
+    
+    def row_display(self, row):
+        """Return the results table values and tags for a model row"""
+        if row.status == STATUS_NOT_FOUND:
+            tags = ('not_found',)
+        elif row.status == STATUS_PARTIAL:
+            tags = ('partial',)
+        else:
+            tags = ()
+        return row.values(), tags
+    
+    def get_normalized_submission(self):
+        """Return the normalized submission, rebuilding it only if the text changed"""
+        student_text = self.student_submission_text.get(1.0, tk.END)
+        if self.normalized_submission is None or self.normalized_submission.original != student_text:
+            self.normalized_submission = NormalizedSubmission(student_text)
+        return self.normalized_submission
     
     def calculate_marks(self):
         """Compare student submission with marking scheme and calculate marks"""
@@ -792,91 +968,150 @@ class JavaAssessmentGrader:
             messagebox.showerror("Error", "Please load both files first")
             return
         
-        scheme_text = self.marking_scheme_text.get(1.0, tk.END)
-        student_text = self.student_submission_text.get(1.0, tk.END)
-        
-        # Clear previous highlighting
-        self.student_submission_text.tag_remove('match', 1.0, tk.END)
-        self.student_submission_text.tag_remove('mismatch', 1.0, tk.END)
-        self.student_submission_text.tag_remove('missing', 1.0, tk.END)
-        self.marking_scheme_text.tag_remove('not_found', 1.0, tk.END)
-        
-        achieved = 0.0
-        
-        # First sum up any manually awarded marks
-        for item in self.results_tree.get_children():
-            values = self.results_tree.item(item, 'values')
-            if values[0].startswith("Manual:"):  # This is a manually graded item
-                achieved += float(values[2])
-        
-        # Then add marks for automatically matched criteria
-        for item in self.results_tree.get_children():
-            values = self.results_tree.item(item, 'values')
-            criteria = values[0]
-            
-            # Skip manually added items
-            if criteria.startswith("Manual:"):
-                continue
+        timings = Timings("calculate")
+        
+        def prepare():
+            # Read when the task starts: a load queued ahead of it may have replaced all of this
+            scheme_text = self.marking_scheme_text.get(1.0, tk.END)
+            student_text = self.student_submission_text.get(1.0, tk.END)
+            # Only rows whose criteria changed or that the latest edits can affect are
+            # re-evaluated; the grader works on copies so it can tell what was edited
+            return (scheme_text, student_text, self.normalized_submission, self.criteria_matcher,
+                    self.results.snapshot(), self.incremental_grader.fork())
+        
+        def work(task):
+            scheme_text, student_text, submission, matcher, items_and_rows, grader = task.state
+            with timings.active():
+                task.report(0, None, "Tokenizing student submission")
+                if submission is None or submission.original != student_text:
+                    normalized = NormalizedSubmission(student_text)
+                else:
+                    normalized = submission
+                rows_matcher = matcher_for_rows([row for _, row in items_and_rows], matcher)
+                delta = grader.regrade(items_and_rows, normalized, scheme_text, rows_matcher, progress=task.report)
+            return normalized, rows_matcher, delta, items_and_rows, grader
+        
+        def publish(result):
+            self.normalized_submission, self.criteria_matcher, delta, items_and_rows, grader = result
+            self.incremental_grader = grader
+            with timings.active():
+                self.apply_regrade(dict(items_and_rows), delta)
+            self.finish_timings(timings)
+        
+        self.tasks.start("calculate", work, publish,
+                         lambda e: messagebox.showerror("Error", f"Failed to calculate marks: {str(e)}"),
+                         label="Calculating marks", prepare=prepare)
+    
+    def apply_regrade(self, rows_by_item, delta):
+        """Publish a finished regrade to the results model and the highlights"""
+        if delta.full:
+            # Clear previous highlighting
+            with stage(HIGHLIGHT):
+                self.student_submission_text.tag_remove('match', 1.0, tk.END)
+                self.student_submission_text.tag_remove('partial', 1.0, tk.END)
+                self.student_submission_text.tag_remove('mismatch', 1.0, tk.END)
+                self.student_submission_text.tag_remove('missing', 1.0, tk.END)
+                self.marking_scheme_text.tag_remove('not_found', 1.0, tk.END)
+        
+        not_found_lines = []
+        found_lines = []
+        with stage(TABLE_UPDATE):
+            for item in delta.changed:
+                row = rows_by_item[item]
+                if item not in self.results:
+                    continue  # Deleted while grading
+                self.results.replace(item, row.copy())
                 
-            allocated = float(values[1])
+                if row.status == STATUS_NOT_FOUND:
+                    not_found_lines.append(row.scheme_line)
+                else:
+                    found_lines.append(row.scheme_line)
             
-            # Normalize both the criteria and student code for comparison
-            norm_criteria = self.normalize_whitespace(criteria)
+            # Redraws only the visible rows, now so that it is part of the timing
+            self.results_table.rows_changed()
+            self.results_table.redraw()
+        
+        with stage(HIGHLIGHT):
+            # Highlight not-found code in marking scheme, one batch each way
+            if not delta.full:
+                remove_spans(self.marking_scheme_text, 'not_found', line_spans(found_lines))
+            add_spans(self.marking_scheme_text, 'not_found', line_spans(not_found_lines))
             
-            # Search for the normalized criteria in student code
-            student_code = self.normalize_whitespace(student_text)
-            
-            if norm_criteria and norm_criteria in student_code:
-                awarded = allocated
-                achieved += awarded
-                # Update with all 6 values (including empty reference and status)
-                self.results_tree.item(item, values=(
-                    criteria,
-                    allocated,
-                    awarded,
-                    "Found in submission",
-                    "",  # Empty reference
-                    "found"  # Status
-                ), tags=())
-                
-                # Highlight matching lines in student submission
-                self.highlight_matching_lines(criteria)
-            else:
-                # Update with all 6 values
-                self.results_tree.item(item, values=(
-                    criteria,
-                    allocated,
-                    0.0,
-                    "Not found in submission",
-                    "",  # Empty reference
-                    "not_found"  # Status
-                ), tags=('not_found',))
-                # Highlight not-found code in marking scheme
-                self.highlight_not_found_code(criteria)
-        
-        self.achieved_marks.set(achieved)
-        self.update_table_highlights()
-        
-    def update_table_highlights(self):
-        """Update highlighting for not found items"""
-        for item in self.results_tree.get_children():
-            values = self.results_tree.item(item, 'values')
-            if len(values) > 5 and values[5] == "not_found":
-                self.results_tree.item(item, tags=('not_found',))
-            else:
-                self.results_tree.item(item, tags=())
+            self.refresh_match_highlights(delta)
+        self.update_achieved_marks()
     
+    def refresh_match_highlights(self, delta):
+        """Re-apply submission highlights where the last regrade changed them"""
+        if delta.full:
+            highlights = self.incremental_grader.highlights()
+        else:
+            dirty_spans = self.incremental_grader.dirty_spans(delta.dirty_ranges)
+            remove_spans(self.student_submission_text, 'match', dirty_spans)
+            remove_spans(self.student_submission_text, 'partial', dirty_spans)
+            highlights = self.incremental_grader.highlights(delta.dirty_ranges)
+        
+        # Near-misses get their own colour for review
+        grouped = group_by_tag(('partial' if status == STATUS_PARTIAL else 'match', span)
+                               for status, span in highlights)
+        for tag, spans in grouped.items():
+            self.highlight_matching_lines(spans, tag)
+    
+    def finish_timings(self, timings):
+        """Show a finished run's slowest stages and log it if JAVAMARKER_TIMINGS is set"""
+        timings.finish()
+        self.timing_status.set(timings.summary())
+        report_path = os.environ.get(REPORT_ENV)
+        if report_path:
+            try:
+                timings.append_to(report_path)
+            except OSError:
+                pass  # Timing reports are best-effort
+    
+    def show_task_progress(self, task):
+        """Show the running background task in the status bar"""
+        if task is None:
+            self.task_status.set(self.idle_status)
+            self.task_progress.config(mode='determinate', value=0)
+            self.cancel_btn.config(state=tk.DISABLED)
+            for button in self.task_buttons:
+                button.config(state=tk.NORMAL)
+            return
+        
+        # Loading, grading and saving wait for the running task instead of queueing behind it
+        for button in self.task_buttons:
+            button.config(state=tk.DISABLED)
+        done, total, message = task.progress or (0, None, None)
+        queued = ", ".join(queued_task.label for queued_task in self.tasks.queued)
+        self.task_status.set(f"{message or task.label}..." + (f" (then: {queued})" if queued else ""))
+        if total:
+            self.task_progress.config(mode='determinate', maximum=total, value=done)
+        else:
+            self.task_progress.config(mode='indeterminate')
+            self.task_progress.step(5)
+        self.cancel_btn.config(state=tk.NORMAL)
+    
+    def toggle_partial_credit(self):
+        """Switch partial credit for near-misses on or off; exact matches keep their marks"""
+        threshold = FUZZY_THRESHOLD if self.partial_credit.get() else DEFAULT_FUZZY_THRESHOLD
+        self.incremental_grader.set_fuzzy_threshold(threshold)
+        self.regrade_if_calculated()
+    
+    def regrade_if_calculated(self):
+        """Re-evaluate the rows affected by an edit once marks have been calculated"""
+        if self.incremental_grader.submission is not None:
+            self.calculate_marks()
+        
     def on_result_click(self, event):
         """Handle clicks on results table"""
         item = self.results_tree.identify_row(event.y)
         if item:
-            values = self.results_tree.item(item, 'values')
-            if len(values) > 5 and values[5] == "not_found":
-                # Enable assign button for not found items
+            row = self.results.get(item)
+            if row.status in (STATUS_NOT_FOUND, STATUS_PARTIAL):
+                # Enable assign button for not found and near-miss items
                 self.assign_btn.config(state=tk.NORMAL)
                 self.current_not_found_item = item
                 # Highlight corresponding code in submission
-                self.highlight_criteria_in_submission(values[0])
+                self.highlight_criteria_in_submission(row.criteria)
             else:
                 self.assign_btn.config(state=tk.DISABLED)
                 self.current_not_found_item = None
@@ -884,24 +1119,22 @@ class JavaAssessmentGrader:
     def highlight_criteria_in_submission(self, criteria):
         """Highlight where criteria might exist in submission"""
         self.student_submission_text.tag_remove('search', '1.0', tk.END)
+        if self.criteria_matcher is not None and criteria in self.criteria_matcher.rules:
+            return  # A structured scheme's criterion is a name, not code to search for
         
-        norm_criteria = self.normalize_whitespace(criteria)
-        student_text = self.student_submission_text.get('1.0', tk.END)
-        
-        # Find approximate matches
-        start_idx = '1.0'
-        while True:
-            start_idx = self.student_submission_text.search(
-                norm_criteria, 
-                start_idx, 
-                stopindex=tk.END,
-                nocase=True
-            )
-            if not start_idx:
-                break
-            end_idx = f"{start_idx}+{len(norm_criteria)}c"
-            self.student_submission_text.tag_add('search', start_idx, end_idx)
-            start_idx = end_idx
+        submission = self.get_normalized_submission()
+        
+        # Find case-insensitive matches in the tokenized submission, falling
+        # back to the most similar region
+        spans = submission.find_spans(criteria, nocase=True)
+        if not spans:
+            near_miss = submission.closest_match(criteria, SEARCH_SIMILARITY)
+            if near_miss is not None:
+                spans = [submission.span(near_miss.start, near_miss.end)]
+        
+        add_spans(self.student_submission_text, 'search', spans)
+        if spans:
+            self.student_submission_text.see(f"{spans[0][0]}.{spans[0][1]}")
         
         self.student_submission_text.tag_config('search', background='yellow')
     
@@ -911,8 +1144,7 @@ class JavaAssessmentGrader:
             return
         
         item = self.current_not_found_item
-        values = self.results_tree.item(item, 'values')
-        allocated = float(values[1])
+        allocated = self.results.get(item).allocated
         
         # Ask for awarded marks
         awarded = simpledialog.askfloat(
@@ -932,15 +1164,14 @@ class JavaAssessmentGrader:
             except tk.TclError:
                 selected_code = "Manually assigned"
             
-            # Update the treeview
-            self.results_tree.item(item, values=(
-                values[0],
-                values[1],
-                awarded,
-                f"Manually assigned: {selected_code[:50]}..." if len(selected_code) > 50 else f"Manually assigned: {selected_code}",
-                values[4],
-                "found"  # Update status
-            ), tags=())
+            # Update the model and its table row
+            self.results.update(
+                item,
+                awarded=awarded,
+                comments=f"Manually assigned: {selected_code[:50]}..." if len(selected_code) > 50 else f"Manually assigned: {selected_code}",
+                status=STATUS_FOUND  # Update status
+            )
+            self.results_table.rows_changed()
             
             # Clear highlights
             self.student_submission_text.tag_remove('search', '1.0', tk.END)
@@ -949,32 +1180,9 @@ class JavaAssessmentGrader:
             self.update_achieved_marks()
             self.assign_btn.config(state=tk.DISABLED)
 
-    def highlight_not_found_code(self, criteria):
-        """Highlight code in marking scheme that wasn't found in student submission"""
-        scheme_text = self.marking_scheme_text.get(1.0, tk.END)
-        
-        # Find the line containing the criteria
-        for line_num, line in enumerate(scheme_text.splitlines(), 1):
-            if criteria.strip() in line:
-                start = f"{line_num}.0"
-                end = f"{line_num}.end"
-                self.marking_scheme_text.tag_add('not_found', start, end)
-                break 
-
-    def highlight_matching_lines(self, criteria):
-        """Highlight lines in student submission that match the criteria"""
-        student_text = self.student_submission_text.get(1.0, tk.END)
-        
-        # Normalize the criteria for comparison
-        norm_criteria = self.normalize_whitespace(criteria)
-        
-        # Search through each line of student code
-        for line_num, line in enumerate(student_text.splitlines(), 1):
-            norm_line = self.normalize_whitespace(line)
-            if norm_criteria and norm_criteria in norm_line:
-                start = f"{line_num}.0"
-                end = f"{line_num}.end"
-                self.student_submission_text.tag_add('match', start, end)
+    def highlight_matching_lines(self, spans, tag='match'):
+        """Highlight matched spans in student submission"""
+        add_spans(self.student_submission_text, tag, spans)
     
     def save_results_txt(self):
         """Save grading results to a text file"""
@@ -993,20 +1201,14 @@ class JavaAssessmentGrader:
             return
         
         try:
-            with open(filepath, 'w') as f:
-                f.write(f"Student: {self.student_name.get()}\n")
-                f.write(f"Submission: {os.path.basename(self.student_submission_path.get())}\n")
-                f.write(f"Total Marks: {self.total_marks.get()}\n")
-                f.write(f"Achieved Marks: {self.achieved_marks.get()}\n\n")
-                f.write("Detailed Breakdown:\n")
-                f.write("-" * 80 + "\n")
-                
-                for item in self.results_tree.get_children():
-                    criteria, allocated, awarded, comments = self.results_tree.item(item, 'values')
-                    f.write(f"Criteria: {criteria}\n")
-                    f.write(f"Allocated: {allocated}\tAwarded: {awarded}\n")
-                    f.write(f"Comments: {comments}\n")
-                    f.write("-" * 80 + "\n")
+            write_results_txt(
+                filepath,
+                self.student_name.get(),
+                self.student_submission_path.get(),
+                self.results.total_marks,
+                self.results.achieved_marks,
+                self.results.rows()
+            )
             
             messagebox.showinfo("Success", f"Results saved to {filepath}")
         except Exception as e:
@@ -1028,151 +1230,70 @@ class JavaAssessmentGrader:
         if not filepath:
             return
 
-        try:
-            # Extract data for detailed breakdown
-            detailed_data = {
-                'Criteria': [],
-                'Allocated Marks': [],
-                'Awarded Marks': [],
-                'Comments': [],
-                'Student Submission': []
-            }
-
-            total_allocated = 0.0
-            total_awarded = 0.0
-
-            # First pass: collect all manual grading entries and map them to their criteria
-            manual_grades = {}  # Dictionary to store manually graded items
-            for item in self.results_tree.get_children():
-                values = self.results_tree.item(item, 'values')
-                criteria = values[0]
-
-                if criteria.startswith("Manual:"):
-                    # Extract the reference criteria from either the reference field or the manual comment
-                    reference_criteria = values[4] if len(values) > 4 and values[4] else criteria[7:].strip()
-                    if reference_criteria:  # Only process if we have a reference
-                        manual_grades[reference_criteria] = {
-                            'allocated': float(values[1]),
-                            'awarded': float(values[2]),
-                            'comments': values[3],
-                            'student_submission': criteria[7:].strip()  # The actual student code
-                        }
-
-            # Second pass: process all items
-            for item in self.results_tree.get_children():
-                values = self.results_tree.item(item, 'values')
-                criteria = values[0]
-                
-                # Skip manual grading entries as we've already processed them
-                if criteria.startswith("Manual:"):
-                    continue
-                    
-                allocated = float(values[1])
-                awarded = float(values[2])
-                comments = values[3]
-                student_submission = "-"
-
-                # Check if this criteria has a manual grade
-                if criteria in manual_grades:
-                    # Use the manually graded values
-                    allocated = manual_grades[criteria]['allocated']
-                    awarded = manual_grades[criteria]['awarded']
-                    comments = manual_grades[criteria]['comments']
-                    student_submission = manual_grades[criteria]['student_submission']
-                elif awarded > 0:
-                    # This was automatically matched
-                    student_submission = criteria
+        timings = Timings("export")
 
-                total_allocated += allocated
-                total_awarded += awarded
-
-                detailed_data['Criteria'].append(criteria)
-                detailed_data['Allocated Marks'].append(allocated)
-                detailed_data['Awarded Marks'].append(awarded)
-                detailed_data['Comments'].append(comments)
-                detailed_data['Student Submission'].append(student_submission)
-
-            # Add any manual grades that didn't match existing criteria (shouldn't happen but just in case)
-            for ref_criteria, grade_info in manual_grades.items():
-                if ref_criteria not in detailed_data['Criteria']:
-                    detailed_data['Criteria'].append(ref_criteria)
-                    detailed_data['Allocated Marks'].append(grade_info['allocated'])
-                    detailed_data['Awarded Marks'].append(grade_info['awarded'])
-                    detailed_data['Comments'].append(grade_info['comments'])
-                    detailed_data['Student Submission'].append(grade_info['student_submission'])
-                    total_allocated += grade_info['allocated']
-                    total_awarded += grade_info['awarded']
-
-            # Create DataFrame
-            df_detailed = pd.DataFrame(detailed_data)
+        def work(task):
+            # Written next to the target and renamed, so a cancelled or failed
+            # export never leaves a half-written workbook behind
+            partial_path = filepath + ".partial"
+            try:
+                with timings.active():
+                    write_results_excel(partial_path, task.state, progress=task.report)
+                os.replace(partial_path, filepath)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
 
-            # Append summary row
-            summary_row = pd.DataFrame([{
-                'Criteria': 'TOTAL',
-                'Allocated Marks': total_allocated,
-                'Awarded Marks': total_awarded,
-                'Comments': '',
-                'Student Submission': ''
-            }])
+        def publish(result):
+            self.finish_timings(timings)
+            messagebox.showinfo("Success", f"Results saved to {filepath}")
 
-            df_detailed = pd.concat([df_detailed, summary_row], ignore_index=True)
+        self.tasks.start("export", work, publish,
+                         lambda e: messagebox.showerror("Error", f"Failed to save Excel file: {str(e)}"),
+                         label="Saving Excel file",
+                         prepare=lambda: [row.copy() for row in self.results.rows()])
 
-            # Save to Excel with xlsxwriter for formatting
-            with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
-                df_detailed.to_excel(writer, sheet_name='Grading Results', index=False)
-                
-                # Get the workbook and worksheet objects
-                workbook = writer.book
-                worksheet = writer.sheets['Grading Results']
-                
-                # Define formats
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#D7E4BC',
-                    'border': 1
-                })
-                
-                # Highlight manually graded rows
-                manual_format = workbook.add_format({'bg_color': '#FFF2CC'})
-                
-                # Apply the header format
-                for col_num, value in enumerate(df_detailed.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-                    
-                # Apply formatting and auto-adjust column widths
-                for i, col in enumerate(df_detailed.columns):
-                    max_len = max((
-                        df_detailed[col].astype(str).map(len).max(),
-                        len(col)
-                    )) + 2  # Add a little extra space
-                    worksheet.set_column(i, i, max_len)
-                    
-                    # Highlight manually graded rows
-                    if col == 'Student Submission':
-                        for row_num in range(1, len(df_detailed)+1):
-                            if df_detailed.at[row_num-1, col] != "-" and df_detailed.at[row_num-1, col] != df_detailed.at[row_num-1, 'Criteria']:
-                                worksheet.set_row(row_num, None, manual_format)
+    def save_results_db(self):
+        """Save the student's results to the cohort results database"""
+        if self.loaded_scheme_text is None:
+            messagebox.showerror("Error", "Please load both files first")
+            return
+        if not self.student_name.get():
+            messagebox.showerror("Error", "Please enter student name")
+            return
 
-            messagebox.showinfo("Success", f"Results saved to {filepath}")
+        def prepare():
+            # Taken when the save starts, so a calculation queued ahead of it is included
+            summary = {
+                'student': self.student_name.get(),
+                'file': self.student_submission_path.get(),
+                'total_marks': self.results.total_marks,
+                'achieved_marks': self.results.achieved_marks,
+                'error': None,
+                'rows': [row.to_dict() for row in self.results.rows()],
+            }
+            return self.loaded_scheme_text, os.path.basename(self.marking_scheme_path.get()), summary
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save Excel file: {str(e)}")
+        def work(task):
+            scheme_text, scheme_name, summary = task.state
+            with ResultsStore() as store:
+                store.save(store.scheme_id(scheme_text, scheme_name), [summary])
+            return store.path
 
-    def update_achieved_marks(self):
-        """Recalculate achieved marks from treeview"""
-        total = 0.0
-        for item in self.results_tree.get_children():
-            values = self.results_tree.item(item, 'values')
-            try:
-                awarded = float(values[2]) if values[2] else 0.0
-                total += awarded
-            except (ValueError, IndexError):
-                continue
-        self.achieved_marks.set(total)
+        self.tasks.start("save_db", work,
+                         lambda path: messagebox.showinfo("Success", f"Results saved to {path}"),
+                         lambda e: messagebox.showerror("Error", f"Failed to save to the results database: {str(e)}"),
+                         label="Saving to results database", prepare=prepare)
 
 if __name__ == "__main__":
+    # Needed for the process pool in the frozen dist/javaMarker.exe build
+    multiprocessing.freeze_support()
+    
+    # Command-line batch grading: javaMarker.py SCHEME SUBMISSIONS_DIR [options]
+    if len(sys.argv) > 1:
+        from batch_grader import main
+        sys.exit(main(sys.argv[1:]))
+    
     root = tk.Tk()
     app = JavaAssessmentGrader(root)
     root.mainloop()
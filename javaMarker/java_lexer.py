@@ -0,0 +1,82 @@
+"""Streaming Java lexer.
+
+tokenize() walks the source once and yields compact Token tuples. Comments
+and string/char/text-block literals come out as separate tokens, so
+whitespace inside literals is preserved and commented-out code is never
+mistaken for real code. Matching runs on the token texts instead of on a
+regex-rewritten copy of the source.
+"""
+import re
+from collections import namedtuple
+
+Token = namedtuple('Token', 'kind text start end')
+
+IDENTIFIER = 'identifier'
+KEYWORD = 'keyword'
+NUMBER = 'number'
+STRING = 'string'
+CHAR = 'char'
+TEXT_BLOCK = 'text_block'
+OPERATOR = 'operator'
+SEPARATOR = 'separator'
+COMMENT = 'comment'
+UNKNOWN = 'unknown'
+
+KEYWORDS = frozenset("""
+    abstract assert boolean break byte case catch char class const continue
+    default do double else enum extends final finally float for goto if
+    implements import instanceof int interface long native new package
+    private protected public return short static strictfp super switch
+    synchronized this throw throws transient try void volatile while
+    true false null var record yield sealed permits
+""".split())
+
+OPERATORS = (
+    '>>>=', '<<=', '>>=', '>>>', '->', '++', '--', '&&', '||', '==', '!=',
+    '<=', '>=', '+=', '-=', '*=', '/=', '&=', '|=', '^=', '%=', '<<', '>>',
+    '=', '>', '<', '!', '~', '?', ':', '+', '-', '*', '/', '&', '|', '^', '%',
+)
+
+SEPARATORS = ('...', '::', '(', ')', '{', '}', '[', ']', ';', ',', '.', '@')
+
+_OPERATOR_SET = frozenset(OPERATORS)
+
+_TOKEN_PATTERN = re.compile(r'''
+    (?P<whitespace>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<text_block>"""(?:\\.|.)*?(?:"""|\Z))
+  | (?P<string>"(?:\\.|[^"\\\n])*"?)
+  | (?P<char>'(?:\\.|[^'\\\n])*'?)
+  | (?P<number>
+        0[xX][0-9a-fA-F_]+[lL]?
+      | 0[bB][01_]+[lL]?
+      | (?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?[fFdDlL]?
+    )
+  | (?P<identifier>(?:[^\W\d]|\$)[\w$]*)
+  | (?P<punctuation>%s)
+  | (?P<unknown>.)
+''' % '|'.join(
+    # Longest first so that e.g. '>>>=' wins over '>>' and '::' over ':'
+    re.escape(text) for text in sorted(OPERATORS + SEPARATORS, key=len, reverse=True)
+), re.DOTALL | re.VERBOSE)
+
+
+def tokenize(source, include_comments=True):
+    """Yield Token(kind, text, start, end) for the source, skipping whitespace"""
+    for match in _TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind == 'whitespace':
+            continue
+        if kind == COMMENT and not include_comments:
+            continue
+        text = match.group()
+        if kind == IDENTIFIER and text in KEYWORDS:
+            kind = KEYWORD
+        elif kind == 'punctuation':
+            kind = OPERATOR if text in _OPERATOR_SET else SEPARATOR
+        yield Token(kind, text, match.start(), match.end())
+
+
+def code_symbols(source):
+    """Return the texts of the code tokens (comments dropped) as a tuple"""
+    return tuple(token.text for token in tokenize(source, include_comments=False))
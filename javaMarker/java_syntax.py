@@ -0,0 +1,896 @@
+"""Lightweight Java syntax trees for structural criteria.
+
+Token and text matchers can't credit equivalent code written another
+way: modifiers in a different order, `i++` for `i += 1`, a loop body with
+or without braces, or a method declared further down the class. parse()
+reads a file's code tokens into a small tree of the constructs criteria
+ask about, and a StructureQuery (a structured scheme's `structure`
+matcher) is a tree pattern evaluated against it.
+
+The parser is forgiving recursive descent. Declarations and statements
+are parsed properly; expressions are only scanned for method calls,
+object creation, assignments and lambda bodies. Anything it doesn't
+understand is skipped to the next `;` or past a balanced bracket, so
+half-finished code still gives a useful tree. Equivalent spellings give
+the same tree: modifiers are a set, blocks are transparent, and `i++`,
+`++i`, `i += 1` and `i = i + 1` are all an 'assign' node for `i` with
+variant '+=' and value '1'.
+
+Each file is parsed once and its tree memoized by its tokens, so all
+structural criteria share one parse per submission, and an edit to one
+file of a project reparses only that file.
+"""
+import hashlib
+import re
+from fnmatch import fnmatchcase
+
+from instrumentation import PARSE_SYNTAX, count, stage
+from java_lexer import KEYWORDS, code_symbols
+from storage import LRUCache
+
+PARSE_CACHE_SIZE = 128
+
+MODIFIERS = frozenset(('public', 'protected', 'private', 'static', 'final', 'abstract', 'synchronized',
+                       'native', 'transient', 'volatile', 'strictfp', 'default', 'sealed'))
+PRIMITIVE_TYPES = frozenset(('boolean', 'byte', 'char', 'short', 'int', 'long', 'float', 'double', 'void'))
+ASSIGNMENT_OPERATORS = frozenset(('=', '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=', '>>>='))
+LOOP_VARIANTS = ('for', 'foreach', 'while', 'do')
+
+# Keywords that may still be used as names
+_CONTEXTUAL_KEYWORDS = frozenset(('var', 'record', 'yield', 'sealed', 'permits'))
+_NAME = re.compile(r'(?:[^\W\d]|\$)[\w$]*$')
+_OPENERS = frozenset(('(', '[', '{'))
+_CLOSERS = frozenset((')', ']', '}'))
+_CLASS_KEYWORDS = frozenset(('class', 'interface', 'enum'))
+_GENERIC_DEPTH = {'<': 1, '>': -1, '>>': -2, '>>>': -3}
+_TYPE_ARGUMENT_SYMBOLS = frozenset((',', '?', '.', '[', ']', '&', 'extends', 'super'))
+# `x = x OP y` is the same update as `x OP= y`; for these also `x = y OP x`
+_BINARY_OPERATORS = frozenset(('+', '-', '*', '/', '%', '&', '|', '^', '<<', '>>', '>>>'))
+_COMMUTATIVE_OPERATORS = frozenset(('+', '*', '&', '|', '^'))
+_WORD_EDGE = re.compile(r'[\w$]')
+
+_parse_cache = LRUCache(PARSE_CACHE_SIZE)
+
+
+def is_name(symbol):
+    """True if the token can be an identifier"""
+    return bool(_NAME.match(symbol)) and (symbol not in KEYWORDS or symbol in _CONTEXTUAL_KEYWORDS)
+
+
+def join_symbols(symbols):
+    """Token texts as one string, spaced only where two words would run together"""
+    pieces = []
+    for symbol in symbols:
+        if pieces and _WORD_EDGE.match(pieces[-1][-1]) and _WORD_EDGE.match(symbol[0]):
+            pieces.append(' ')
+        pieces.append(symbol)
+    return ''.join(pieces)
+
+
+def _single_operand(symbols):
+    """True if the tokens are one operand: a single token or one parenthesized group"""
+    if len(symbols) == 1:
+        return True
+    if not symbols or symbols[0] != '(':
+        return False
+    depth = 0
+    for index, symbol in enumerate(symbols):
+        if symbol in _OPENERS:
+            depth += 1
+        elif symbol in _CLOSERS:
+            depth -= 1
+            if depth == 0:
+                return index == len(symbols) - 1
+    return False
+
+
+class SyntaxNode:
+    """One construct of a syntax tree.
+
+    `kind` is 'unit' (a file), 'class' (also interface, enum, record and
+    annotation type, named by `variant`), 'method', 'constructor',
+    'initializer', 'field', 'variable', 'loop' (`variant` for, foreach,
+    while or do), 'if', 'switch', 'try', 'return', 'call' (with the
+    qualifier before the name in `target`), 'new' or 'assign' (`variant`
+    is the operator). `type` is the declared, returned or created type, or
+    the superclass of a class. [start, end) is the token range of the
+    whole construct and [start, head_end) the part worth highlighting,
+    e.g. a method's signature; indexes are relative to the file.
+    """
+
+    __slots__ = ('kind', 'name', 'variant', 'type', 'modifiers', 'params', 'value', 'target',
+                 'start', 'head_end', 'end', 'children')
+
+    def __init__(self, kind, start, name=None):
+        self.kind = kind
+        self.name = name
+        self.variant = None
+        self.type = None
+        self.modifiers = frozenset()
+        self.params = ()
+        self.value = None
+        self.target = None
+        self.start = start
+        self.head_end = start + 1
+        self.end = start + 1
+        self.children = []
+
+    def walk(self):
+        """Yield every node below this one, depth first"""
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def __repr__(self):
+        return f"SyntaxNode({self.kind!r}, {self.name!r}, variant={self.variant!r}, type={self.type!r})"
+
+
+class _Parser:
+    """Recursive descent over one file's code symbols"""
+
+    def __init__(self, symbols):
+        self.s = symbols
+        self.n = len(symbols)
+
+    def at(self, i):
+        return self.s[i] if 0 <= i < self.n else ''
+
+    def add(self, parent, kind, start, name=None):
+        node = SyntaxNode(kind, start, name)
+        parent.children.append(node)
+        return node
+
+    # ---- Token-level helpers ----
+
+    def skip_balanced(self, i):
+        """Index after the bracket group opening at i, or the end of the file"""
+        depth = 0
+        while i < self.n:
+            symbol = self.s[i]
+            if symbol in _OPENERS:
+                depth += 1
+            elif symbol in _CLOSERS:
+                depth -= 1
+                if depth <= 0:
+                    return i + 1
+            i += 1
+        return i
+
+    def skip_generic(self, i):
+        """Index after the type arguments or parameters opening at i"""
+        depth = 0
+        while i < self.n:
+            depth += _GENERIC_DEPTH.get(self.s[i], 0)
+            i += 1
+            if depth <= 0:
+                break
+        return i
+
+    def statement_end(self, i):
+        """Index of the ';' ending the statement at i, or of the closer after it"""
+        while i < self.n:
+            symbol = self.s[i]
+            if symbol == ';' or symbol in _CLOSERS:
+                return i
+            if symbol in _OPENERS:
+                i = self.skip_balanced(i)  # Lambda bodies, anonymous classes, array initializers
+            else:
+                i += 1
+        return i
+
+    def expression_end(self, i, hi):
+        """Index of the ',', ';' or unmatched closer ending the expression at i"""
+        while i < hi:
+            symbol = self.s[i]
+            if symbol in _CLOSERS or symbol in (',', ';'):
+                return i
+            if symbol in _OPENERS:
+                i = self.skip_balanced(i)
+            else:
+                i += 1
+        return min(i, hi)
+
+    def split(self, lo, hi, separator, generics=False):
+        """Yield the (start, end) parts of [lo, hi) between separators outside brackets"""
+        depth = 0
+        start = lo
+        for i in range(lo, hi):
+            symbol = self.s[i]
+            if symbol in _OPENERS:
+                depth += 1
+            elif symbol in _CLOSERS:
+                depth -= 1
+            elif generics and symbol in _GENERIC_DEPTH:
+                depth += _GENERIC_DEPTH[symbol]
+            elif symbol == separator and depth == 0:
+                yield start, i
+                start = i + 1
+        if start < hi:
+            yield start, hi
+
+    def skip_annotation(self, i):
+        i += 1
+        while is_name(self.at(i)) or self.at(i) == '.':
+            i += 1
+        if self.at(i) == '(':
+            i = self.skip_balanced(i)
+        return i
+
+    def parse_modifiers(self, i):
+        """Return (modifier set, index after the modifiers and annotations)"""
+        modifiers = set()
+        while True:
+            symbol = self.at(i)
+            if symbol in MODIFIERS:
+                modifiers.add(symbol)
+                i += 1
+            elif symbol == '@' and self.at(i + 1) != 'interface':
+                i = self.skip_annotation(i)
+            else:
+                return frozenset(modifiers), i
+
+    def parse_type(self, i):
+        """Return (type text, index after it), or (None, i) if no type starts at i"""
+        symbol = self.at(i)
+        if not (symbol in PRIMITIVE_TYPES or is_name(symbol)):
+            return None, i
+        j = i + 1
+        while self.at(j) == '.' and is_name(self.at(j + 1)):
+            j += 2
+        if self.at(j) == '<':
+            depth = 0
+            k = j
+            while k < self.n:
+                symbol = self.s[k]
+                if symbol in _GENERIC_DEPTH:
+                    depth += _GENERIC_DEPTH[symbol]
+                elif not (is_name(symbol) or symbol in PRIMITIVE_TYPES or symbol in _TYPE_ARGUMENT_SYMBOLS):
+                    return None, i
+                k += 1
+                if depth <= 0:
+                    break
+            if depth != 0:
+                return None, i  # e.g. the comparison in `a < b`
+            j = k
+        while self.at(j) == '[' and self.at(j + 1) == ']':
+            j += 2
+        if self.at(j) == '...':
+            j += 1
+        return join_symbols(self.s[i:j]), j
+
+    # ---- Declarations ----
+
+    def parse_unit(self):
+        root = SyntaxNode('unit', 0)
+        root.head_end = root.end = self.n
+        i = 0
+        while i < self.n:
+            symbol = self.s[i]
+            if symbol in ('package', 'import'):
+                i = self.statement_end(i) + 1
+                continue
+            if symbol in _CLOSERS:
+                i += 1  # Unbalanced code
+                continue
+            # Snippets without a class may hold bare methods and statements
+            j = self.parse_member(i, root)
+            if j is None:
+                j = self.parse_statement(i, root)
+            i = max(j, i + 1)
+        return root
+
+    def parse_member(self, i, parent):
+        """Parse the declaration at i into parent; returns the index after it, or None if there is none"""
+        start = i
+        if self.at(i) == ';':
+            return i + 1
+        modifiers, i = self.parse_modifiers(i)
+        symbol = self.at(i)
+        if (symbol in _CLASS_KEYWORDS or (symbol == '@' and self.at(i + 1) == 'interface')
+                or (symbol == 'record' and is_name(self.at(i + 1)) and self.at(i + 2) in ('(', '<'))):
+            return self.parse_class(start, i, modifiers, parent)
+        in_class = parent.kind == 'class'
+        if symbol == '{' and in_class:
+            node = self.add(parent, 'initializer', start)
+            node.modifiers = modifiers
+            node.head_end = i + 1
+            node.end = self.parse_block(i, node)
+            return node.end
+        if symbol == '<':
+            i = self.skip_generic(i)  # A generic method's type parameters
+        if in_class and is_name(self.at(i)) and self.at(i + 1) == '(':
+            return self.parse_method(start, i, modifiers, None, parent, 'constructor')
+        type_text, j = self.parse_type(i)
+        if type_text is None or not is_name(self.at(j)):
+            return None
+        if self.at(j + 1) == '(':
+            return self.parse_method(start, j, modifiers, type_text, parent, 'method')
+        if not in_class:
+            return None  # Outside a class a variable declaration is a statement
+        end = self.statement_end(j)
+        self.parse_declarators(start, j, end, modifiers, type_text, parent, 'field')
+        return end + 1 if self.at(end) == ';' else end
+
+    def parse_class(self, start, i, modifiers, parent):
+        variant = self.at(i)
+        if variant == '@':
+            variant = 'annotation'
+            i += 1
+        name = self.at(i + 1)
+        node = self.add(parent, 'class', start, name if is_name(name) else None)
+        node.variant = variant
+        node.modifiers = modifiers
+        i += 2
+        # Header: type parameters, record components, extends and implements
+        while i < self.n and self.at(i) not in ('{', ';', '}'):
+            symbol = self.at(i)
+            if symbol == '<':
+                i = self.skip_generic(i)
+            elif symbol == '(':
+                close = self.skip_balanced(i)
+                node.params = self.parse_params(i + 1, close - 1)
+                i = close
+            elif symbol == 'extends' and node.type is None:
+                node.type, i = self.parse_type(i + 1)
+            else:
+                i += 1
+        node.head_end = i
+        if self.at(i) != '{':
+            node.end = i + 1 if self.at(i) == ';' else i
+            return node.end
+        i += 1
+        if variant == 'enum':
+            i = self.parse_enum_constants(i, node)
+        node.end = self.parse_class_body(i, node)
+        return node.end
+
+    def parse_class_body(self, i, node):
+        """Parse members up to the closing brace; returns the index after it"""
+        while i < self.n and self.at(i) != '}':
+            j = self.parse_member(i, node)
+            if j is None:
+                # Not a declaration; skip what looks like one statement
+                end = self.statement_end(i)
+                j = end + 1 if self.at(end) == ';' else end
+            i = max(j, i + 1)
+        return i + 1 if self.at(i) == '}' else i
+
+    def parse_enum_constants(self, i, node):
+        """Skip an enum's constants, scanning their arguments and bodies"""
+        while i < self.n and self.at(i) not in (';', '}'):
+            if self.at(i) == '(':
+                close = self.skip_balanced(i)
+                self.scan(i + 1, close - 1, node)
+                i = close
+            elif self.at(i) == '{':
+                i = self.parse_class_body(i + 1, node)
+            else:
+                i += 1
+        return i + 1 if self.at(i) == ';' else i
+
+    def parse_method(self, start, name_index, modifiers, type_text, parent, kind):
+        node = self.add(parent, kind, start, self.at(name_index))
+        node.modifiers = modifiers
+        node.type = type_text
+        close = self.skip_balanced(name_index + 1)
+        node.params = self.parse_params(name_index + 2, close - 1)
+        node.head_end = close
+        i = close
+        # Array dimensions, throws clause or an annotation element's default
+        while i < self.n and self.at(i) not in ('{', ';', '}'):
+            i += 1
+        if self.at(i) == '{':
+            i = self.parse_block(i, node)
+        elif self.at(i) == ';':
+            i += 1
+        node.end = i
+        return i
+
+    def parse_params(self, lo, hi):
+        """Return the parameter types declared in [lo, hi)"""
+        params = []
+        for start, end in self.split(lo, hi, ',', generics=True):
+            _, i = self.parse_modifiers(start)
+            type_text, _ = self.parse_type(i)
+            if type_text is not None:
+                params.append(type_text)
+        return tuple(params)
+
+    def parse_declarators(self, start, i, end, modifiers, type_text, parent, kind):
+        """Add a node per `name [= value]` declared in [i, end)"""
+        for part_start, part_end in self.split(i, end, ','):
+            name = self.at(part_start)
+            if not is_name(name):
+                continue
+            node = self.add(parent, kind, start, name)
+            node.modifiers = modifiers
+            j = part_start + 1
+            dimensions = ''
+            while self.at(j) == '[' and self.at(j + 1) == ']':
+                dimensions += '[]'
+                j += 2
+            node.type = type_text + dimensions
+            node.head_end = node.end = max(part_end, start + 1)
+            if self.at(j) == '=':
+                self.scan(j + 1, part_end, node)
+            start = part_start  # Later declarators are highlighted on their own
+
+    def parse_local_variables(self, i, end, parent):
+        """Parse a local variable declaration in [i, end); False if it isn't one"""
+        modifiers, k = self.parse_modifiers(i)
+        type_text, j = self.parse_type(k)
+        if type_text is None or not is_name(self.at(j)):
+            return False
+        if j + 1 < end and self.at(j + 1) not in ('=', ';', ',', '[', ':'):
+            return False
+        self.parse_declarators(i, j, end, modifiers, type_text, parent, 'variable')
+        return True
+
+    # ---- Statements ----
+
+    def parse_block(self, i, parent):
+        """Parse the statements of the block opening at i; blocks add no node of their own"""
+        i += 1
+        while i < self.n and self.at(i) != '}':
+            i = max(self.parse_statement(i, parent), i + 1)
+        return i + 1 if self.at(i) == '}' else i
+
+    def parse_statement(self, i, parent):
+        """Parse the statement at i into parent; returns the index after it"""
+        symbol = self.at(i)
+        if symbol == '{':
+            return self.parse_block(i, parent)
+        if symbol == ';' or symbol in _CLOSERS:
+            return i + 1 if symbol == ';' else i
+        if symbol in ('for', 'while'):
+            return self.parse_loop(i, parent)
+        if symbol == 'do':
+            return self.parse_do(i, parent)
+        if symbol == 'if':
+            return self.parse_if(i, parent)
+        if symbol == 'switch':
+            return self.parse_switch(i, parent)
+        if symbol == 'try':
+            return self.parse_try(i, parent)
+        if symbol == 'synchronized' and self.at(i + 1) == '(':
+            close = self.skip_balanced(i + 1)
+            self.scan(i + 2, close - 1, parent)
+            return self.parse_statement(close, parent)
+        if is_name(symbol) and self.at(i + 1) == ':':
+            return self.parse_statement(i + 2, parent)  # Labelled statement
+        if (symbol in _CLASS_KEYWORDS
+                or (symbol == 'record' and is_name(self.at(i + 1)) and self.at(i + 2) in ('(', '<'))):
+            return self.parse_class(i, i, frozenset(), parent)
+
+        end = self.statement_end(i)
+        if symbol == 'return':
+            node = self.add(parent, 'return', i)
+            node.head_end = node.end = max(end, i + 1)
+            self.scan(i + 1, end, node)
+        elif symbol in ('throw', 'assert') or (symbol == 'yield' and self.at(i + 1) not in (
+                ASSIGNMENT_OPERATORS | {'.', '(', '[', '++', '--'})):
+            self.scan(i + 1, end, parent)
+        elif symbol not in ('break', 'continue') and not self.parse_local_variables(i, end, parent):
+            self.scan(i, end, parent)
+        return end + 1 if self.at(end) == ';' else end
+
+    def parse_loop(self, i, parent):
+        node = self.add(parent, 'loop', i)
+        node.variant = self.at(i)
+        close = self.skip_balanced(i + 1) if self.at(i + 1) == '(' else i + 1
+        node.head_end = close
+        lo, hi = i + 2, close - 1
+        parts = list(self.split(lo, hi, ';'))
+        if node.variant == 'for' and len(parts) == 1:
+            # for (Type name : items)
+            node.variant = 'foreach'
+            colon = next((k for k in range(lo, hi) if self.s[k] == ':'), hi)
+            self.parse_local_variables(lo, colon, node)
+            self.scan(colon + 1, hi, node)
+        elif node.variant == 'for' and parts:
+            init_lo, init_hi = parts[0]
+            if not self.parse_local_variables(init_lo, init_hi, node):
+                self.scan(init_lo, init_hi, node)
+            for part_lo, part_hi in parts[1:]:
+                self.scan(part_lo, part_hi, node)
+        else:
+            self.scan(lo, hi, node)
+        node.end = self.parse_statement(close, node)
+        return node.end
+
+    def parse_do(self, i, parent):
+        node = self.add(parent, 'loop', i)
+        node.variant = 'do'
+        j = self.parse_statement(i + 1, node)
+        if self.at(j) == 'while' and self.at(j + 1) == '(':
+            close = self.skip_balanced(j + 1)
+            self.scan(j + 2, close - 1, node)
+            j = close + 1 if self.at(close) == ';' else close
+        node.end = j
+        return j
+
+    def parse_if(self, i, parent):
+        node = self.add(parent, 'if', i)
+        close = self.skip_balanced(i + 1) if self.at(i + 1) == '(' else i + 1
+        node.head_end = close
+        self.scan(i + 2, close - 1, node)
+        j = self.parse_statement(close, node)
+        if self.at(j) == 'else':
+            j = self.parse_statement(j + 1, node)
+        node.end = j
+        return j
+
+    def parse_switch(self, i, parent):
+        """Parse a switch statement or expression"""
+        node = self.add(parent, 'switch', i)
+        close = self.skip_balanced(i + 1) if self.at(i + 1) == '(' else i + 1
+        node.head_end = close
+        self.scan(i + 2, close - 1, node)
+        j = close
+        if self.at(j) != '{':
+            node.end = j
+            return j
+        j += 1
+        while j < self.n and self.at(j) != '}':
+            if self.at(j) in ('case', 'default'):
+                # Skip the label up to its ':' or '->'
+                while j < self.n and self.at(j) not in (':', '->', '}'):
+                    j = self.skip_balanced(j) if self.at(j) in _OPENERS else j + 1
+                if self.at(j) in (':', '->'):
+                    j += 1
+                continue
+            j = max(self.parse_statement(j, node), j + 1)
+        node.end = j + 1 if self.at(j) == '}' else j
+        return node.end
+
+    def parse_try(self, i, parent):
+        node = self.add(parent, 'try', i)
+        j = i + 1
+        if self.at(j) == '(':
+            # try-with-resources
+            close = self.skip_balanced(j)
+            for lo, hi in self.split(j + 1, close - 1, ';'):
+                if not self.parse_local_variables(lo, hi, node):
+                    self.scan(lo, hi, node)
+            j = close
+        node.head_end = j
+        if self.at(j) == '{':
+            j = self.parse_block(j, node)
+        while self.at(j) == 'catch':
+            j += 1
+            if self.at(j) == '(':
+                j = self.skip_balanced(j)
+            if self.at(j) == '{':
+                j = self.parse_block(j, node)
+        if self.at(j) == 'finally' and self.at(j + 1) == '{':
+            j = self.parse_block(j + 1, node)
+        node.end = j
+        return j
+
+    # ---- Expressions ----
+
+    def scan(self, lo, hi, parent):
+        """Add the calls, object creations, assignments and lambda bodies in [lo, hi) to parent"""
+        k = lo
+        while k < hi:
+            symbol = self.s[k]
+            if symbol == 'new':
+                k = self.scan_new(k, parent)
+            elif symbol == 'switch' and self.at(k + 1) == '(':
+                k = self.parse_switch(k, parent)
+            elif symbol == '->' and self.at(k + 1) == '{':
+                k = self.parse_block(k + 1, parent)
+            elif symbol in ('++', '--'):
+                k = self.scan_increment(k, lo, parent)
+            elif symbol in ASSIGNMENT_OPERATORS:
+                k = self.scan_assignment(k, lo, hi, parent)
+            elif is_name(symbol) and self.at(k + 1) == '(':
+                k = self.scan_call(k, parent)
+            else:
+                k += 1
+
+    def scan_call(self, k, parent):
+        start = k
+        qualifier = []
+        while self.at(start - 1) == '.' and (is_name(self.at(start - 2)) or self.at(start - 2) in ('this', 'super')):
+            qualifier.insert(0, self.at(start - 2))
+            start -= 2
+        node = self.add(parent, 'call', start, self.s[k])
+        node.target = '.'.join(qualifier) or None
+        close = self.skip_balanced(k + 1)
+        node.head_end = node.end = close
+        self.scan(k + 2, close - 1, node)
+        return close
+
+    def scan_new(self, k, parent):
+        type_text, j = self.parse_type(k + 1)
+        node = self.add(parent, 'new', k, type_text.split('<')[0] if type_text else None)
+        node.type = type_text
+        if self.at(j) == '[':
+            node.variant = 'array'
+        elif self.at(j) == '(':
+            close = self.skip_balanced(j)
+            self.scan(j + 1, close - 1, node)
+            j = close
+            if self.at(j) == '{':
+                node.variant = 'anonymous'
+                j = self.parse_class_body(j + 1, node)
+        node.head_end = node.end = max(j, k + 1)
+        return max(j, k + 1)
+
+    def target_before(self, k, lo):
+        """Return (name, start index) of the variable assigned by the operator at k"""
+        p = k - 1
+        while self.at(p) == ']' and p > lo:
+            # Array element: walk back to the array's name
+            depth = 0
+            while p >= lo:
+                if self.at(p) == ']':
+                    depth += 1
+                elif self.at(p) == '[':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                p -= 1
+            p -= 1
+        if p < lo or not is_name(self.at(p)):
+            return None, k
+        start = p
+        while start - 2 >= lo and self.at(start - 1) == '.' and (is_name(self.at(start - 2)) or self.at(start - 2) == 'this'):
+            start -= 2
+        return self.at(p), start
+
+    def scan_increment(self, k, lo, parent):
+        previous = self.at(k - 1) if k > lo else ''
+        if is_name(previous) or previous == ']':
+            name, start = self.target_before(k, lo)  # x++
+            end = k + 1
+        else:
+            # ++x, ++this.x
+            name = None
+            start = end = k
+            j = k + 1
+            while is_name(self.at(j)) or self.at(j) == 'this':
+                if self.at(j) != 'this':
+                    name = self.at(j)
+                end = j + 1
+                if self.at(j + 1) != '.':
+                    break
+                j += 2
+        if name is None:
+            return k + 1
+        node = self.add(parent, 'assign', start, name)
+        node.variant = '+=' if self.s[k] == '++' else '-='
+        node.value = '1'
+        node.head_end = node.end = end
+        return end
+
+    def scan_assignment(self, k, lo, hi, parent):
+        name, start = self.target_before(k, lo)
+        end = self.expression_end(k + 1, hi)
+        if name is None:
+            return k + 1
+        node = self.add(parent, 'assign', start, name)
+        operator = self.s[k]
+        value = self.s[k + 1:end]
+        if operator == '=' and len(value) >= 3:
+            # x = x + y is x += y, and so is x = y + x
+            own = value[2:] if value[:2] == ['this', '.'] else value
+            if len(own) >= 3 and own[0] == name and own[1] in _BINARY_OPERATORS and _single_operand(own[2:]):
+                operator, value = own[1] + '=', own[2:]
+            elif value[1] in _COMMUTATIVE_OPERATORS and value[2:] in ([name], ['this', '.', name]):
+                operator, value = value[1] + '=', value[:1]
+        node.variant = operator
+        node.value = join_symbols(value)
+        node.head_end = node.end = max(end, start + 1)
+        self.scan(k + 1, end, node)
+        return max(end, k + 1)
+
+
+class SyntaxTree:
+    """The parsed files of one submission: `files` holds (first token index, 'unit' node) pairs"""
+
+    def __init__(self, files):
+        self.files = files
+
+
+def parse(symbols):
+    """Parse one file's code symbols into a 'unit' SyntaxNode, memoized by content"""
+    key = hashlib.sha1("\0".join(symbols).encode('utf-8', 'surrogatepass')).digest()
+    root = _parse_cache.get(key)
+    if root is not None:
+        count("syntax_cache_hit")
+        return root
+    with stage(PARSE_SYNTAX):
+        try:
+            root = _Parser(list(symbols)).parse_unit()
+        except RecursionError:
+            # Absurdly deep nesting; structural criteria then find nothing
+            count("syntax_too_deep")
+            root = SyntaxNode('unit', 0)
+    _parse_cache.put(key, root)
+    return root
+
+
+def parse_submission(symbols, file_starts=()):
+    """SyntaxTree of a submission's code symbols; `file_starts` are the token indexes where its files begin"""
+    bounds = sorted(set([0, *file_starts])) + [len(symbols)]
+    return SyntaxTree([(lo, parse(symbols[lo:hi])) for lo, hi in zip(bounds, bounds[1:]) if hi > lo])
+
+
+def clear_parse_cache():
+    _parse_cache.clear()
+
+
+# ---- Structural queries ----
+
+# Query kind -> (node kind, options it takes)
+_QUERY_KINDS = {
+    'class': ('class', ('modifiers', 'extends', 'params')),
+    'method': ('method', ('modifiers', 'returns', 'params')),
+    'constructor': ('constructor', ('modifiers', 'params')),
+    'field': ('field', ('modifiers', 'type')),
+    'variable': ('variable', ('modifiers', 'type')),
+    'call': ('call', ()),
+    'new': ('new', ()),
+    'assign': ('assign', ()),
+    'increment': ('assign', ()),
+    'decrement': ('assign', ()),
+    'loop': ('loop', ()),
+    'if': ('if', ()),
+    'switch': ('switch', ()),
+    'try': ('try', ()),
+    'return': ('return', ()),
+}
+_ANY = 'any'
+
+
+def _normalize_type(text):
+    return join_symbols(code_symbols(text))
+
+
+class StructureQuery:
+    """A compiled tree pattern; see compile_query()"""
+
+    def __init__(self, kind, value, options, contains):
+        self.kind = kind
+        self.node_kind = _QUERY_KINDS[kind][0]
+        self.value = value
+        self.returns = options.get('returns')
+        self.type = options.get('type')
+        self.extends = options.get('extends')
+        self.modifiers = frozenset(options.get('modifiers', ()))
+        self.params = options.get('params')
+        self.contains = contains
+
+    def accepts(self, node):
+        """True if the node itself matches, ignoring `contains`"""
+        if node.kind != self.node_kind:
+            return False
+        value = self.value
+        if self.kind == 'loop':
+            if value != _ANY and node.variant != value:
+                return False
+        elif self.kind in ('increment', 'decrement'):
+            if node.variant != ('+=' if self.kind == 'increment' else '-=') or node.value != '1':
+                return False
+        if value not in (_ANY, '*') and self.kind not in ('loop', 'if', 'switch', 'try', 'return'):
+            name = node.name
+            if self.kind == 'call' and '.' in value and node.target:
+                name = f"{node.target}.{node.name}"
+            if name is None or not fnmatchcase(name, value):
+                return False
+        if self.returns is not None and not _type_matches(node.type, self.returns):
+            return False
+        if self.type is not None and not _type_matches(node.type, self.type):
+            return False
+        if self.extends is not None and not _type_matches(node.type, self.extends):
+            return False
+        if not self.modifiers <= node.modifiers:
+            return False
+        if self.params is not None:
+            if len(node.params) != len(self.params):
+                return False
+            if not all(_type_matches(actual, expected) for actual, expected in zip(node.params, self.params)):
+                return False
+        return True
+
+    def match(self, node):
+        """Return the node and the first node matching each `contains` query, or None"""
+        if not self.accepts(node):
+            return None
+        chain = [node]
+        for query in self.contains:
+            for descendant in node.walk():
+                found = query.match(descendant)
+                if found:
+                    chain.extend(found)
+                    break
+            else:
+                return None
+        return chain
+
+    def find(self, tree):
+        """Return the token ranges to highlight for every match in a SyntaxTree"""
+        ranges = []
+        for offset, root in tree.files:
+            for node in root.walk():
+                chain = self.match(node)
+                if chain:
+                    ranges.extend((offset + n.start, offset + max(n.head_end, n.start + 1)) for n in chain)
+        return list(dict.fromkeys(ranges))
+
+
+def _type_matches(actual, expected):
+    return expected == '*' or actual == expected
+
+
+def compile_query(spec):
+    """Compile a structural query.
+
+    A query is a mapping with one kind key and its options:
+
+        class: Grades                    # a class, interface, enum or record
+        contains:                        # with, anywhere inside it,
+          method: average                # a method named average
+          returns: double
+          modifiers: [public, static]    # declared at least these, any order
+          contains: {loop: any, contains: {call: add}}
+
+    class, method, constructor, field, variable, call, new and assign take
+    a name; `*` or a glob such as `get*` matches several, and a call may be
+    qualified (`System.out.println`). loop takes for, foreach, while, do
+    or any. increment and decrement take the variable (i++, ++i, i += 1
+    and i = i + 1 all increment i). if, switch, try and return take any.
+    Options: `returns` (methods), `type` (fields and variables),
+    `extends` (classes), `params` (list of parameter types; `*` for any),
+    `modifiers`, and `contains`, a query or list of queries that must all
+    match somewhere inside the node. Raises ValueError if it is malformed.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"structure query must be a mapping, not {spec!r}")
+    kinds = [kind for kind in _QUERY_KINDS if kind in spec]
+    if len(kinds) != 1:
+        raise ValueError(f"structure query needs exactly one of {', '.join(_QUERY_KINDS)}: {spec!r}")
+    kind = kinds[0]
+    allowed = _QUERY_KINDS[kind][1]
+    unknown = set(spec) - {kind, 'contains'} - set(allowed)
+    if unknown:
+        raise ValueError(f"unknown {kind} query option(s): {', '.join(sorted(unknown))}")
+
+    value = spec[kind]
+    if value is True or value is None:
+        value = _ANY
+    if not isinstance(value, str):
+        raise ValueError(f"{kind} query takes a string, not {value!r}")
+    value = value.strip()
+    if kind == 'loop' and value not in LOOP_VARIANTS + (_ANY,):
+        raise ValueError(f"loop query takes {', '.join(LOOP_VARIANTS)} or {_ANY}, not {value!r}")
+
+    options = {}
+    for name in ('returns', 'type', 'extends'):
+        if name in spec:
+            if not isinstance(spec[name], str):
+                raise ValueError(f"{name} takes a type name, not {spec[name]!r}")
+            options[name] = _normalize_type(spec[name])
+    if 'modifiers' in spec:
+        modifiers = spec['modifiers']
+        if isinstance(modifiers, str):
+            modifiers = modifiers.split()
+        if not isinstance(modifiers, list) or not set(modifiers) <= MODIFIERS:
+            raise ValueError(f"modifiers must be a list of Java modifiers, not {spec['modifiers']!r}")
+        options['modifiers'] = modifiers
+    if 'params' in spec:
+        params = spec['params']
+        if not isinstance(params, list) or not all(isinstance(param, str) for param in params):
+            raise ValueError(f"params must be a list of types, not {params!r}")
+        options['params'] = tuple(_normalize_type(param) for param in params)
+
+    contains = spec.get('contains', [])
+    if isinstance(contains, dict):
+        contains = [contains]
+    if not isinstance(contains, list):
+        raise ValueError(f"contains takes a query or a list of queries, not {contains!r}")
+    return StructureQuery(kind, value, options, [compile_query(query) for query in contains])
@@ -0,0 +1,130 @@
+"""Content-addressed cache of automatic grading results.
+
+Resubmissions, duplicate uploads and copies that differ only in layout
+or comments grade exactly the same, so results are stored under a hash
+of what grading depends on: the criteria and their marks, the fuzzy
+threshold and the submission's code-token stream (plus its file markers).
+Criteria of structured schemes add their matcher definition and, for
+literal and regex matchers, the submission's code text.
+A hit replays the stored outcome of every row. Its token ranges are
+turned into spans for the submission at hand, so highlights land
+correctly even when the whitespace differs.
+
+Entries live in memory and next to the compiled schemes on disk, so they
+are shared between GUI sessions and batch worker processes. The disk
+entries share the compiled schemes' size and age limits too.
+"""
+import hashlib
+import os
+from bisect import bisect_left
+
+from grading_engine import GradingResult, STATUS_NOT_FOUND, TIMED_OUT_COMMENT, find_scheme_line, grade_rows
+from instrumentation import count
+from scheme_cache import default_cache_dir, read_cache_file, write_cache_file
+from storage import LRUCache
+
+# Bump whenever grading can give a row a different outcome
+RESULT_CACHE_VERSION = 1
+
+MEMORY_CACHE_SIZE = 256
+
+_memory_cache = LRUCache(MEMORY_CACHE_SIZE)
+
+
+def result_key(rows, submission, fuzzy_threshold=None, rules=None):
+    """Hash of everything the automatic grades of the rows depend on.
+
+    `rules` are the compiled matchers of a structured scheme's criteria.
+    """
+    rules = rules or {}
+    digest = hashlib.sha256(f"results-v{RESULT_CACHE_VERSION}\0{fuzzy_threshold!r}\0".encode())
+    reads_text = False
+    for row in rows:
+        digest.update(f"{row.criteria}\0{row.allocated!r}\0".encode('utf-8', 'surrogatepass'))
+        rule = rules.get(row.criteria)
+        if rule is not None:
+            digest.update(f"\2{rule.key}\0".encode('utf-8', 'surrogatepass'))
+            reads_text = reads_text or rule.reads_text
+    digest.update(b"\1")
+    digest.update("\0".join(submission.symbols).encode('utf-8', 'surrogatepass'))
+    if reads_text:
+        # Literal and regex matchers see the layout, not just the tokens
+        digest.update(b"\1" + submission.code_text.encode('utf-8', 'surrogatepass'))
+    if submission.file_starts:
+        # Which file a match is in shows in the comments
+        starts = [token.start for token in submission.tokens]
+        for offset, name in submission.file_starts:
+            digest.update(f"\1{bisect_left(starts, offset)}\0{name}".encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"result-{key}.pickle")
+
+
+def load_grades(key, cache_dir=None, use_disk=True):
+    """Return the stored per-row grades for a key, or None"""
+    grades = _memory_cache.get(key)
+    if grades is not None:
+        return grades
+    if not use_disk:
+        return None
+    stored = read_cache_file(_cache_path(cache_dir or default_cache_dir(), key))
+    if not isinstance(stored, tuple) or len(stored) != 2 or stored[0] != key:
+        return None  # Missing or unreadable entries are simply graded again
+    grades = stored[1]
+    _memory_cache.put(key, grades)
+    return grades
+
+
+def store_grades(key, rows, cache_dir=None, use_disk=True):
+    """Remember the graded outcome of the rows under a key.
+
+    Nothing is stored when a matcher timed out: on a less busy machine the
+    same submission may well grade in time.
+    """
+    if any(row.comments == TIMED_OUT_COMMENT for row in rows):
+        count("result_cache_skipped_timeout")
+        return
+    grades = [(row.status, row.awarded, row.comments, row.score, list(row.token_ranges)) for row in rows]
+    _memory_cache.put(key, grades)
+    if use_disk:
+        write_cache_file(_cache_path(cache_dir or default_cache_dir(), key), (key, grades))
+
+
+def apply_grades(rows, grades, submission, scheme_text=None):
+    """Give the rows their stored outcome, with spans in this submission"""
+    for row, (status, awarded, comments, score, token_ranges) in zip(rows, grades):
+        row.status = status
+        row.awarded = awarded
+        row.comments = comments
+        row.score = score
+        row.token_ranges = list(token_ranges)
+        row.spans = [submission.span(start, end) for start, end in token_ranges]
+        row.files = submission.files_for(token_ranges)
+        row.reference = ""
+        if status == STATUS_NOT_FOUND and row.scheme_line is None and scheme_text is not None:
+            row.scheme_line = find_scheme_line(scheme_text, row.criteria)
+
+
+def grade_rows_cached(rows, submission, scheme_text=None, matcher=None, fuzzy_threshold=None,
+                      cache_dir=None, use_disk=True):
+    """grade_rows() that reuses the result of an identical earlier submission.
+
+    `submission` must be a NormalizedSubmission.
+    """
+    auto_rows = [row for row in rows if not row.is_manual]
+    key = result_key(auto_rows, submission, fuzzy_threshold, matcher.rules if matcher is not None else None)
+    grades = load_grades(key, cache_dir, use_disk)
+    if grades is not None:
+        count("result_cache_hit")
+        apply_grades(auto_rows, grades, submission, scheme_text)
+        return GradingResult(rows)
+    count("result_cache_miss")
+    result = grade_rows(rows, submission, scheme_text, matcher, fuzzy_threshold)
+    store_grades(key, auto_rows, cache_dir, use_disk)
+    return result
+
+
+def clear_memory_cache():
+    _memory_cache.clear()
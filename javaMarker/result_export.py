@@ -0,0 +1,245 @@
+"""Export of grading results, independent of the Tk GUI."""
+import os
+
+from grading_engine import MANUAL_PREFIX, STATUS_PARTIAL
+from instrumentation import EXPORT, stage
+
+DETAILED_COLUMNS = ['Criteria', 'Allocated Marks', 'Awarded Marks', 'Comments', 'Student Submission']
+COHORT_SUMMARY_COLUMNS = ['Student', 'File', 'Total Marks', 'Achieved Marks']
+COHORT_DETAIL_COLUMNS = ['Student', 'Criteria', 'Allocated Marks', 'Awarded Marks', 'Comments', 'Status']
+
+# Criteria columns of the cohort summary can hold whole lines of code
+SUMMARY_MAX_WIDTH = 40
+
+
+def write_results_txt(filepath, student_name, submission_path, total_marks, achieved_marks, rows):
+    """Save grading results to a text file"""
+    with stage(EXPORT), open(filepath, 'w') as f:
+        f.write(f"Student: {student_name}\n")
+        f.write(f"Submission: {os.path.basename(submission_path)}\n")
+        f.write(f"Total Marks: {total_marks}\n")
+        f.write(f"Achieved Marks: {achieved_marks}\n\n")
+        f.write("Detailed Breakdown:\n")
+        f.write("-" * 80 + "\n")
+
+        for row in rows:
+            f.write(f"Criteria: {row.criteria}\n")
+            f.write(f"Allocated: {row.allocated}\tAwarded: {row.awarded}\n")
+            f.write(f"Comments: {row.comments}\n")
+            f.write("-" * 80 + "\n")
+
+
+def detailed_breakdown(rows):
+    """Merge manual grades into their criteria for the detailed export.
+
+    Returns (records, total_allocated, total_awarded) where each record is
+    a dict keyed by DETAILED_COLUMNS.
+    """
+    records = []
+    total_allocated = 0.0
+    total_awarded = 0.0
+
+    # First pass: collect all manual grading entries and map them to their criteria
+    manual_grades = {}  # Dictionary to store manually graded items
+    for row in rows:
+        if row.is_manual:
+            # Extract the reference criteria from either the reference field or the manual comment
+            student_code = row.criteria[len(MANUAL_PREFIX):].strip()
+            reference_criteria = row.reference or student_code
+            if reference_criteria:  # Only process if we have a reference
+                manual_grades[reference_criteria] = {
+                    'allocated': row.allocated,
+                    'awarded': row.awarded,
+                    'comments': row.comments,
+                    'student_submission': student_code  # The actual student code
+                }
+
+    # Second pass: process all items
+    seen_criteria = set()
+    for row in rows:
+        # Skip manual grading entries as we've already processed them
+        if row.is_manual:
+            continue
+
+        allocated = row.allocated
+        awarded = row.awarded
+        comments = row.comments
+        student_submission = "-"
+
+        # Check if this criteria has a manual grade
+        if row.criteria in manual_grades:
+            # Use the manually graded values
+            grade_info = manual_grades[row.criteria]
+            allocated = grade_info['allocated']
+            awarded = grade_info['awarded']
+            comments = grade_info['comments']
+            student_submission = grade_info['student_submission']
+        elif awarded > 0:
+            # This was automatically matched
+            student_submission = row.criteria
+
+        total_allocated += allocated
+        total_awarded += awarded
+        seen_criteria.add(row.criteria)
+        records.append(dict(zip(DETAILED_COLUMNS, (
+            row.criteria, allocated, awarded, comments, student_submission))))
+
+    # Add any manual grades that didn't match existing criteria (shouldn't happen but just in case)
+    for ref_criteria, grade_info in manual_grades.items():
+        if ref_criteria not in seen_criteria:
+            records.append(dict(zip(DETAILED_COLUMNS, (
+                ref_criteria, grade_info['allocated'], grade_info['awarded'],
+                grade_info['comments'], grade_info['student_submission']))))
+            total_allocated += grade_info['allocated']
+            total_awarded += grade_info['awarded']
+
+    return records, total_allocated, total_awarded
+
+
+def is_manual_record(record):
+    """True if the record's submission came from a manual grade"""
+    submission = record['Student Submission']
+    return submission != "-" and submission != record['Criteria']
+
+
+class StreamingSheet:
+    """Append rows in order to a constant_memory worksheet, tracking column widths"""
+
+    def __init__(self, worksheet, max_width=None):
+        self.worksheet = worksheet
+        self.max_width = max_width
+        self.widths = []
+        self.next_row = 0
+
+    def write_row(self, values, cell_format=None, highlight=False):
+        """Write the next row; with highlight, cell_format also fills the whole row"""
+        row_num = self.next_row
+        if highlight:
+            # constant_memory flushes each row once the next one starts, so
+            # the row format has to be set before its cells are written
+            self.worksheet.set_row(row_num, None, cell_format)
+        for col_num, value in enumerate(values):
+            self.worksheet.write(row_num, col_num, value, cell_format)
+            width = len(str(value))
+            if col_num < len(self.widths):
+                self.widths[col_num] = max(self.widths[col_num], width)
+            else:
+                self.widths.append(width)
+        self.next_row += 1
+        return row_num
+
+    def finish(self):
+        """Apply the tracked column widths.
+
+        Column widths live ahead of the cell data in the file, so they can
+        still be set after every row has been streamed.
+        """
+        for col_num, width in enumerate(self.widths):
+            if self.max_width is not None:
+                width = min(width, self.max_width)
+            self.worksheet.set_column(col_num, col_num, width + 2)  # Add a little extra space
+
+
+def _header_format(workbook):
+    return workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'fg_color': '#D7E4BC',
+        'border': 1
+    })
+
+
+def write_results_excel(filepath, rows, sheet_name='Grading Results', progress=None):
+    """Save the detailed breakdown to an Excel file, streaming rows to disk.
+
+    Rows are written straight to xlsxwriter in constant_memory mode, and
+    column widths are tracked as each value is written. `progress(done,
+    total)` is called per row.
+    """
+    with stage(EXPORT):
+        import xlsxwriter  # Loaded on first export only
+
+        records, total_allocated, total_awarded = detailed_breakdown(rows)
+
+        workbook = xlsxwriter.Workbook(filepath, {'constant_memory': True})
+        try:
+            sheet = StreamingSheet(workbook.add_worksheet(sheet_name))
+            header_format = _header_format(workbook)
+            # Highlight manually graded rows
+            manual_format = workbook.add_format({'bg_color': '#FFF2CC'})
+
+            sheet.write_row(DETAILED_COLUMNS, header_format)
+            for done, record in enumerate(records):
+                if progress is not None:
+                    progress(done, len(records))
+                manual = is_manual_record(record)
+                sheet.write_row([record[column] for column in DETAILED_COLUMNS],
+                                manual_format if manual else None, highlight=manual)
+            sheet.write_row(['TOTAL', total_allocated, total_awarded, '', ''])
+            sheet.finish()
+        finally:
+            workbook.close()
+
+
+def write_cohort_workbook(filepath, criteria, summaries, detail_sheets=True):
+    """Stream a whole cohort into one Excel workbook.
+
+    `criteria` are the scheme's Criterion objects, in order, and
+    `summaries` is an iterable of batch grading summaries whose rows follow
+    the same order. The first sheet lists every student's totals next to a
+    per-criterion matrix of awarded marks; with detail_sheets a second,
+    filterable sheet holds every student's rows and each name in the
+    summary links to that student's first row. Each summary is written as
+    soon as it arrives, so the cohort never has to be held in memory.
+    Every constant_memory worksheet keeps a temporary file open until the
+    workbook closes, which is why students share one detail sheet.
+    """
+    import xlsxwriter  # Loaded on first export only
+
+    workbook = xlsxwriter.Workbook(filepath, {'constant_memory': True})
+    try:
+        header_format = _header_format(workbook)
+        error_format = workbook.add_format({'bg_color': '#FFC7CE'})
+        partial_format = workbook.add_format({'bg_color': '#FFF2CC'})
+        link_format = workbook.add_format({'font_color': 'blue', 'underline': 1})
+
+        summary = StreamingSheet(workbook.add_worksheet('Summary'), max_width=SUMMARY_MAX_WIDTH)
+        summary.write_row(COHORT_SUMMARY_COLUMNS + [criterion.text for criterion in criteria] + ['Error'],
+                          header_format)
+        summary.write_row(['Allocated', '', sum(criterion.allocated for criterion in criteria), '']
+                          + [criterion.allocated for criterion in criteria], header_format)
+        summary.worksheet.freeze_panes(2, 1)
+
+        if detail_sheets:
+            details = StreamingSheet(workbook.add_worksheet('Details'))
+            details.write_row(COHORT_DETAIL_COLUMNS, header_format)
+            details.worksheet.freeze_panes(1, 2)
+
+        for student in summaries:
+            if student['error']:
+                summary.write_row([student['student'], student['file'], '', '']
+                                  + [''] * len(criteria) + [student['error']], error_format, highlight=True)
+                continue
+
+            row_num = summary.write_row(
+                [student['student'], student['file'], student['total_marks'], student['achieved_marks']]
+                + [row['awarded'] for row in student['rows']] + [''])
+            if not detail_sheets:
+                continue
+
+            name = student['student']
+            summary.worksheet.write_url(row_num, 0, f"internal:'Details'!A{details.next_row + 1}", link_format,
+                                        string=name)
+            for row in student['rows']:
+                details.write_row([name, row['criteria'], row['allocated'], row['awarded'], row['comments'],
+                                   row['status']],
+                                  partial_format if row['status'] == STATUS_PARTIAL else None)
+            details.write_row([name, 'TOTAL', student['total_marks'], student['achieved_marks'], '', ''])
+
+        if detail_sheets:
+            details.worksheet.autofilter(0, 0, max(details.next_row - 1, 1), len(COHORT_DETAIL_COLUMNS) - 1)
+            details.finish()
+        summary.finish()
+    finally:
+        workbook.close()
@@ -0,0 +1,160 @@
+"""Grading results held independently of any widget.
+
+ResultsModel keeps the rows of one student's grading table in order,
+keyed by stable string ids, and maintains the total and achieved marks as
+rows are added, edited and removed. Rows are also indexed by status so a
+view of e.g. only the not-found rows costs nothing per hidden row. The
+GUI renders it into its Treeview, exports read it directly, and it works
+the same without Tk.
+
+While a journal is attached (see session_journal.py) every change is
+also passed to journal.record(op, key, ...), so the table can be rebuilt
+after the window is closed or the program crashes.
+"""
+from grading_engine import TOTAL_DIGITS, GradingResult, ResultRow
+
+
+class ResultsModel:
+    """Ordered ResultRows with running totals"""
+
+    def __init__(self, rows=()):
+        self.journal = None
+        self._next_id = 1
+        self.clear()
+        for row in rows:
+            self.append(row)
+
+    def clear(self):
+        """Remove every row"""
+        self._rows = {}  # key -> ResultRow, in table order
+        self._position = {}  # key -> insertion number, for table order
+        self._by_status = {}  # status -> set of keys
+        self._total = 0.0
+        self._achieved = 0.0
+        if self.journal is not None:
+            self.journal.record('clear')
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def _add_totals(self, row, sign):
+        if not row.is_manual:
+            self._total += sign * row.allocated
+        self._achieved += sign * row.awarded
+
+    def _index(self, key, row):
+        self._by_status.setdefault(row.status, set()).add(key)
+
+    def _unindex(self, key, row):
+        self._by_status[row.status].discard(key)
+
+    def append(self, row):
+        """Add a row at the end and return its key"""
+        number = self._next_id
+        self._next_id += 1
+        key = f"row{number}"
+        self._insert(key, number, row)
+        if self.journal is not None:
+            self.journal.record('append', key, row=row.to_dict())
+        return key
+
+    def _insert(self, key, number, row):
+        self._rows[key] = row
+        self._position[key] = number
+        self._index(key, row)
+        self._add_totals(row, 1)
+
+    def get(self, key):
+        return self._rows[key]
+
+    def keys(self):
+        return list(self._rows)
+
+    def rows(self):
+        return list(self._rows.values())
+
+    def items(self):
+        return list(self._rows.items())
+
+    def keys_with_status(self, statuses):
+        """Keys of the rows whose status is one of statuses, in table order"""
+        keys = set()
+        for status in statuses:
+            keys.update(self._by_status.get(status, ()))
+        return sorted(keys, key=self._position.__getitem__)
+
+    def count_status(self, status):
+        return len(self._by_status.get(status, ()))
+
+    def update(self, key, **fields):
+        """Change fields of a row, keeping the totals and index current"""
+        row = self._rows[key]
+        self._add_totals(row, -1)
+        self._unindex(key, row)
+        for name, value in fields.items():
+            setattr(row, name, value)
+        self._index(key, row)
+        self._add_totals(row, 1)
+        if self.journal is not None:
+            self.journal.record('update', key, fields=fields)
+        return row
+
+    def replace(self, key, row):
+        """Swap in a new row object for a key, e.g. after grading a copy"""
+        old_row = self._rows[key]
+        self._add_totals(old_row, -1)
+        self._unindex(key, old_row)
+        self._rows[key] = row
+        self._index(key, row)
+        self._add_totals(row, 1)
+        if self.journal is not None:
+            self.journal.record('replace', key, row=row.to_dict())
+
+    def remove(self, key):
+        """Delete a row and return it"""
+        row = self._rows.pop(key)
+        del self._position[key]
+        self._unindex(key, row)
+        self._add_totals(row, -1)
+        if self.journal is not None:
+            self.journal.record('remove', key)
+        return row
+
+    def snapshot(self):
+        """Return (key, copy of row) pairs, safe to grade without touching the model"""
+        return [(key, row.copy()) for key, row in self._rows.items()]
+
+    def state(self):
+        """Return the whole table as plain values for a session snapshot"""
+        return {
+            'next_id': self._next_id,
+            'rows': [[key, self._position[key], row.to_dict()] for key, row in self._rows.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a model from state()"""
+        model = cls()
+        for key, number, record in state['rows']:
+            model._insert(key, number, ResultRow.from_dict(record))
+        model._next_id = state['next_id']
+        return model
+
+    @property
+    def total_marks(self):
+        """Allocated marks of every scheme criterion (manual rows excluded)"""
+        return round(self._total, TOTAL_DIGITS)
+
+    @property
+    def achieved_marks(self):
+        return round(self._achieved, TOTAL_DIGITS)
+
+    def result(self):
+        """Return the rows as a GradingResult"""
+        return GradingResult(self.rows())
@@ -0,0 +1,227 @@
+"""Cohort grading results in a local SQLite database.
+
+Both the GUI and the batch grader save each graded student here, so
+cohort-level questions are answered by one query instead of by opening
+hundreds of exported files. Results are grouped by marking scheme, which
+is identified by a hash of its text. Grading a student again under the
+same scheme replaces their earlier results.
+
+Usage:
+    python results_store.py DATABASE totals [--scheme NAME]
+    python results_store.py DATABASE pass-rates [--scheme NAME]
+    python results_store.py DATABASE rows CRITERION [--status not_found] [--scheme NAME]
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+from grading_engine import MANUAL_PREFIX, STATUS_FOUND, STATUS_NOT_FOUND, STATUS_PARTIAL
+from storage import user_data_path
+
+# Students saved per transaction; one commit per student is the slow part
+BATCH_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schemes (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    scheme_id INTEGER NOT NULL REFERENCES schemes(id),
+    student TEXT NOT NULL,
+    file TEXT,
+    total_marks REAL NOT NULL,
+    achieved_marks REAL NOT NULL,
+    error TEXT,
+    graded_at TEXT NOT NULL,
+    UNIQUE (scheme_id, student)
+);
+CREATE TABLE IF NOT EXISTS results (
+    submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    criterion TEXT NOT NULL,
+    manual INTEGER NOT NULL,
+    allocated REAL NOT NULL,
+    awarded REAL NOT NULL,
+    comments TEXT,
+    status TEXT,
+    score REAL,
+    files TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_student ON submissions (student);
+CREATE INDEX IF NOT EXISTS results_submission ON results (submission_id);
+CREATE INDEX IF NOT EXISTS results_criterion_status ON results (criterion, status);
+CREATE INDEX IF NOT EXISTS results_status ON results (status);
+"""
+
+
+def default_results_path():
+    """Per-user results database (JAVAMARKER_RESULTS_DB overrides it)"""
+    return user_data_path("JAVAMARKER_RESULTS_DB", "results.sqlite3")
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class ResultsStore:
+    """Connection to one results database"""
+
+    def __init__(self, path=None):
+        self.path = path or default_results_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The GUI saves from a worker thread; each call uses the store from one thread at a time
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        # Readers (e.g. a query while the batch grader writes) don't block the writer
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- Writing ----
+
+    def scheme_id(self, scheme_text, name):
+        """Return the id of a scheme, adding it on first use"""
+        sha = text_sha256(scheme_text)
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO schemes (sha256, name) VALUES (?, ?)", (sha, name))
+        return self.connection.execute("SELECT id FROM schemes WHERE sha256 = ?", (sha,)).fetchone()[0]
+
+    def save(self, scheme_id, summaries, batch_size=BATCH_SIZE):
+        """Save graded students, batch_size per transaction, and return how many were saved.
+
+        Each summary is a dict like batch_grader.grade_file returns: student,
+        file, total_marks, achieved_marks, error and rows, where every row has
+        criteria, allocated, awarded, comments, status, score and files.
+        A student replaces their earlier results, so two summaries for the
+        same student in one call raise ValueError instead of one silently
+        overwriting the other.
+        """
+        saved = 0
+        batch = []
+        students = set()
+        for summary in summaries:
+            if summary['student'] in students:
+                raise ValueError(f"student {summary['student']!r} appears twice; give the submissions unique names")
+            students.add(summary['student'])
+            batch.append(summary)
+            if len(batch) >= batch_size:
+                saved += self._save_batch(scheme_id, batch)
+                batch = []
+        if batch:
+            saved += self._save_batch(scheme_id, batch)
+        return saved
+
+    def _save_batch(self, scheme_id, summaries):
+        graded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with self.connection as connection:
+            for summary in summaries:
+                connection.execute("DELETE FROM submissions WHERE scheme_id = ? AND student = ?",
+                                   (scheme_id, summary['student']))
+                cursor = connection.execute(
+                    "INSERT INTO submissions (scheme_id, student, file, total_marks, achieved_marks, error, graded_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (scheme_id, summary['student'], summary.get('file'), summary['total_marks'],
+                     summary['achieved_marks'], summary.get('error'), graded_at))
+                submission_id = cursor.lastrowid
+                connection.executemany(
+                    "INSERT INTO results (submission_id, position, criterion, manual, allocated, awarded,"
+                    " comments, status, score, files) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(submission_id, position, row['criteria'], row['criteria'].startswith(MANUAL_PREFIX),
+                      row['allocated'], row['awarded'], row['comments'], row['status'], row.get('score'),
+                      ", ".join(name for name in dict.fromkeys(row.get('files') or ()) if name))
+                     for position, row in enumerate(summary['rows'])])
+        return len(summaries)
+
+    # ---- Queries ----
+
+    def _scheme_filter(self, scheme, prefix="WHERE"):
+        # scheme is a scheme name or sha256; None means every scheme
+        if scheme is None:
+            return "", ()
+        return (f" {prefix} submissions.scheme_id IN (SELECT id FROM schemes WHERE name = ? OR sha256 = ?)",
+                (scheme, scheme))
+
+    def student_totals(self, scheme=None):
+        """Return (student, file, total_marks, achieved_marks, error) per saved student"""
+        where, params = self._scheme_filter(scheme)
+        return self.connection.execute(
+            "SELECT student, file, total_marks, achieved_marks, error FROM submissions"
+            f"{where} ORDER BY student", params).fetchall()
+
+    def pass_rates(self, scheme=None):
+        """Return (criterion, students, found, partial, not found, pass rate) per scheme criterion.
+
+        The pass rate is the share of students with the criterion found;
+        manually added rows are left out.
+        """
+        where, params = self._scheme_filter(scheme, "AND")
+        return self.connection.execute(
+            "SELECT criterion, COUNT(*),"
+            " SUM(status = ?), SUM(status = ?), SUM(status = ?),"
+            " AVG(status = ?)"
+            " FROM results JOIN submissions ON submissions.id = results.submission_id"
+            f" WHERE NOT manual{where} GROUP BY criterion ORDER BY AVG(status = ?), criterion",
+            (STATUS_FOUND, STATUS_PARTIAL, STATUS_NOT_FOUND, STATUS_FOUND)
+            + params + (STATUS_FOUND,)).fetchall()
+
+    def rows_for(self, criterion, status=STATUS_NOT_FOUND, scheme=None):
+        """Return (student, file, awarded, comments) of every row of a criterion with a status"""
+        where, params = self._scheme_filter(scheme, "AND")
+        return self.connection.execute(
+            "SELECT student, file, awarded, comments"
+            " FROM results JOIN submissions ON submissions.id = results.submission_id"
+            f" WHERE criterion = ? AND status = ?{where} ORDER BY student",
+            (criterion, status) + params).fetchall()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Query a javaMarker results database.")
+    parser.add_argument("database", help="SQLite results database")
+    parser.add_argument("--scheme", help="only results graded with this scheme (name or sha256)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("totals", help="total and achieved marks per student")
+    commands.add_parser("pass-rates", help="how many students got each criterion")
+    rows = commands.add_parser("rows", help="students whose row for a criterion has a status")
+    rows.add_argument("criterion", help="criterion code, or name in a structured scheme, exactly as in the scheme")
+    rows.add_argument("--status", default=STATUS_NOT_FOUND, help=f"default: {STATUS_NOT_FOUND}")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.exists(args.database):
+        print(f"Error: {args.database} does not exist", file=sys.stderr)
+        return 2
+
+    with ResultsStore(args.database) as store:
+        if args.command == "totals":
+            for student, file, total, achieved, error in store.student_totals(args.scheme):
+                print(f"{student}\t{achieved:g}/{total:g}" + (f"\tERROR: {error}" if error else ""))
+        elif args.command == "pass-rates":
+            for criterion, students, found, partial, not_found, rate in store.pass_rates(args.scheme):
+                print(f"{rate:6.1%}  found {found}/{students}, partial {partial}, "
+                      f"not found {not_found}  {criterion}")
+        else:
+            for student, file, awarded, comments in store.rows_for(args.criterion, args.status, args.scheme):
+                print(f"{student}\t{awarded:g}\t{comments}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
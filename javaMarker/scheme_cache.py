@@ -0,0 +1,171 @@
+"""Memory and on-disk cache of compiled marking schemes.
+
+A scheme is reused for hundreds of submissions and across sessions, so
+the parsed criteria and prebuilt matcher (with the compiled matchers of a
+structured scheme) are stored under a hash of the scheme content.
+Loading an unchanged scheme is then a dictionary lookup or a single
+unpickle instead of a re-parse and recompile.
+
+The cache directory is swept now and then while it is written to:
+entries nobody has read for DISK_CACHE_MAX_AGE are deleted, and then the
+least recently used ones until it fits in DISK_CACHE_MAX_BYTES.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+from grading_engine import CompiledScheme
+from instrumentation import PARSE_SCHEME, READ_FILE, count, stage
+from storage import LRUCache, user_cache_dir
+
+# Bump whenever CompiledScheme or anything it contains changes shape, or schemes compile differently
+CACHE_FORMAT_VERSION = 6
+
+MEMORY_CACHE_SIZE = 32
+
+DISK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DISK_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# Cache files written between two sweeps of the directory (a process sweeps on its first write)
+PRUNE_INTERVAL = 500
+
+# Temporary files this old were left behind by a crashed writer
+STALE_TEMP_AGE = 24 * 3600
+
+_memory_cache = LRUCache(MEMORY_CACHE_SIZE)
+
+_writes = 0
+
+
+def default_cache_dir():
+    """Per-user directory for cached schemes (JAVAMARKER_CACHE_DIR overrides it)"""
+    return user_cache_dir("JAVAMARKER_CACHE_DIR")
+
+
+def scheme_digest(scheme_text):
+    """Hash identifying a scheme's content and the cache format"""
+    digest = hashlib.sha256(f"v{CACHE_FORMAT_VERSION}\0".encode())
+    digest.update(scheme_text.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+def _cache_path(cache_dir, digest):
+    return os.path.join(cache_dir, f"scheme-{digest}.pickle")
+
+
+def _read_disk(path, digest):
+    compiled = read_cache_file(path)
+    if not isinstance(compiled, CompiledScheme) or compiled.digest != digest:
+        return None
+    return compiled
+
+
+def read_cache_file(path):
+    """Unpickle a cache file, or return None; a successful read marks it as recently used"""
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+    except Exception:
+        # Missing, truncated or stale entries are simply rebuilt
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def write_cache_file(path, value):
+    """Pickle a value into the cache, atomically; failures are ignored"""
+    global _writes
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        return  # The cache is an optimization; never fail a load because of it
+    _writes += 1
+    if _writes % PRUNE_INTERVAL == 1:
+        prune_cache_dir(os.path.dirname(path))
+
+
+def prune_cache_dir(cache_dir=None, max_bytes=DISK_CACHE_MAX_BYTES, max_age=DISK_CACHE_MAX_AGE):
+    """Delete cache files unused for max_age seconds, then the least recently used past max_bytes.
+
+    Returns the number of files deleted.
+    """
+    now = time.time()
+    entries = []
+    try:
+        with os.scandir(cache_dir or default_cache_dir()) as scan:
+            for entry in scan:
+                if entry.name.endswith(('.pickle', '.tmp')) and entry.is_file(follow_symlinks=False):
+                    info = entry.stat(follow_symlinks=False)
+                    entries.append((info.st_mtime, info.st_size, entry.name, entry.path))
+    except OSError:
+        return 0
+    removed = 0
+    total = 0
+    for mtime, size, name, path in sorted(entries, reverse=True):
+        if name.endswith('.tmp'):
+            # Another process may still be writing it
+            expired = now - mtime > STALE_TEMP_AGE
+        else:
+            total += size
+            expired = total > max_bytes or now - mtime > max_age
+        if not expired:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue  # Already gone, or open elsewhere on Windows
+        removed += 1
+        if not name.endswith('.tmp'):
+            total -= size
+    if removed:
+        count("cache_files_pruned", removed)
+    return removed
+
+
+def load_compiled_scheme(scheme_text, cache_dir=None, use_disk=True):
+    """Return the CompiledScheme for the text, from cache when possible"""
+    digest = scheme_digest(scheme_text)
+
+    compiled = _memory_cache.get(digest)
+    if compiled is not None:
+        count("scheme_cache_memory_hit")
+        return compiled
+
+    path = _cache_path(cache_dir or default_cache_dir(), digest) if use_disk else None
+    if path:
+        compiled = _read_disk(path, digest)
+
+    if compiled is None:
+        with stage(PARSE_SCHEME):
+            compiled = CompiledScheme(scheme_text, digest)
+        if path:
+            write_cache_file(path, compiled)
+    else:
+        count("scheme_cache_disk_hit")
+
+    _memory_cache.put(digest, compiled)
+    return compiled
+
+
+def load_scheme_file(filepath, cache_dir=None, use_disk=True):
+    """Read a scheme file and return (text, CompiledScheme)"""
+    with stage(READ_FILE), open(filepath, 'r') as f:
+        scheme_text = f.read()
+    return scheme_text, load_compiled_scheme(scheme_text, cache_dir, use_disk)
+
+
+def clear_memory_cache():
+    _memory_cache.clear()
@@ -0,0 +1,170 @@
+"""Crash-safe record of one student's grading session.
+
+Every change to the results table is appended to a JSON-lines journal
+as it happens. Every COMPACT_EVERY entries, the whole table is written
+to a snapshot and the journal starts over. A snapshot is written to a
+temporary file and renamed into place. Reopening the same scheme and
+submission loads the snapshot and replays the few journal entries after
+it, which restores the table exactly as it was left.
+
+Sessions are keyed by a hash of the scheme and submission contents, so
+moving the files keeps the session and a resubmission starts afresh.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from grading_engine import ResultRow, row_fields
+from results_model import ResultsModel
+from storage import user_data_path
+
+SESSION_FORMAT_VERSION = 1
+
+# Journal entries replayed at most before the table is snapshotted again
+COMPACT_EVERY = 500
+
+
+def default_session_dir():
+    """Per-user directory for grading sessions (JAVAMARKER_SESSION_DIR overrides it)"""
+    return user_data_path("JAVAMARKER_SESSION_DIR", "sessions")
+
+
+def session_key(scheme_text, submission_text):
+    """Hash identifying a scheme and submission pair"""
+    digest = hashlib.sha256(f"session-v{SESSION_FORMAT_VERSION}\0".encode())
+    for text in (scheme_text, submission_text):
+        digest.update(hashlib.sha256(text.encode('utf-8', 'surrogatepass')).digest())
+    return digest.hexdigest()
+
+
+def apply_entry(model, entry):
+    """Redo one journal entry on a model that has no journal attached"""
+    op = entry['op']
+    if op == 'append':
+        key = model.append(ResultRow.from_dict(entry['row']))
+        if key != entry['key']:
+            raise ValueError(f"journal appended {entry['key']} but replay produced {key}")
+    elif op == 'update':
+        model.update(entry['key'], **row_fields(entry['fields']))
+    elif op == 'replace':
+        model.replace(entry['key'], ResultRow.from_dict(entry['row']))
+    elif op == 'remove':
+        model.remove(entry['key'])
+    elif op == 'clear':
+        model.clear()
+    else:
+        raise ValueError(f"unknown journal operation {op!r}")
+
+
+class SessionJournal:
+    """Snapshot plus append-only journal for one scheme/submission pair"""
+
+    def __init__(self, key, session_dir=None, info=None):
+        self.directory = session_dir or default_session_dir()
+        self.snapshot_path = os.path.join(self.directory, f"session-{key}.json")
+        self.journal_path = os.path.join(self.directory, f"session-{key}.jsonl")
+        self.info = info or {}  # Shown to people reading the files, e.g. paths and student name
+        self.model = None
+        self.seq = 0  # Number of the last entry written
+        self.pending = 0  # Entries written since the last snapshot
+        self.error = None  # Why journaling stopped, if a write failed
+        self._file = None
+
+    def restore(self):
+        """Return the saved ResultsModel, or None if there is no usable session"""
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if snapshot.get('version') != SESSION_FORMAT_VERSION:
+                return None
+            model = ResultsModel.from_state(snapshot['table'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        self.seq = snapshot['seq']
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn final line from a crash mid-write
+                    # Entries up to the snapshot's seq are already in it
+                    if entry['seq'] <= self.seq:
+                        continue
+                    apply_entry(model, entry)
+                    self.seq = entry['seq']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            pass  # Keep what replayed cleanly
+        return model
+
+    def attach(self, model):
+        """Start journaling a model; its current state becomes the snapshot"""
+        self.detach()
+        self.model = model
+        self.compact()
+        model.journal = self
+
+    def detach(self):
+        """Stop journaling, leaving a compact snapshot behind"""
+        if self.model is None:
+            return
+        if self.pending and self.error is None:
+            try:
+                self.compact()
+            except OSError as e:
+                self.error = e  # The journal still holds every entry
+        self.model.journal = None
+        self.model = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record(self, op, key=None, **data):
+        """Append one change of the attached model"""
+        self.seq += 1
+        entry = {'seq': self.seq, 'op': op}
+        if key is not None:
+            entry['key'] = key
+        entry.update(data)
+        try:
+            if self._file is None:
+                self._file = open(self.journal_path, 'a', encoding='utf-8')
+            # Flushed per entry so a crash of the program loses nothing
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            self.pending += 1
+            if self.pending >= COMPACT_EVERY:
+                self.compact()
+        except OSError as e:
+            # Never fail an edit because the session can't be saved
+            self.error = e
+            self.model.journal = None
+
+    def compact(self):
+        """Write the attached model as the snapshot and empty the journal"""
+        snapshot = {
+            'version': SESSION_FORMAT_VERSION,
+            'seq': self.seq,
+            'info': self.info,
+            'table': self.model.state(),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # A crash before this truncation only leaves entries the seq check skips
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.journal_path, 'w', encoding='utf-8')
+        self.pending = 0
@@ -0,0 +1,232 @@
+"""Cohort-wide detection of suspiciously similar submissions.
+
+Each submission is fingerprinted by winnowing: hashes of every k tokens
+long window of its code, with identifiers and literals normalized, of
+which the smallest in each run of `window` hashes is kept. Renaming
+variables or reformatting code changes nothing, and any copied stretch
+of at least k + window - 1 tokens shares a fingerprint.
+
+Pairs are not compared all against all. A MinHash signature of each
+fingerprint set (one-permutation hashing: every hash lands in one of
+NUM_PERMUTATIONS bins, which keep their minimum) is cut into LSH bands,
+and only submissions that share a band bucket become candidates. The
+candidates get an exact Jaccard score over their fingerprints and the
+line regions they share. Fingerprints of the marking scheme (the
+skeleton everyone starts from) and ones common to a large part of the
+cohort are ignored first.
+"""
+import csv
+import json
+import random
+import zlib
+from collections import deque
+
+from java_lexer import CHAR, IDENTIFIER, NUMBER, STRING, TEXT_BLOCK
+from storage import LRUCache
+
+DEFAULT_K = 12
+DEFAULT_WINDOW = 8
+DEFAULT_THRESHOLD = 0.5
+
+# 32 bands of 4 rows: pairs at ~0.4 Jaccard and above become candidates
+NUM_PERMUTATIONS = 128
+BANDS = 32
+
+# Fingerprints in more than this share of a cohort (of at least
+# COMMON_MIN_COHORT students) are boilerplate, not evidence
+COMMON_FRACTION = 0.5
+COMMON_MIN_COHORT = 10
+
+_MERSENNE = (1 << 61) - 1
+_BASE = 1_000_003
+_SEED = 20240601
+
+# Renamed identifiers and changed constants don't hide copied code
+_KIND_SYMBOLS = {IDENTIFIER: 'I', NUMBER: 'N', STRING: 'S', CHAR: 'S', TEXT_BLOCK: 'S'}
+
+SIMILARITY_COLUMNS = ['Student A', 'Student B', 'Similarity', 'Shared Fingerprints', 'Regions']
+
+# Distinct token symbols whose ids are kept; keywords and operators stay in it
+TOKEN_ID_CACHE_SIZE = 4096
+
+_token_ids = LRUCache(TOKEN_ID_CACHE_SIZE)
+
+
+def _token_id(token):
+    symbol = _KIND_SYMBOLS.get(token.kind, token.text)
+    token_id = _token_ids.get(symbol)
+    if token_id is None:
+        # crc32 rather than hash(): fingerprints are compared across processes
+        token_id = zlib.crc32(symbol.encode('utf-8', 'surrogatepass')) + 1
+        _token_ids.put(symbol, token_id)
+    return token_id
+
+
+def fingerprint(submission, k=DEFAULT_K, window=DEFAULT_WINDOW):
+    """Return the winnowed (hash, start_line, end_line) fingerprints of a NormalizedSubmission"""
+    tokens = submission.tokens
+    if len(tokens) < k:
+        return []
+    ids = [_token_id(token) for token in tokens]
+
+    # Rolling polynomial hash of every k-gram
+    top = pow(_BASE, k - 1, _MERSENNE)
+    value = 0
+    for token_id in ids[:k]:
+        value = (value * _BASE + token_id) % _MERSENNE
+    hashes = [value]
+    for index in range(k, len(ids)):
+        value = ((value - ids[index - k] * top) * _BASE + ids[index]) % _MERSENNE
+        hashes.append(value)
+
+    # Winnowing: the rightmost minimum of every window, each position once.
+    # `candidates` holds positions with strictly increasing hashes, so its
+    # head is the current window's minimum
+    selected = []
+    candidates = deque()
+    for position, value in enumerate(hashes):
+        while candidates and hashes[candidates[-1]] >= value:
+            candidates.pop()
+        candidates.append(position)
+        if candidates[0] <= position - window:
+            candidates.popleft()
+        if position >= window - 1 and (not selected or selected[-1] != candidates[0]):
+            selected.append(candidates[0])
+    if not selected:
+        selected.append(candidates[0])  # Shorter than one window
+
+    line_col = submission.line_index.line_col
+    return [(hashes[position], line_col(tokens[position].start)[0], line_col(tokens[position + k - 1].end)[0])
+            for position in selected]
+
+
+def _permutation():
+    rng = random.Random(_SEED)
+    return rng.randrange(1, _MERSENNE), rng.randrange(_MERSENNE)
+
+
+def minhash(hashes, bins=NUM_PERMUTATIONS):
+    """MinHash signature of a non-empty set of fingerprint hashes.
+
+    One pass: each permuted hash goes to a bin, which keeps its minimum.
+    Empty bins borrow from the next non-empty bin, offset by the distance,
+    so the signatures of similar sets still agree bin by bin.
+    """
+    a, b = _permutation()
+    signature = [None] * bins
+    for value in hashes:
+        permuted = (a * value + b) % _MERSENNE
+        index = permuted % bins
+        value = permuted // bins
+        if signature[index] is None or value < signature[index]:
+            signature[index] = value
+    for index in range(bins):
+        distance = 1
+        while signature[index] is None:
+            borrowed = signature[(index + distance) % bins]
+            if borrowed is not None:
+                signature[index] = borrowed + distance * _MERSENNE
+            distance += 1
+    return tuple(signature)
+
+
+def candidate_pairs(signatures, bands=BANDS):
+    """Return the (student, student) pairs that share at least one LSH band bucket"""
+    buckets = {}
+    for student, signature in signatures.items():
+        rows = len(signature) // bands
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows])
+            buckets.setdefault(key, []).append(student)
+    pairs = set()
+    for members in buckets.values():
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                pairs.add((first, second) if first < second else (second, first))
+    return pairs
+
+
+def shared_regions(first, second, shared):
+    """Merge the fingerprints two submissions share into (a_start, a_end, b_start, b_end) line regions.
+
+    The longest regions come first.
+    """
+    second_lines = {}
+    for value, start, end in second:
+        second_lines.setdefault(value, (start, end))
+    matches = sorted((start, end) + second_lines[value] for value, start, end in first if value in shared)
+
+    regions = []
+    for a_start, a_end, b_start, b_end in matches:
+        if regions:
+            last = regions[-1]
+            # Same stretch if both sides continue where the last match ended
+            if a_start <= last[1] + 1 and last[2] - 1 <= b_start <= last[3] + 1:
+                last[1] = max(last[1], a_end)
+                last[3] = max(last[3], b_end)
+                continue
+        regions.append([a_start, a_end, b_start, b_end])
+    regions.sort(key=lambda region: (region[0] - region[1], region[0]))
+    return [tuple(region) for region in regions]
+
+
+def find_similar_pairs(fingerprints, threshold=DEFAULT_THRESHOLD, base=(),
+                       num_permutations=NUM_PERMUTATIONS, bands=BANDS):
+    """Rank the pairs of students whose fingerprints overlap by at least threshold.
+
+    `fingerprints` maps each student to fingerprint() output and `base` is
+    the fingerprints of code everyone was given, e.g. the marking scheme.
+    Returns dicts with the two students, their Jaccard similarity, the
+    number of shared fingerprints and the shared line regions, most
+    similar first.
+    """
+    ignored = {value for value, _, _ in base}
+    counts = {}
+    for entries in fingerprints.values():
+        for value in {value for value, _, _ in entries}:
+            counts[value] = counts.get(value, 0) + 1
+    if len(fingerprints) >= COMMON_MIN_COHORT:
+        limit = COMMON_FRACTION * len(fingerprints)
+        ignored.update(value for value, seen in counts.items() if seen > limit)
+
+    sets = {}
+    for student, entries in fingerprints.items():
+        hashes = {value for value, _, _ in entries} - ignored
+        if hashes:
+            sets[student] = hashes
+
+    signatures = {student: minhash(hashes, num_permutations) for student, hashes in sets.items()}
+
+    pairs = []
+    for first, second in candidate_pairs(signatures, bands):
+        shared = sets[first] & sets[second]
+        similarity = len(shared) / len(sets[first] | sets[second])
+        if similarity < threshold:
+            continue
+        pairs.append({
+            'students': (first, second),
+            'similarity': similarity,
+            'shared': len(shared),
+            'regions': shared_regions(fingerprints[first], fingerprints[second], shared),
+        })
+    pairs.sort(key=lambda pair: (-pair['similarity'], pair['students']))
+    return pairs
+
+
+def format_regions(regions):
+    return "; ".join(f"{a_start}-{a_end} ~ {b_start}-{b_end}" for a_start, a_end, b_start, b_end in regions)
+
+
+def write_similarity_report(path, pairs):
+    """Write ranked pairs as JSON when the name ends in .json, CSV otherwise"""
+    if path.lower().endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump([dict(pair, students=list(pair['students']),
+                            regions=[list(region) for region in pair['regions']]) for pair in pairs], f, indent=2)
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SIMILARITY_COLUMNS)
+        for pair in pairs:
+            writer.writerow(list(pair['students']) + [f"{pair['similarity']:.3f}", pair['shared'],
+                                                      format_regions(pair['regions'])])
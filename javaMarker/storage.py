@@ -0,0 +1,62 @@
+"""Where javaMarker keeps its files, and the bounded caches in front of them.
+
+Saved data (grading sessions, the results database) goes under the
+per-user data directory and rebuildable caches under the per-user cache
+directory: %LOCALAPPDATA%\\javaMarker on Windows, and the XDG data and
+cache directories elsewhere. Every location can be overridden by an
+environment variable.
+"""
+import os
+from collections import OrderedDict
+
+
+def _base(xdg_variable, *fallback):
+    if os.name == "nt":
+        return os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.environ.get(xdg_variable) or os.path.join(os.path.expanduser("~"), *fallback)
+
+
+def user_data_path(override_variable, *parts):
+    """Path under the per-user data directory, unless the environment variable names another"""
+    override = os.environ.get(override_variable)
+    if override:
+        return override
+    return os.path.join(_base("XDG_DATA_HOME", ".local", "share"), "javaMarker", *parts)
+
+
+def user_cache_dir(override_variable):
+    """Per-user cache directory, unless the environment variable names another"""
+    override = os.environ.get(override_variable)
+    if override:
+        return override
+    if os.name == "nt":
+        return os.path.join(_base("XDG_CACHE_HOME"), "javaMarker", "cache")
+    return os.path.join(_base("XDG_CACHE_HOME", ".cache"), "javaMarker")
+
+
+class LRUCache:
+    """Mapping that keeps only the `size` most recently used entries"""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value for key, or None, marking it as recently used"""
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Store a value, dropping the least recently used entries past the size"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,367 @@
+"""Structured (JSON or YAML) marking schemes with typed criterion matchers.
+
+A Java marking scheme can only say "this code must appear". In a
+structured scheme each criterion has a name, its marks and a matcher:
+
+    criteria:
+      - criterion: Loops over the scores
+        marks: 2
+        match:
+          any_of:
+            - tokens: "for ("
+            - tokens: "while ("
+      - criterion: Prints the average
+        marks: 1
+        match: {regex: 'System\\.out\\.println\\(.*average', timeout: 0.2}
+
+Matcher types:
+
+- tokens: a code token sequence, matched like a Java scheme criterion, so
+  layout and comments don't matter. A plain string is short for this.
+- literal: exact text in the code, comments excluded.
+- regex: a regular expression searched in the code, comments excluded
+  (^ and $ match at line ends).
+- structure: a tree pattern over the submission's parsed Java, e.g.
+  {class: Grades, contains: {method: average, returns: double}}, so
+  equivalent code written differently still matches (see
+  java_syntax.compile_query for the query format).
+- any_of: a list of matchers; the criterion is met if any one of them is.
+
+literal and regex take `ignore_case: true`. Every matcher is compiled
+once, when the scheme is loaded, and token sequences join the single
+automaton pass of the other criteria. A regex stops after `timeout`
+seconds (the scheme's top-level `timeout`, or DEFAULT_REGEX_TIMEOUT) and
+its criterion is left for manual review. The optional `regex` package
+interrupts the search itself; without it the search runs in a helper
+process, which is killed when the limit passes and restarted for the
+next one.
+
+YAML schemes need PyYAML; JSON schemes work with the standard library.
+"""
+import json
+import multiprocessing
+import re
+import threading
+
+from instrumentation import count
+from java_lexer import code_symbols
+from java_syntax import compile_query
+
+DEFAULT_REGEX_TIMEOUT = 0.5
+
+# The marks of each criterion, for highlighting in the scheme text
+STRUCTURED_MARK_PATTERN = re.compile(r'''["']?marks["']?\s*:\s*(\d+\.?\d*)''')
+
+# A top-level criteria key, unindented, anywhere in the scheme
+_CRITERIA_KEY = re.compile(r'''^["']?criteria["']?\s*:''', re.MULTILINE)
+
+
+class MatcherTimeout(Exception):
+    """A regex matcher ran past its time limit"""
+
+
+def detect_scheme_format(scheme_text):
+    """Return 'json', 'yaml' or 'java' from the content of a scheme.
+
+    A JSON object is JSON, and so is anything that looks like one with a
+    "criteria" key, so its syntax errors are reported. A document starting
+    with --- or with an unindented criteria key is YAML, whatever keys
+    (timeout, name, ...) come before it. Anything else is a Java scheme.
+    """
+    stripped = scheme_text.lstrip('\ufeff').strip()
+    if stripped.startswith('{') and stripped.endswith('}'):
+        try:
+            if isinstance(json.loads(stripped), dict):
+                return 'json'
+        except ValueError:
+            if '"criteria"' in stripped:
+                return 'json'
+    if stripped.startswith('---') or _CRITERIA_KEY.search(stripped):
+        return 'yaml'
+    return 'java'
+
+
+def find_structured_mark_spans(scheme_text):
+    """Return (start, end) character offsets of every criterion's marks"""
+    return [match.span(1) for match in STRUCTURED_MARK_PATTERN.finditer(scheme_text)]
+
+
+def _load_yaml(scheme_text):
+    try:
+        import yaml  # Only YAML schemes need it
+    except ImportError:
+        raise ValueError("YAML marking schemes need PyYAML (pip install pyyaml); "
+                         "JSON schemes work without it") from None
+    try:
+        return yaml.safe_load(scheme_text)
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid YAML marking scheme: {e}") from None
+
+
+def _compile_pattern(pattern, flags):
+    """Compile with the regex package when available, as only its searches can time out"""
+    try:
+        import regex
+    except ImportError:
+        return re.compile(pattern, flags), False
+    return regex.compile(pattern, flags), True
+
+
+def _search_worker(connection):
+    """Run regex searches sent by _SearchProcess until the pipe closes"""
+    compiled = {}
+    text = ""
+    connection.send(None)  # Started; the parent's clock runs from here
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] == 'text':
+            text = message[1]
+            continue
+        _, pattern, flags = message
+        if (pattern, flags) not in compiled:
+            compiled[pattern, flags] = re.compile(pattern, flags)
+        connection.send([match.span() for match in compiled[pattern, flags].finditer(text)])
+
+
+class _SearchProcess:
+    """Helper process for standard library regex searches, which can't be interrupted in-process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+        self.text = None  # Last text sent; several regexes search the same submission
+        self.unavailable = False
+
+    def search(self, pattern, flags, text, timeout):
+        """Return the spans of the pattern's matches in text, or None when no process can run.
+
+        Raises MatcherTimeout, killing the process, when the search takes
+        more than timeout seconds.
+        """
+        with self.lock:
+            if self.process is None and not self._start():
+                return None
+            try:
+                if text is not self.text:
+                    self.connection.send(('text', text))
+                    self.text = text
+                self.connection.send(('search', pattern, flags))
+                if self.connection.poll(timeout):
+                    return self.connection.recv()
+            except (OSError, EOFError):
+                pass  # The process died (e.g. out of memory); report it like an overrun
+            self._stop()
+        raise MatcherTimeout(pattern)
+
+    def _start(self):
+        if self.unavailable:
+            return False
+        try:
+            self.connection, child = multiprocessing.Pipe()
+            self.process = multiprocessing.Process(target=_search_worker, args=(child,), daemon=True)
+            self.process.start()
+            child.close()
+            self.connection.recv()
+        except Exception:
+            # E.g. inside a daemonic process, which may not have children
+            count("regex_process_unavailable")
+            self._stop()
+            self.unavailable = True
+            return False
+        return True
+
+    def _stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+        if self.connection is not None:
+            self.connection.close()
+        self.process = self.connection = self.text = None
+
+
+_search_process = _SearchProcess()
+
+
+class TokenMatcher:
+    """A code token sequence, found by the scheme's shared automaton"""
+
+    def __init__(self, code):
+        self.symbols = code_symbols(code)
+        if not self.symbols:
+            raise ValueError(f"tokens matcher {code!r} has no code tokens")
+        self.patterns = (self.symbols,)
+        self.reads_text = False
+
+    def find(self, submission, occurrences):
+        length = len(self.symbols)
+        return [(start, start + length) for start in occurrences.get(self.symbols, ())]
+
+
+class RegexMatcher:
+    """A regular expression searched in the submission's code text"""
+
+    def __init__(self, pattern, ignore_case=False, timeout=DEFAULT_REGEX_TIMEOUT):
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        if timeout is None:
+            self.compiled, self.interruptible = re.compile(pattern, flags), False
+        else:
+            try:
+                self.compiled, self.interruptible = _compile_pattern(pattern, flags)
+            except Exception as e:  # re.error or regex.error
+                raise ValueError(f"invalid regex {pattern!r}: {e}") from None
+        self.timeout = timeout  # Seconds, None for no limit
+        self.patterns = ()
+        self.reads_text = True
+
+    def find(self, submission, occurrences):
+        text = submission.code_text
+        matches = None
+        if self.interruptible:
+            try:
+                matches = [match.span() for match in self.compiled.finditer(text, timeout=self.timeout)]
+            except TimeoutError:
+                raise MatcherTimeout(self.compiled.pattern) from None
+        elif self.timeout is not None:
+            matches = _search_process.search(self.compiled.pattern, self.compiled.flags, text, self.timeout)
+        if matches is None:
+            matches = [match.span() for match in self.compiled.finditer(text)]
+        # Matches covering no code (e.g. only whitespace) don't count
+        ranges = (submission.token_range(start, end) for start, end in matches)
+        return [(start, end) for start, end in ranges if end > start]
+
+
+class LiteralMatcher(RegexMatcher):
+    """Exact text in the submission's code text"""
+
+    def __init__(self, text, ignore_case=False):
+        if not text:
+            raise ValueError("literal matcher is empty")
+        # An escaped literal can't backtrack, so it needs no time limit
+        super().__init__(re.escape(text), ignore_case, timeout=None)
+
+
+class StructureMatcher:
+    """A tree pattern evaluated on the submission's syntax tree"""
+
+    def __init__(self, query):
+        self.query = compile_query(query)
+        self.patterns = ()
+        self.reads_text = False
+
+    def find(self, submission, occurrences):
+        return self.query.find(submission.syntax_tree)
+
+
+class AnyOfMatcher:
+    """Alternatives, the first that matches wins"""
+
+    def __init__(self, alternatives):
+        if not alternatives:
+            raise ValueError("any_of matcher has no alternatives")
+        self.alternatives = alternatives
+        self.patterns = tuple(pattern for alternative in alternatives for pattern in alternative.patterns)
+        self.reads_text = any(alternative.reads_text for alternative in alternatives)
+
+    def find(self, submission, occurrences):
+        timed_out = None
+        for alternative in self.alternatives:
+            try:
+                ranges = alternative.find(submission, occurrences)
+            except MatcherTimeout as e:
+                timed_out = e  # A later alternative may still match
+                continue
+            if ranges:
+                return ranges
+        if timed_out is not None:
+            raise timed_out
+        return []
+
+
+_OPTIONS = {
+    'tokens': (),
+    'literal': ('ignore_case',),
+    'regex': ('ignore_case', 'timeout'),
+    'structure': (),
+    'any_of': (),
+}
+
+
+def compile_matcher(spec, default_timeout=DEFAULT_REGEX_TIMEOUT):
+    """Compile one matcher specification (see the module docstring)"""
+    if isinstance(spec, str):
+        return TokenMatcher(spec)
+    if not isinstance(spec, dict):
+        raise ValueError(f"matcher must be a string or a mapping, not {spec!r}")
+    kinds = [kind for kind in _OPTIONS if kind in spec]
+    if len(kinds) != 1:
+        raise ValueError(f"matcher needs exactly one of {', '.join(_OPTIONS)}: {spec!r}")
+    kind = kinds[0]
+    unknown = set(spec) - {kind} - set(_OPTIONS[kind])
+    if unknown:
+        raise ValueError(f"unknown {kind} matcher option(s): {', '.join(sorted(unknown))}")
+    value = spec[kind]
+
+    if kind == 'any_of':
+        if not isinstance(value, list):
+            raise ValueError("any_of takes a list of matchers")
+        return AnyOfMatcher([compile_matcher(item, default_timeout) for item in value])
+    if kind == 'structure':
+        return StructureMatcher(value)
+    if not isinstance(value, str):
+        raise ValueError(f"{kind} matcher takes a string, not {value!r}")
+    ignore_case = bool(spec.get('ignore_case', False))
+    if kind == 'tokens':
+        return TokenMatcher(value)
+    if kind == 'literal':
+        return LiteralMatcher(value, ignore_case)
+    timeout = spec.get('timeout', default_timeout)
+    if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or timeout <= 0:
+        raise ValueError(f"regex timeout must be a positive number of seconds, not {timeout!r}")
+    return RegexMatcher(value, ignore_case, float(timeout))
+
+
+def parse_structured_scheme(scheme_text, scheme_format):
+    """Parse a JSON or YAML scheme into (name, marks, matcher) triples.
+
+    Each matcher also gets a `key` that identifies its specification, for
+    caching results. Raises ValueError on anything malformed.
+    """
+    if scheme_format == 'yaml':
+        document = _load_yaml(scheme_text)
+    else:
+        try:
+            document = json.loads(scheme_text)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON marking scheme: {e}") from None
+    if not isinstance(document, dict) or not isinstance(document.get('criteria'), list):
+        raise ValueError("A structured marking scheme needs a 'criteria' list")
+
+    default_timeout = document.get('timeout', DEFAULT_REGEX_TIMEOUT)
+    criteria = []
+    names = set()
+    for number, entry in enumerate(document['criteria'], 1):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("must be a mapping")
+            name = entry.get('criterion')
+            if not isinstance(name, str) or not name.strip():
+                raise ValueError("needs a 'criterion' name")
+            name = name.strip()
+            if name in names:
+                raise ValueError(f"duplicate criterion {name!r}")
+            marks = entry.get('marks')
+            if not isinstance(marks, (int, float)) or isinstance(marks, bool) or marks < 0:
+                raise ValueError("needs non-negative 'marks'")
+            if 'match' not in entry:
+                raise ValueError("needs a 'match' matcher")
+            matcher = compile_matcher(entry['match'], default_timeout)
+        except ValueError as e:
+            raise ValueError(f"Criterion {number} of the marking scheme: {e}") from None
+        matcher.key = json.dumps([entry['match'], default_timeout], sort_keys=True, default=str)
+        names.add(name)
+        criteria.append((name, float(marks), matcher))
+    return criteria
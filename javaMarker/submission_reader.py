@@ -0,0 +1,199 @@
+"""Read a submission from a Java file, a project directory or a zip archive.
+
+The Java sources of a directory or archive are joined into one text,
+each file preceded by a marker comment naming it. Criteria are then
+matched across every source file in one pass, and the GUI shows the
+project as one document. The markers are Java comments, which matching
+ignores, built around FILE_SEPARATOR. That character is replaced in
+every source read, so only a real file boundary can carry it and a
+student can't fake one by writing a marker comment. The grader reads the
+markers back to record which file each match is in.
+
+Archive members are streamed straight out of the zip file and never
+extracted to disk. Bytes are decoded by byte-order mark, then as UTF-8,
+falling back to Windows-1252.
+"""
+import codecs
+import os
+import re
+import zipfile
+from collections import Counter
+
+SOURCE_SUFFIXES = ('.java',)
+ARCHIVE_SUFFIXES = ('.zip',)
+
+# Larger sources (or zip bombs) are skipped rather than read into memory
+MAX_SOURCE_BYTES = 4 * 1024 * 1024
+
+# Reserved for file markers; never left in a source or file name
+FILE_SEPARATOR = "\u241c"
+FILE_MARKER = "// " + FILE_SEPARATOR + " {name} " + FILE_SEPARATOR
+FILE_MARKER_PATTERN = re.compile("// " + FILE_SEPARATOR + " (.+) " + FILE_SEPARATOR + "$")
+
+# UTF-32 marks first: the UTF-32-LE mark starts with the UTF-16-LE one
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Tried in order when there is no byte-order mark; latin-1 decodes anything
+FALLBACK_ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+
+
+class SourceFile:
+    """One decoded source file of a submission"""
+
+    __slots__ = ('name', 'text', 'encoding')
+
+    def __init__(self, name, text, encoding):
+        self.name = name
+        self.text = text
+        self.encoding = encoding
+
+
+def decode_source(data):
+    """Return (text, encoding) for the raw bytes of a source file"""
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            text = data.decode(encoding, errors='replace')
+            break
+    else:
+        for encoding in FALLBACK_ENCODINGS:
+            try:
+                text = data.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+    # Same newlines as a file opened in text mode
+    return text.replace('\r\n', '\n').replace('\r', '\n'), encoding
+
+
+def is_source(name):
+    return name.lower().endswith(SOURCE_SUFFIXES)
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_submission(path):
+    """True for anything read_submission accepts"""
+    if os.path.isdir(path):
+        return True
+    return os.path.isfile(path) and (is_source(path) or is_archive(path))
+
+
+def _hidden(name):
+    # Dot files and the resource forks macOS adds to zip files
+    return any(part.startswith('.') or part == '__MACOSX' for part in name.split('/'))
+
+
+def _read_capped(f):
+    data = f.read(MAX_SOURCE_BYTES + 1)
+    return data if len(data) <= MAX_SOURCE_BYTES else None
+
+
+def iter_directory_sources(directory):
+    """Yield (relative name, bytes) for the Java sources under a directory, in name order"""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not _hidden(d))
+        for filename in sorted(files):
+            if not is_source(filename) or _hidden(filename):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as f:
+                data = _read_capped(f)
+            if data is not None:
+                yield os.path.relpath(path, directory).replace(os.sep, '/'), data
+
+
+def iter_archive_sources(path):
+    """Yield (member name, bytes) for the Java sources in a zip archive, in name order"""
+    with zipfile.ZipFile(path) as archive:
+        for info in sorted(archive.infolist(), key=lambda info: info.filename):
+            name = info.filename
+            if info.is_dir() or not is_source(name) or _hidden(name) or info.file_size > MAX_SOURCE_BYTES:
+                continue
+            with archive.open(info) as member:
+                data = _read_capped(member)
+            if data is not None:
+                yield name, data
+
+
+def read_sources(path):
+    """Return the SourceFiles of a submission file, directory or zip archive"""
+    if os.path.isdir(path):
+        members = iter_directory_sources(path)
+    elif is_archive(path):
+        members = iter_archive_sources(path)
+    else:
+        with open(path, 'rb') as f:
+            members = [(os.path.basename(path), f.read())]
+    sources = [SourceFile(name, *decode_source(data)) for name, data in members]
+    if not sources:
+        raise ValueError(f"no Java source files in {os.path.basename(path)}")
+    return sources
+
+
+def _without_separator(text):
+    return text.replace(FILE_SEPARATOR, '\ufffd')
+
+
+def join_sources(sources, markers=True):
+    """Return the one text graded for the sources, with a marker line before each file"""
+    if not markers and len(sources) == 1:
+        return _without_separator(sources[0].text)
+    parts = []
+    for source in sources:
+        text = _without_separator(source.text)
+        if text and not text.endswith('\n'):
+            text += '\n'
+        parts.append(FILE_MARKER.format(name=_without_separator(source.name)) + '\n' + text)
+    return ''.join(parts)
+
+
+def read_submission(path):
+    """Return the text to grade for a submission.
+
+    A single Java file is returned as it is; directories and archives are
+    joined with file markers, even when they hold only one file.
+    """
+    return join_sources(read_sources(path), markers=os.path.isdir(path) or is_archive(path))
+
+
+def submission_name(path):
+    """Default student name for a submission: its file or directory name"""
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+
+def submission_names(paths):
+    """Student names for a cohort of submissions, unique among them.
+
+    Submissions that would share a name (alice.java, alice.zip and the
+    directory alice) are named alice.java, alice.zip and alice/ instead;
+    any still the same are numbered.
+    """
+    names = [submission_name(path) for path in paths]
+    shared = {name for name, uses in Counter(names).items() if uses > 1}
+    names = [_full_name(path) if name in shared else name for path, name in zip(paths, names)]
+    taken = set(names)
+    seen = set()
+    unique = []
+    for name in names:
+        if name in seen:
+            number = 2
+            while f"{name} ({number})" in taken:
+                number += 1
+            name = f"{name} ({number})"
+            taken.add(name)
+        seen.add(name)
+        unique.append(name)
+    return unique
+
+
+def _full_name(path):
+    name = os.path.basename(os.path.normpath(path))
+    return name + "/" if os.path.isdir(path) else name
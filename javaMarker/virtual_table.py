@@ -0,0 +1,208 @@
+"""Virtualized Treeview over a ResultsModel.
+
+Only the rows that fit in the widget exist as Treeview items; scrolling
+swaps which model rows fill them. Items use the model keys as their ids,
+so selection, identify_row and bbox work as on a plain Treeview. Filters
+and sorting only reorder the list of keys, never the widget.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+DEFAULT_ROW_HEIGHT = 20
+
+
+class VirtualTable:
+    """Show a window of a ResultsModel in a ttk.Treeview"""
+
+    def __init__(self, parent, model, row_display, columns, **tree_options):
+        # row_display(row) -> (values, tags) for one model row
+        self.model = model
+        self.row_display = row_display
+
+        self.vscroll = ttk.Scrollbar(parent, command=self.yview)
+        self.vscroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = ttk.Treeview(parent, columns=columns, **tree_options)
+
+        self.statuses = None  # Shown statuses, or None for every row
+        self.sort_field = None
+        self.sort_reverse = False
+        self.headings = {}  # column -> (heading text, row field) for sortable columns
+
+        self.view = []  # Model keys in display order
+        self.offset = 0  # Index in view of the first visible row
+        self.visible_rows = int(tree_options.get('height', 10))
+        self._dirty = True
+        self._redraw_pending = False
+
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Up>", lambda event: self._on_arrow(-1))
+        self.tree.bind("<Down>", lambda event: self._on_arrow(1))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-self.visible_rows) or "break")
+        self.tree.bind("<Next>", lambda event: self.scroll(self.visible_rows) or "break")
+
+    # ---- View contents ----
+
+    def set_model(self, model):
+        self.model = model
+        self.offset = 0
+        self.refresh()
+
+    def set_filter(self, statuses):
+        """Show only rows with one of the given statuses; None shows every row"""
+        self.statuses = statuses
+        self.offset = 0
+        self.refresh()
+
+    def sortable(self, column, field):
+        """Sort by a row field when the column heading is clicked"""
+        self.headings[column] = (self.tree.heading(column, 'text'), field)
+        self.tree.heading(column, command=lambda: self.sort_by(field))
+
+    def sort_by(self, field):
+        """Sort on a row field; a second click reverses, a third restores table order"""
+        if self.sort_field != field:
+            self.sort_field, self.sort_reverse = field, False
+        elif not self.sort_reverse:
+            self.sort_reverse = True
+        else:
+            self.sort_field, self.sort_reverse = None, False
+        for column, (text, heading_field) in self.headings.items():
+            if heading_field == self.sort_field:
+                text += " ▼" if self.sort_reverse else " ▲"
+            self.tree.heading(column, text=text)
+        self.refresh()
+
+    def _build_view(self):
+        if self.statuses is None:
+            keys = self.model.keys()
+        else:
+            keys = self.model.keys_with_status(self.statuses)
+        if self.sort_field is not None:
+            field = self.sort_field
+            get = self.model.get
+            keys.sort(key=lambda key: getattr(get(key), field), reverse=self.sort_reverse)
+        return keys
+
+    # ---- Rendering ----
+
+    def refresh(self):
+        """Rebuild the view and redraw once the current event is handled"""
+        self._dirty = True
+        self._schedule_redraw()
+
+    def rows_changed(self):
+        """Redraw after rows were edited; the view is rebuilt if order or filter may move them"""
+        if self.statuses is not None or self.sort_field is not None:
+            self._dirty = True
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        # Many model changes in one event cost one redraw
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.tree.after_idle(self._redraw_if_pending)
+
+    def _redraw_if_pending(self):
+        # An explicit redraw() since scheduling already did the work
+        if self._redraw_pending:
+            self.redraw()
+
+    def redraw(self):
+        """Fill the Treeview with the visible window of the view"""
+        self._redraw_pending = False
+        if self._dirty:
+            self.view = self._build_view()
+            self._dirty = False
+        self.offset = max(0, min(self.offset, len(self.view) - self.visible_rows))
+        window = self.view[self.offset:self.offset + self.visible_rows]
+
+        tree = self.tree
+        if list(tree.get_children()) == window:
+            for key in window:
+                values, tags = self.row_display(self.model.get(key))
+                tree.item(key, values=values, tags=tags)
+        else:
+            selection = tree.selection()
+            focus = tree.focus()
+            tree.delete(*tree.get_children())
+            for key in window:
+                values, tags = self.row_display(self.model.get(key))
+                tree.insert('', tk.END, iid=key, values=values, tags=tags)
+            kept = [key for key in selection if tree.exists(key)]
+            if kept:
+                tree.selection_set(kept)
+            if focus and tree.exists(focus):
+                tree.focus(focus)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = len(self.view)
+        if not total:
+            self.vscroll.set(0.0, 1.0)
+            return
+        self.vscroll.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
+
+    # ---- Scrolling ----
+
+    def scroll(self, rows):
+        """Move the visible window by a number of rows"""
+        offset = max(0, min(self.offset + rows, len(self.view) - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.redraw()
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * len(self.view))
+            self.redraw()
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.scroll(int(args[1]) * step)
+
+    def see(self, key):
+        """Scroll so that a model row is visible and return True if it is in the view"""
+        if self._dirty:
+            self.redraw()
+        try:
+            index = self.view.index(key)
+        except ValueError:
+            return False
+        if not self.offset <= index < self.offset + self.visible_rows:
+            self.offset = index - self.visible_rows // 2
+            self.redraw()
+        return True
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_arrow(self, step):
+        # Inside the window the Treeview moves the focus itself
+        children = self.tree.get_children()
+        if not children or self.tree.focus() != children[0 if step < 0 else -1]:
+            return None
+        before = self.offset
+        self.scroll(step)
+        if self.offset != before:
+            children = self.tree.get_children()
+            key = children[0] if step < 0 else children[-1]
+            self.tree.selection_set(key)
+            self.tree.focus(key)
+        return "break"
+
+    def _on_configure(self, event):
+        # Fit as many rows as the widget's height allows
+        children = self.tree.get_children()
+        bbox = self.tree.bbox(children[0]) if children else None
+        if bbox:
+            header, row_height = bbox[1], bbox[3]
+        else:
+            header = row_height = DEFAULT_ROW_HEIGHT
+        rows = max(1, (event.height - header) // max(1, row_height))
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.redraw()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The modules import each other as siblings, the way the GUI and batch grader run them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'javaMarker'))
+
+import result_cache  # noqa: E402
+import scheme_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Give every test its own cache directory and empty in-memory caches"""
+    monkeypatch.setenv("JAVAMARKER_CACHE_DIR", str(tmp_path / "cache"))
+    scheme_cache.clear_memory_cache()
+    result_cache.clear_memory_cache()
+    yield
+    scheme_cache.clear_memory_cache()
+    result_cache.clear_memory_cache()
@@ -0,0 +1,35 @@
+import random
+
+from aho_corasick import AhoCorasick
+
+
+def brute_force(patterns, text):
+    return sorted((start, index) for index, pattern in enumerate(patterns) if pattern
+                  for start in range(len(text) - len(pattern) + 1) if text[start:start + len(pattern)] == pattern)
+
+
+def test_overlapping_and_nested_patterns():
+    patterns = ["he", "she", "his", "hers"]
+    matches = sorted(AhoCorasick(patterns).iter_matches("ushers"))
+    assert matches == [(1, 1), (2, 0), (2, 3)]
+
+
+def test_matches_agree_with_brute_force():
+    rng = random.Random(4)
+    for _ in range(200):
+        patterns = ["".join(rng.choice("ab") for _ in range(rng.randint(0, 4))) for _ in range(5)]
+        text = "".join(rng.choice("abc") for _ in range(30))
+        assert sorted(AhoCorasick(patterns).iter_matches(text)) == brute_force(patterns, text)
+
+
+def test_find_all_takes_non_overlapping_occurrences_from_the_left():
+    assert AhoCorasick(["aa", "b"]).find_all("aaaab") == {0: [0, 2], 1: [4]}
+
+
+def test_token_sequences():
+    automaton = AhoCorasick([("int", "x", ";"), ("x",)])
+    assert automaton.find_all(["int", "x", ";", "x"]) == {0: [0], 1: [1, 3]}
+
+
+def test_empty_patterns_never_match():
+    assert AhoCorasick(["", "a"]).find_all("aa") == {1: [0, 1]}
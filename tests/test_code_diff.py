@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from code_diff import DiffTooLarge, diff_sequences, diff_texts
+
+
+def longest_common_subsequence(a, b):
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def check_opcodes(a, b, codes):
+    """The opcodes cover both sequences in order and rebuild b from a"""
+    i = j = 0
+    rebuilt = []
+    for tag, i1, i2, j1, j2 in codes:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+        else:
+            assert i2 > i1 or j2 > j1
+        rebuilt.extend(b[j1:j2])
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    assert rebuilt == list(b)
+
+
+def test_opcodes():
+    assert diff_sequences("abcd", "abxd") == [('equal', 0, 2, 0, 2), ('replace', 2, 3, 2, 3), ('equal', 3, 4, 3, 4)]
+    assert diff_sequences("ab", "") == [('delete', 0, 2, 0, 0)]
+    assert diff_sequences("", "ab") == [('insert', 0, 0, 0, 2)]
+
+
+@pytest.mark.parametrize("patience", [False, True])
+def test_random_opcodes_are_consistent(patience):
+    rng = random.Random(1)
+    for _ in range(500):
+        a = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        b = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        codes = diff_sequences(a, b, patience=patience)
+        check_opcodes(a, b, codes)
+        if not patience:
+            # Plain Myers finds a longest common subsequence
+            equal = sum(i2 - i1 for tag, i1, i2, _, _ in codes if tag == 'equal')
+            assert equal == longest_common_subsequence(a, b)
+
+
+def test_work_budget():
+    rng = random.Random(2)
+    a = [rng.random() for _ in range(2000)]
+    b = [rng.random() for _ in range(2000)]
+    with pytest.raises(DiffTooLarge):
+        diff_sequences(a, b, max_work=1000, patience=False)
+
+
+def test_text_diff_ignores_whitespace_and_marks_changed_tokens():
+    diff = diff_texts("int x = 5;\nreturn x;\n", "int  x=5;\nreturn y;\n")
+    assert diff.exact
+    assert diff.removed_lines == [2] and diff.added_lines == [2]
+    assert diff.removed_spans == [(2, 7, 2, 8)] and diff.added_spans == [(2, 7, 2, 8)]
+    assert diff_texts("a;\n", " a ;\n").unchanged
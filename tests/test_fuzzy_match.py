@@ -0,0 +1,48 @@
+import random
+
+from fuzzy_match import FuzzyIndex, max_edits
+
+
+def best_distance(pattern, text):
+    """Smallest edit distance between the pattern and any non-empty stretch of text (plain Sellers DP)"""
+    column = list(range(len(pattern) + 1))
+    best = None
+    for symbol in text:
+        next_column = [0]
+        for i in range(1, len(pattern) + 1):
+            next_column.append(min(column[i - 1] + (pattern[i - 1] != symbol), column[i] + 1, next_column[i - 1] + 1))
+        column = next_column
+        best = column[-1] if best is None else min(best, column[-1])
+    return best
+
+
+def test_max_edits():
+    assert max_edits(10, 0.8) == 2
+    assert max_edits(4, 0.8) == 0
+    assert max_edits(5, 0.8) == 1
+
+
+def test_finds_a_near_miss_and_its_position():
+    symbols = "int total = 0 ; for ( int i = 0 ; i < n ; i ++ ) { sum += i ; }".split()
+    match = FuzzyIndex(symbols).search("total += i ;".split(), 0.7)
+    assert match.distance == 1
+    assert symbols[match.start:match.end] == ["sum", "+=", "i", ";"]
+    assert match.score == 0.75
+
+
+def test_nothing_below_the_threshold():
+    assert FuzzyIndex("a b c d".split()).search("w x y z".split(), 0.5) is None
+
+
+def test_agrees_with_brute_force():
+    rng = random.Random(5)
+    for _ in range(500):
+        text = [rng.choice("abcd") for _ in range(rng.randrange(80))]
+        pattern = [rng.choice("abcd") for _ in range(rng.randrange(1, 15))]
+        threshold = rng.choice([0.5, 0.6, 0.7, 0.8, 0.9])
+        k = max_edits(len(pattern), threshold)
+        expected = best_distance(pattern, text) if text and k < len(pattern) else None
+        if expected is not None and expected > k:
+            expected = None
+        match = FuzzyIndex(text).search(pattern, threshold)
+        assert (match.distance if match else None) == expected, (pattern, text, threshold)
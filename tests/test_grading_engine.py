@@ -0,0 +1,81 @@
+import pytest
+
+from grading_engine import (STATUS_FOUND, STATUS_NOT_FOUND, STATUS_PARTIAL, CompiledScheme,
+                            NormalizedSubmission, grade_rows, grade_submission, parse_marking_scheme)
+
+SCHEME = """public class Hello {  // 1
+    public static void main(String[] args) { // 2.0
+        int x = 5; // 1.5
+        System.out.println("Hello World"); /* 2 */
+        total += i; // 1
+    }
+}
+"""
+
+SUBMISSION = """public class Hello {
+    public static void main(String[] args){
+        int x=5;
+        // System.out.println("Hello World");
+        sum += i;
+    }
+}
+"""
+
+
+def by_criteria(result):
+    return {row.criteria: row for row in result.rows}
+
+
+def test_parse_marking_scheme():
+    criteria = parse_marking_scheme(SCHEME)
+    assert [(c.text, c.allocated, c.line) for c in criteria] == [
+        ("public class Hello {", 1.0, 1),
+        ("public static void main(String[] args) {", 2.0, 2),
+        ("int x = 5;", 1.5, 3),
+        ('System.out.println("Hello World");', 2.0, 4),
+        ("total += i;", 1.0, 5),
+    ]
+
+
+def test_layout_does_not_matter_but_comments_do():
+    rows = by_criteria(grade_submission(SCHEME, SUBMISSION))
+    assert rows["int x = 5;"].status == STATUS_FOUND
+    assert rows["int x = 5;"].awarded == 1.5
+    assert rows["int x = 5;"].spans == [(3, 8, 3, 16)]
+    # Commented-out code is not code
+    assert rows['System.out.println("Hello World");'].status == STATUS_NOT_FOUND
+    assert rows['System.out.println("Hello World");'].awarded == 0.0
+    assert rows['System.out.println("Hello World");'].scheme_line == 4
+
+
+def test_totals():
+    result = grade_submission(SCHEME, SUBMISSION)
+    assert result.total_marks == 7.5
+    assert result.achieved_marks == 4.5
+
+
+def test_totals_do_not_show_float_drift():
+    scheme = "int a; // 0.1\nint b; // 0.2\n"
+    assert CompiledScheme(scheme).total_marks == 0.3
+    assert grade_submission(scheme, "int a; int b;").achieved_marks == 0.3
+
+
+def test_partial_credit_is_off_by_default():
+    rows = by_criteria(grade_submission(SCHEME, SUBMISSION))
+    assert rows["total += i;"].status == STATUS_NOT_FOUND
+
+
+def test_partial_credit_for_near_misses():
+    compiled = CompiledScheme(SCHEME)
+    result = grade_rows(compiled.new_rows(), NormalizedSubmission(SUBMISSION), SCHEME, compiled.matcher,
+                        fuzzy_threshold=0.7)
+    row = by_criteria(result)["total += i;"]
+    assert row.status == STATUS_PARTIAL
+    assert 0.7 <= row.score < 1.0
+    assert 0.0 < row.awarded < row.allocated
+
+
+@pytest.mark.parametrize("text", ["", "class A {}\n", "name: Lab 3\n"])
+def test_scheme_without_criteria_is_an_error(text):
+    with pytest.raises(ValueError, match="no criteria"):
+        CompiledScheme(text)
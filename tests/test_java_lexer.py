@@ -0,0 +1,35 @@
+from java_lexer import (CHAR, COMMENT, IDENTIFIER, KEYWORD, NUMBER, OPERATOR, SEPARATOR, STRING, TEXT_BLOCK,
+                        code_symbols, tokenize)
+
+
+def kinds(source):
+    return [(token.kind, token.text) for token in tokenize(source)]
+
+
+def test_token_kinds():
+    assert kinds('int x = 0x1F; // hi') == [
+        (KEYWORD, 'int'), (IDENTIFIER, 'x'), (OPERATOR, '='), (NUMBER, '0x1F'), (SEPARATOR, ';'),
+        (COMMENT, '// hi'),
+    ]
+
+
+def test_longest_operator_wins():
+    assert [text for _, text in kinds('a >>>= b :: c ... d')] == ['a', '>>>=', 'b', '::', 'c', '...', 'd']
+
+
+def test_literals_keep_their_whitespace_and_hide_comment_markers():
+    assert kinds('s = "a  // b"; c = \'/\';') == [
+        (IDENTIFIER, 's'), (OPERATOR, '='), (STRING, '"a  // b"'), (SEPARATOR, ';'),
+        (IDENTIFIER, 'c'), (OPERATOR, '='), (CHAR, "'/'"), (SEPARATOR, ';'),
+    ]
+    assert kinds('"""\n  x /* y */\n"""') == [(TEXT_BLOCK, '"""\n  x /* y */\n"""')]
+
+
+def test_offsets_point_into_the_source():
+    source = 'class  A {\n}'
+    assert all(source[token.start:token.end] == token.text for token in tokenize(source))
+
+
+def test_code_symbols_drop_comments_and_layout():
+    assert code_symbols('for(int i=0;i<n;i++) /* loop */ {') == code_symbols('for (int i = 0; i < n; i++) {')
+    assert code_symbols('/* unterminated') == ()
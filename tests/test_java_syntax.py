@@ -0,0 +1,77 @@
+import pytest
+
+from grading_engine import NormalizedSubmission
+from java_syntax import compile_query
+
+GRADES = """import java.util.*;
+
+public class Grades {
+    private final List<Integer> scores = new ArrayList<>();
+
+    static public double average() {
+        int total = 0;
+        for (int score : scores)
+            total = total + score;
+        return total / (double) scores.size();
+    }
+
+    public void add(int score) {
+        if (score >= 0) { scores.add(score); }
+        System.out.println("added " + score);
+    }
+}
+"""
+
+
+def matched_text(spec, source=GRADES):
+    submission = NormalizedSubmission(source)
+    return [" ".join(submission.symbols[start:end]) for start, end in compile_query(spec).find(submission.syntax_tree)]
+
+
+def test_method_with_modifiers_in_any_order():
+    spec = {'class': 'Grades', 'contains': {'method': 'average', 'returns': 'double',
+                                            'modifiers': ['public', 'static']}}
+    # The matched node and what it contains are all highlighted
+    assert matched_text(spec) == ['public class Grades', 'static public double average ( )']
+
+
+@pytest.mark.parametrize("body", ["total++;", "++total;", "total += 1;", "{ total = total + 1; }"])
+def test_equivalent_increments(body):
+    spec = {'method': 'average', 'contains': {'loop': 'foreach', 'contains': {'increment': 'total'}}}
+    assert matched_text(spec, GRADES.replace("total = total + score;", body))[:2] == [
+        'static public double average ( )', 'for ( int score : scores )']
+
+
+def test_adding_another_variable_is_not_an_increment():
+    assert matched_text({'increment': 'total'}) == []
+    assert matched_text({'assign': 'total'}) == ['total = total + score']
+
+
+def test_missing_structure_finds_nothing():
+    assert matched_text({'method': 'average', 'contains': {'loop': 'while'}}) == []
+    assert matched_text({'class': 'Grades', 'extends': 'Object'}) == []
+
+
+def test_globs_and_qualified_calls():
+    assert matched_text({'method': 'a*'}) == ['static public double average ( )', 'public void add ( int score )']
+    assert len(matched_text({'call': 'System.out.println'})) == 1
+    assert matched_text({'method': 'add', 'params': ['int'], 'contains': {'if': True}}) == [
+        'public void add ( int score )', 'if ( score >= 0 )']
+    assert matched_text({'method': 'add', 'params': ['double']}) == []
+
+
+def test_half_finished_code_still_parses():
+    assert len(matched_text({'method': 'average'}, "class A { double average() { for (;; ")) == 1
+
+
+@pytest.mark.parametrize("spec", [
+    {'loop': 'until'},
+    {'method': 'x', 'extends': 'Y'},
+    {'class': 3},
+    {'class': 'A', 'contains': 5},
+    {'method': 'x', 'modifiers': ['publik']},
+    {'class': 'A', 'method': 'b'},
+])
+def test_malformed_queries(spec):
+    with pytest.raises(ValueError):
+        compile_query(spec)
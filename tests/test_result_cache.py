@@ -0,0 +1,51 @@
+import os
+import time
+
+import scheme_cache
+from grading_engine import STATUS_FOUND, CompiledScheme, NormalizedSubmission
+from result_cache import clear_memory_cache, grade_rows_cached, load_grades, result_key
+from scheme_cache import prune_cache_dir
+
+SCHEME = "int x = 5; // 1\nreturn x; // 2\n"
+
+
+def test_layout_only_changes_reuse_the_result(tmp_path):
+    compiled = CompiledScheme(SCHEME)
+    first = NormalizedSubmission("int x = 5;\nreturn x;\n")
+    second = NormalizedSubmission("int x=5; // same code\n\n   return x;")
+    assert result_key(compiled.new_rows(), first) == result_key(compiled.new_rows(), second)
+
+    grade_rows_cached(compiled.new_rows(), first, SCHEME, compiled.matcher, cache_dir=str(tmp_path))
+    clear_memory_cache()
+    rows = grade_rows_cached(compiled.new_rows(), second, SCHEME, compiled.matcher, cache_dir=str(tmp_path)).rows
+    assert [row.status for row in rows] == [STATUS_FOUND, STATUS_FOUND]
+    # Replayed spans point into the submission at hand
+    assert rows[1].spans == [(3, 3, 3, 12)]
+
+
+def test_key_depends_on_what_grading_depends_on():
+    compiled = CompiledScheme(SCHEME)
+    submission = NormalizedSubmission("int x = 5;\n")
+    key = result_key(compiled.new_rows(), submission)
+    assert result_key(compiled.new_rows(), submission, fuzzy_threshold=0.8) != key
+    assert result_key(compiled.new_rows(), NormalizedSubmission("int y = 5;\n")) != key
+    assert result_key(CompiledScheme("int x = 5; // 2\n").new_rows(), submission) != key
+
+
+def test_unknown_key():
+    assert load_grades("0" * 64) is None
+
+
+def test_prune_by_age_then_size(tmp_path):
+    now = time.time()
+    for number in range(6):
+        path = tmp_path / f"result-{number}.pickle"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - 100 + number, now - 100 + number))
+    stale = tmp_path / "result-old.pickle"
+    stale.write_bytes(b"x")
+    os.utime(stale, (now - scheme_cache.DISK_CACHE_MAX_AGE - 1,) * 2)
+
+    assert prune_cache_dir(str(tmp_path), max_bytes=350) == 4
+    # The most recently used entries stay
+    assert sorted(os.listdir(tmp_path)) == ["result-3.pickle", "result-4.pickle", "result-5.pickle"]
@@ -0,0 +1,46 @@
+import os
+import pickle
+
+import scheme_cache
+from grading_engine import CompiledScheme
+from scheme_cache import clear_memory_cache, load_compiled_scheme, scheme_digest
+
+SCHEME = "int x = 5; // 1\nreturn x; // 2\n"
+
+
+def cached_files(cache_dir):
+    return sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []
+
+
+def test_memory_then_disk_hits(tmp_path):
+    compiled = load_compiled_scheme(SCHEME, cache_dir=str(tmp_path))
+    assert load_compiled_scheme(SCHEME, cache_dir=str(tmp_path)) is compiled
+    assert cached_files(str(tmp_path)) == [f"scheme-{compiled.digest}.pickle"]
+
+    clear_memory_cache()
+    from_disk = load_compiled_scheme(SCHEME, cache_dir=str(tmp_path))
+    assert from_disk is not compiled
+    assert [c.text for c in from_disk.criteria] == [c.text for c in compiled.criteria]
+
+
+def test_format_version_bump_invalidates_entries(tmp_path, monkeypatch):
+    old = load_compiled_scheme(SCHEME, cache_dir=str(tmp_path))
+    monkeypatch.setattr(scheme_cache, "CACHE_FORMAT_VERSION", scheme_cache.CACHE_FORMAT_VERSION + 1)
+    clear_memory_cache()
+    new = load_compiled_scheme(SCHEME, cache_dir=str(tmp_path))
+    assert new.digest != old.digest
+    assert len(cached_files(str(tmp_path))) == 2
+
+
+def test_mismatched_or_corrupt_entries_are_rebuilt(tmp_path):
+    digest = scheme_digest(SCHEME)
+    path = tmp_path / f"scheme-{digest}.pickle"
+    # An entry written for another scheme, e.g. by an older build
+    path.write_bytes(pickle.dumps(CompiledScheme("int y; // 9\n", "other")))
+    compiled = load_compiled_scheme(SCHEME, cache_dir=str(tmp_path))
+    assert compiled.digest == digest and [c.allocated for c in compiled.criteria] == [1.0, 2.0]
+
+    clear_memory_cache()
+    path.write_bytes(b"truncated")
+    assert load_compiled_scheme(SCHEME, cache_dir=str(tmp_path)).total_marks == 3.0
+
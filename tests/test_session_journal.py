@@ -0,0 +1,61 @@
+import json
+
+from grading_engine import CompiledScheme
+from results_model import ResultsModel
+from session_journal import SessionJournal, session_key
+
+SCHEME = "int x = 5; // 1\nreturn x; // 2\n"
+
+
+def edited_session(session_dir):
+    key = session_key(SCHEME, "int x = 5;\n")
+    journal = SessionJournal(key, str(session_dir))
+    model = ResultsModel(CompiledScheme(SCHEME).new_rows())
+    journal.attach(model)
+    first, second = model.keys()
+    model.update(first, awarded=0.5, comments="Nearly")
+    model.remove(second)
+    return key, journal, model
+
+
+def table(model):
+    return [(key, row.criteria, row.awarded, row.comments) for key, row in model.items()]
+
+
+def test_restore_after_a_crash_replays_the_journal(tmp_path):
+    key, journal, model = edited_session(tmp_path)
+    # No detach: the program died with the edits only in the journal
+    restored = SessionJournal(key, str(tmp_path)).restore()
+    assert table(restored) == table(model)
+    assert restored.achieved_marks == 0.5
+
+
+def test_torn_final_line_is_ignored(tmp_path):
+    key, journal, model = edited_session(tmp_path)
+    with open(journal.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 99, "op": "upd')
+    assert table(SessionJournal(key, str(tmp_path)).restore()) == table(model)
+
+
+def test_detach_compacts_into_the_snapshot(tmp_path):
+    key, journal, model = edited_session(tmp_path)
+    journal.detach()
+    with open(journal.journal_path, encoding='utf-8') as f:
+        assert f.read() == ""
+    assert table(SessionJournal(key, str(tmp_path)).restore()) == table(model)
+
+
+def test_other_formats_and_missing_sessions_are_not_restored(tmp_path):
+    key, journal, model = edited_session(tmp_path)
+    journal.detach()
+    with open(journal.snapshot_path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    snapshot['version'] = -1
+    with open(journal.snapshot_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    assert SessionJournal(key, str(tmp_path)).restore() is None
+    assert SessionJournal(session_key(SCHEME, "other"), str(tmp_path)).restore() is None
+
+
+def test_key_depends_on_both_texts():
+    assert session_key("a", "bc") != session_key("ab", "c")
@@ -0,0 +1,114 @@
+import importlib.util
+import json
+
+import pytest
+
+from grading_engine import STATUS_FOUND, STATUS_NOT_FOUND, TIMED_OUT_COMMENT, CompiledScheme, NormalizedSubmission
+from result_cache import grade_rows_cached, load_grades, result_key
+from structured_scheme import detect_scheme_format
+
+needs_yaml = pytest.mark.skipif(importlib.util.find_spec("yaml") is None, reason="YAML schemes need PyYAML")
+
+YAML_SCHEME = """timeout: 1
+name: Lab 3
+criteria:
+  - criterion: Loops over the scores
+    marks: 2
+    match:
+      any_of:
+        - tokens: "for ("
+        - tokens: "while ("
+  - criterion: Prints the average
+    marks: 1
+    match: {regex: 'System\\.out\\.println\\(.*average', ignore_case: true}
+  - criterion: Has an average method
+    marks: 1.5
+    match: {structure: {method: average, returns: double}}
+  - criterion: Says hello
+    marks: 0.5
+    match: {literal: hello}
+"""
+
+SUBMISSION = """class Grades {
+    double average() {
+        int i = 0;
+        while (i < 3) { i++; }
+        // System.out.println("hello");
+        System.out.println("Average: " + i);
+        return i;
+    }
+}
+"""
+
+
+def grade(scheme_text, submission_text):
+    compiled = CompiledScheme(scheme_text)
+    result = grade_rows_cached(compiled.new_rows(), NormalizedSubmission(submission_text), scheme_text,
+                               compiled.matcher)
+    return {row.criteria: row for row in result.rows}
+
+
+@pytest.mark.parametrize("text, scheme_format", [
+    (YAML_SCHEME, 'yaml'),
+    ("---\ncriteria: []\n", 'yaml'),
+    ('{"timeout": 1, "criteria": []}', 'json'),
+    ('{"criteria": [,]}', 'json'),
+    ("public class A { // 1\n    int criteria = 3; // 1\n}\n", 'java'),
+    ("{ int x = 5; // 1\n}\n", 'java'),
+])
+def test_detect_scheme_format(text, scheme_format):
+    assert detect_scheme_format(text) == scheme_format
+
+
+@needs_yaml
+def test_yaml_scheme_with_leading_keys():
+    rows = grade(YAML_SCHEME, SUBMISSION)
+    assert [(name, row.allocated) for name, row in rows.items()] == [
+        ("Loops over the scores", 2.0), ("Prints the average", 1.0), ("Has an average method", 1.5),
+        ("Says hello", 0.5)]
+    assert rows["Loops over the scores"].status == STATUS_FOUND
+    assert rows["Prints the average"].status == STATUS_FOUND
+    assert rows["Has an average method"].status == STATUS_FOUND
+    # Literals and regexes don't see comments
+    assert rows["Says hello"].status == STATUS_NOT_FOUND
+
+
+def test_json_scheme():
+    scheme = json.dumps({'criteria': [{'criterion': 'Declares i', 'marks': 1, 'match': 'int i = 0;'}]})
+    assert grade(scheme, SUBMISSION)["Declares i"].awarded == 1.0
+
+
+@pytest.mark.parametrize("scheme, message", [
+    ('{"criteria": [{"criterion": "a", "marks": 1}]}', "needs a 'match' matcher"),
+    ('{"criteria": [{"criterion": "a", "marks": -1, "match": "x"}]}', "non-negative 'marks'"),
+    ('{"criteria": [{"criterion": "a", "marks": 1, "match": {"regex": "("}}]}', "invalid regex"),
+    ('{"criteria": [{"criterion": "a", "marks": 1, "match": {"regex": "a", "timeout": 0}}]}', "timeout"),
+    ('{"criteria": [{"criterion": "a", "marks": 1, "match": "x"}, {"criterion": "a", "marks": 1, "match": "y"}]}',
+     "duplicate criterion"),
+    ('{"criteria": "none"}', "'criteria' list"),
+])
+def test_malformed_schemes(scheme, message):
+    with pytest.raises(ValueError, match=message):
+        CompiledScheme(scheme)
+
+
+CATASTROPHIC = json.dumps({'timeout': 0.2, 'criteria': [
+    {'criterion': 'Backtracks', 'marks': 1, 'match': {'regex': '(a+)+$'}},
+    {'criterion': 'Declares x', 'marks': 1, 'match': {'regex': r'int\s+x'}},
+]})
+
+
+def test_regex_time_limit_is_enforced_and_timed_out_grades_are_not_cached():
+    compiled = CompiledScheme(CATASTROPHIC)
+    slow = NormalizedSubmission('class A { int x; String s = "' + 'a' * 40 + 'b"; }\n')
+    quick = NormalizedSubmission('class B { int x; }\n')
+
+    rows = grade(CATASTROPHIC, slow.original)
+    assert rows["Backtracks"].comments == TIMED_OUT_COMMENT
+    assert rows["Declares x"].status == STATUS_FOUND
+    assert load_grades(result_key(compiled.new_rows(), slow, None, compiled.matcher.rules)) is None
+
+    # A timeout doesn't stick to the scheme: the next submission is searched normally
+    rows = grade(CATASTROPHIC, quick.original)
+    assert rows["Backtracks"].comments != TIMED_OUT_COMMENT
+    assert load_grades(result_key(compiled.new_rows(), quick, None, compiled.matcher.rules)) is not None
@@ -0,0 +1,62 @@
+import codecs
+import zipfile
+
+import pytest
+
+from grading_engine import NormalizedSubmission
+from submission_reader import (FILE_MARKER, FILE_SEPARATOR, decode_source, read_submission, submission_name,
+                               submission_names)
+
+
+def test_decoding():
+    assert decode_source("int é;\r\n".encode('utf-8')) == ("int é;\n", 'utf-8')
+    assert decode_source("int é;".encode('cp1252')) == ("int é;", 'cp1252')
+    assert decode_source(codecs.BOM_UTF16_LE + "int x;".encode('utf-16-le'))[0] == "int x;"
+
+
+def test_single_file_is_read_as_it_is(tmp_path):
+    path = tmp_path / "Main.java"
+    path.write_text("class Main {}")
+    assert read_submission(str(path)) == "class Main {}"
+
+
+def test_directory_joins_sources_in_name_order(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "B.java").write_text("class B {}")
+    (tmp_path / "A.java").write_text("class A {}\n")
+    (tmp_path / ".hidden.java").write_text("class Hidden {}")
+    (tmp_path / "notes.txt").write_text("not code")
+    assert read_submission(str(tmp_path)) == (
+        FILE_MARKER.format(name="A.java") + "\nclass A {}\n" + FILE_MARKER.format(name="src/B.java") + "\nclass B {}\n")
+
+
+def test_archive_matches_are_attributed_to_their_file(tmp_path):
+    path = tmp_path / "alice.zip"
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr("A.java", "class A { int x; }")
+        archive.writestr("__MACOSX/._A.java", "junk")
+        archive.writestr("B.java", "class B { int y; }")
+    submission = NormalizedSubmission(read_submission(str(path)))
+    start = submission.symbols.index("y")
+    assert submission.files_for([(start, start + 1)]) == ["B.java"]
+
+
+def test_students_cannot_fake_a_file_marker(tmp_path):
+    path = tmp_path / "Main.java"
+    path.write_text(FILE_MARKER.format(name="Fake.java") + "\nclass Main {}")
+    text = read_submission(str(path))
+    assert FILE_SEPARATOR not in text
+    assert NormalizedSubmission(text).file_starts == []
+
+
+def test_empty_project_is_an_error(tmp_path):
+    with pytest.raises(ValueError, match="no Java source files"):
+        read_submission(str(tmp_path))
+
+
+def test_student_names_are_unique(tmp_path):
+    (tmp_path / "alice").mkdir()
+    paths = [str(tmp_path / name) for name in ("alice", "alice.java", "alice.zip", "bob.java")]
+    assert submission_name(paths[1]) == "alice"
+    assert submission_names(paths) == ["alice/", "alice.java", "alice.zip", "bob"]
+    assert submission_names(["a/x.java", "b/x.java", "c/x.zip"]) == ["x.java", "x.java (2)", "x.zip"]